@@ -8,6 +8,24 @@ datas = [
     (os.path.join(base_path, 'app.py'), '.'),
     (os.path.join(base_path, 'auth_simple.py'), '.'),
     (os.path.join(base_path, 'Extracao.py'), '.'),
+    (os.path.join(base_path, 'etl_ke5z.py'), '.'),
+    (os.path.join(base_path, 'etl_cache.py'), '.'),
+    (os.path.join(base_path, 'numeros_br.py'), '.'),
+    (os.path.join(base_path, 'etl_enriquecimento.py'), '.'),
+    (os.path.join(base_path, 'etl_arrow.py'), '.'),
+    (os.path.join(base_path, 'cache_referencias.py'), '.'),
+    (os.path.join(base_path, 'dataset_ke5z.py'), '.'),
+    (os.path.join(base_path, 'exportacao_usi.py'), '.'),
+    (os.path.join(base_path, 'pipeline_ke5z.py'), '.'),
+    (os.path.join(base_path, 'armazem_ke5z.py'), '.'),
+    (os.path.join(base_path, 'cubo_ke5z.py'), '.'),
+    (os.path.join(base_path, 'filtros_ke5z.py'), '.'),
+    (os.path.join(base_path, 'calculos_ke5z.py'), '.'),
+    (os.path.join(base_path, 'tabela_ke5z.py'), '.'),
+    (os.path.join(base_path, 'formatacao_ke5z.py'), '.'),
+    (os.path.join(base_path, 'downloads_ke5z.py'), '.'),
+    (os.path.join(base_path, 'exportacoes_ke5z.py'), '.'),
+    (os.path.join(base_path, 'waterfall_ke5z.py'), '.'),
     (os.path.join(base_path, 'pages'), 'pages'),
     (os.path.join(base_path, 'KE5Z'), 'KE5Z'),
     (os.path.join(base_path, 'Extracoes'), 'Extracoes'),
@@ -19,7 +37,7 @@ datas = [
     (os.path.join(base_path, 'Fornecedores.xlsx'), '.')
 ]
 binaries = []
-hiddenimports = ['altair', 'auth_simple', 'Extracao', 'base64', 'datetime.datetime', 'gc', 'io.BytesIO', 'os', 'pandas', 'plotly.graph_objects', 'plotly', 'streamlit', 'sys']
+hiddenimports = ['altair', 'auth_simple', 'Extracao', 'etl_ke5z', 'etl_cache', 'numeros_br', 'etl_enriquecimento', 'etl_arrow', 'cache_referencias', 'dataset_ke5z', 'exportacao_usi', 'pipeline_ke5z', 'armazem_ke5z', 'cubo_ke5z', 'filtros_ke5z', 'calculos_ke5z', 'tabela_ke5z', 'formatacao_ke5z', 'downloads_ke5z', 'exportacoes_ke5z', 'waterfall_ke5z', 'xlsxwriter', 'pyarrow.compute', 'pyarrow.dataset', 'pyarrow.fs', 'pyarrow.parquet', 'base64', 'datetime.datetime', 'gc', 'io.BytesIO', 'os', 'pandas', 'plotly.graph_objects', 'plotly', 'streamlit', 'sys']
 datas += copy_metadata('streamlit')
 datas += copy_metadata('streamlit-desktop-app')
 datas += copy_metadata('plotly')
@@ -9,6 +9,14 @@ from auth_simple import (verificar_autenticacao, exibir_header_usuario,
                          eh_administrador, verificar_status_aprovado,
                          get_usuarios_cloud, adicionar_usuario_simples, criar_hash_senha,
                          get_modo_operacao, is_modo_cloud)
+from dataset_ke5z import existe_parquet_ke5z
+from armazem_ke5z import carregar_dados, limpar_armazem, versao_visao
+from filtros_ke5z import CascataFiltros
+from tabela_ke5z import exibir_tabela_paginada
+from formatacao_ke5z import exibir_tabela_valores
+from downloads_ke5z import oferecer_download
+from calculos_ke5z import (GRAFO, pivo_types_periodo, pivo_usi_periodo, soma_por_coluna,
+                           soma_por_periodo)
 from datetime import datetime
 
 # Detectar se está rodando no executável PyInstaller
@@ -63,90 +71,17 @@ if modo_atual == 'cloud':
 else:
     st.sidebar.info("💻 **Modo Completo**")
 
-# Sistema de cache inteligente para otimização de memória e conexão
-@st.cache_data(
-    ttl=3600,
-    max_entries=3,  # Aumentar para cachear os 3 arquivos
-    show_spinner=True,
-    persist="disk"
-)
+# Dados compartilhados por todas as sessões e páginas (armazem_ke5z): lidos uma vez por processo
 def load_data_optimized(arquivo_tipo="completo"):
-    """Carrega dados com otimização inteligente de memória
+    """Carrega dados do armazém compartilhado (tipos já otimizados na carga)
     
     Args:
-        arquivo_tipo: "completo", "main" (sem Others), ou "others"
+        arquivo_tipo: "completo", "main" (sem Others), "others" ou "main_filtered"
     """
-    
-    # Definir qual arquivo carregar
-    arquivos_disponiveis = {
-        "completo": "KE5Z.parquet",
-        "main": "KE5Z_main.parquet", 
-        "others": "KE5Z_others.parquet",
-        "main_filtered": "KE5Z.parquet"  # Usa arquivo completo mas filtra Others
-    }
-    
-    nome_arquivo = arquivos_disponiveis.get(arquivo_tipo, "KE5Z.parquet")
-    base_path = get_base_path()
-    arquivo_parquet = os.path.join(base_path, "KE5Z", nome_arquivo)
-    
-    try:
-        if not os.path.exists(arquivo_parquet):
-            # Se arquivo específico não existe, tentar arquivo completo
-            if arquivo_tipo != "completo":
-                st.warning(f"⚠️ Arquivo {nome_arquivo} não encontrado, carregando dados completos...")
-                # CORREÇÃO: Evitar loop infinito - carregar diretamente o arquivo completo
-                arquivo_completo = os.path.join(base_path, "KE5Z", "KE5Z.parquet")
-                if os.path.exists(arquivo_completo):
-                    df = pd.read_parquet(arquivo_completo)
-                    # Aplicar filtro especial para main_filtered (cloud mode)
-                    if arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-                        df = df[df['USI'] != 'Others'].copy()
-                        st.sidebar.info(f"🔄 Filtro aplicado: {len(df):,} registros (Others removidos)")
-                    return df
-                else:
-                    raise FileNotFoundError(f"Arquivo completo também não encontrado: {arquivo_completo}")
-            raise FileNotFoundError(f"Arquivo não encontrado: {arquivo_parquet}")
-        
-        # Verificar tamanho do arquivo
-        file_size_mb = os.path.getsize(arquivo_parquet) / (1024 * 1024)
-        
-        # Carregar dados
-        df = pd.read_parquet(arquivo_parquet)
-        
-        # Aplicar filtro especial para main_filtered (cloud mode)
-        if arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-            # Filtrar para remover Others, simulando arquivo main
-            df = df[df['USI'] != 'Others'].copy()
-            st.sidebar.info(f"🔄 Filtro aplicado: {len(df):,} registros (Others removidos)")
-        
-        # Otimizar tipos de dados para economizar memória (sem alterar conteúdo)
-        original_memory = df.memory_usage(deep=True).sum() / (1024 * 1024)
-        
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                unique_ratio = df[col].nunique() / len(df)
-                if unique_ratio < 0.5:  # Menos de 50% valores únicos
-                    df[col] = df[col].astype('category')
-        
-        # Converter floats para tipos menores
-        for col in df.select_dtypes(include=['float64']).columns:
-            df[col] = pd.to_numeric(df[col], downcast='float')
-        
-        # Converter ints para tipos menores
-        for col in df.select_dtypes(include=['int64']).columns:
-            df[col] = pd.to_numeric(df[col], downcast='integer')
-        
-        # Calcular economia de memória
-        optimized_memory = df.memory_usage(deep=True).sum() / (1024 * 1024)
-        saved_memory = original_memory - optimized_memory
-        
-        if saved_memory > 1:  # Economia significativa
-            st.sidebar.success(f"💾 Memória economizada: {saved_memory:.1f}MB")
-        
-        return df
-        
-    except Exception as e:
-        raise e
+    df = carregar_dados(arquivo_tipo, os.path.join(get_base_path(), "KE5Z"))
+    if arquivo_tipo == "main_filtered":
+        st.sidebar.info(f"🔄 Filtro aplicado: {len(df):,} registros (Others removidos)")
+    return df
 
 # Interface para seleção de dados (COMPACTO)
 st.sidebar.markdown("---")
@@ -157,7 +92,7 @@ base_path = get_base_path()
 arquivos_status = {}
 for tipo, nome in [("completo", "KE5Z.parquet"), ("main", "KE5Z_main.parquet"), ("others", "KE5Z_others.parquet")]:
     caminho = os.path.join(base_path, "KE5Z", nome)
-    arquivos_status[tipo] = os.path.exists(caminho)
+    arquivos_status[tipo] = existe_parquet_ke5z(caminho)
 
 # Opções disponíveis baseadas nos arquivos existentes
 opcoes_dados = []
@@ -283,46 +218,35 @@ st.markdown("---")
 st.sidebar.markdown("---")
 st.sidebar.markdown("**🔍 Filtros**")
 
-# Cache para opções de filtros (otimização de performance)
-@st.cache_data(ttl=1800, max_entries=3)
-def get_filter_options(df, column_name):
-    """Obtém opções de filtro com cache para melhor performance"""
-    if column_name in df.columns:
-        return ["Todos"] + sorted(df[column_name].dropna().astype(str).unique().tolist())
-    return ["Todos"]
+# Filtros em cascata (filtros_ke5z): uma máscara única, DataFrame montado uma vez no final;
+# opções no cache do processo pela versão dos dados + filtros ativos
+versao_total = (versao_visao("dados", opcao_selecionada, os.path.join(get_base_path(), "KE5Z")), "USI não nula")
+cascata = CascataFiltros(df_total, versao_total)
 
-# Filtro 1: USINA (com cache otimizado)
-usina_opcoes = get_filter_options(df_total, 'USI')
+# Filtro 1: USINA
+usina_opcoes = cascata.opcoes('USI')
 default_usina = ["Veículos"] if "Veículos" in usina_opcoes else ["Todos"]
 usina_selecionada = st.sidebar.multiselect("Selecione a USINA:", usina_opcoes, default=default_usina)
+cascata.selecionar('USI', usina_selecionada)
 
-# Filtrar o DataFrame com base na USI
-if "Todos" in usina_selecionada or not usina_selecionada:
-    df_filtrado = df_total.copy()
-else:
-    df_filtrado = df_total[df_total['USI'].astype(str).isin(usina_selecionada)]
-
-# Filtro 2: Período (com cache otimizado)
-periodo_opcoes = get_filter_options(df_filtrado, 'Período')
+# Filtro 2: Período
+periodo_opcoes = cascata.opcoes('Período')
 periodo_selecionado = st.sidebar.selectbox("Selecione o Período:", periodo_opcoes)
-if periodo_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['Período'].astype(str) == str(periodo_selecionado)]
+cascata.selecionar('Período', periodo_selecionado)
 
-# Filtro 3: Centro cst (com cache otimizado)
-if 'Centro cst' in df_filtrado.columns:
-    centro_cst_opcoes = get_filter_options(df_filtrado, 'Centro cst')
+# Filtro 3: Centro cst
+if cascata.tem_coluna('Centro cst'):
+    centro_cst_opcoes = cascata.opcoes('Centro cst')
     centro_cst_selecionado = st.sidebar.selectbox("Selecione o Centro cst:", centro_cst_opcoes)
-    if centro_cst_selecionado != "Todos":
-        df_filtrado = df_filtrado[df_filtrado['Centro cst'].astype(str) == str(centro_cst_selecionado)]
+    cascata.selecionar('Centro cst', centro_cst_selecionado)
 
-# Filtro 4: Conta contábil (com cache otimizado)
-if 'Nº conta' in df_filtrado.columns:
-    conta_contabil_opcoes = get_filter_options(df_filtrado, 'Nº conta')[1:]  # Remove "Todos" para multiselect
+# Filtro 4: Conta contábil
+if cascata.tem_coluna('Nº conta'):
+    conta_contabil_opcoes = cascata.opcoes('Nº conta', incluir_todos=False)
     conta_contabil_selecionadas = st.sidebar.multiselect("Selecione a Conta contábil:", conta_contabil_opcoes)
-    if conta_contabil_selecionadas:
-        df_filtrado = df_filtrado[df_filtrado['Nº conta'].astype(str).isin(conta_contabil_selecionadas)]
+    cascata.selecionar('Nº conta', conta_contabil_selecionadas)
 
-# Filtros principais (com cache otimizado)
+# Filtros principais
 filtros_principais = [
     ("Type 05", "Type 05", "multiselect"),
     ("Type 06", "Type 06", "multiselect"), 
@@ -333,12 +257,11 @@ filtros_principais = [
 ]
 
 for col_name, label, widget_type in filtros_principais:
-    if col_name in df_filtrado.columns:
-        opcoes = get_filter_options(df_filtrado, col_name)
+    if cascata.tem_coluna(col_name):
+        opcoes = cascata.opcoes(col_name)
         if widget_type == "multiselect":
             selecionadas = st.sidebar.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-            if selecionadas and "Todos" not in selecionadas:
-                df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+            cascata.selecionar(col_name, selecionadas)
 
 # Filtros avançados (expansível)
 with st.sidebar.expander("🔍 Filtros Avançados"):
@@ -350,8 +273,8 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
     ]
     
     for col_name, label, widget_type in filtros_avancados:
-        if col_name in df_filtrado.columns:
-            opcoes = get_filter_options(df_filtrado, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             # Limitar opções para melhor performance
             if len(opcoes) > 101:  # 100 + "Todos"
                 opcoes = opcoes[:101]
@@ -359,8 +282,11 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
             
             if widget_type == "multiselect":
                 selecionadas = st.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-                if selecionadas and "Todos" not in selecionadas:
-                    df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+                cascata.selecionar(col_name, selecionadas)
+
+df_filtrado = cascata.resultado()
+# Impressão digital do df_filtrado: chave dos gráficos e pivôs (calculos_ke5z)
+versao_filtrado = cascata.versao_resultado()
 
 # Resumo (COMPACTO)
 st.sidebar.markdown("---")
@@ -380,6 +306,7 @@ if not is_cloud:  # Só mostrar em modo local para economizar espaço
         
         if st.sidebar.button("🧹 Cache", help="Limpar cache"):
             st.cache_data.clear()
+            limpar_armazem()
             import gc
             gc.collect()
             st.sidebar.success("✅ Limpo!")
@@ -408,11 +335,10 @@ if eh_administrador():
             st.sidebar.write(f"{tipo_icon} {status_icon} {usuario}")
 
 # Gráfico de barras para a soma dos valores por 'Período'
-@st.cache_data(ttl=900, max_entries=2)
 def create_period_chart(df_data):
-    """Cria gráfico otimizado"""
+    """Cria gráfico otimizado (agregação memoizada no GRAFO)"""
     try:
-        chart_data = df_data.groupby('Período')['Valor'].sum().reset_index()
+        chart_data = GRAFO.no("soma_por_periodo", versao_filtrado, lambda: soma_por_periodo(df_data))
         
         grafico_barras = alt.Chart(chart_data).mark_bar().encode(
             x=alt.X('Período:N', title='Período'),
@@ -451,11 +377,9 @@ st.subheader("📊 Análise por Categorias")
 
 # Gráfico por Type 05
 if 'Type 05' in df_filtrado.columns:
-    @st.cache_data(ttl=900, max_entries=2)
     def create_type05_chart(df_data):
         try:
-            type05_data = df_data.groupby('Type 05')['Valor'].sum().reset_index()
-            type05_data = type05_data.sort_values('Valor', ascending=False)
+            type05_data = GRAFO.no("soma_type05", versao_filtrado, lambda: soma_por_coluna(df_data, 'Type 05'))
             
             chart = alt.Chart(type05_data).mark_bar().encode(
                 x=alt.X('Type 05:N', title='Type 05', sort='-y'),
@@ -478,11 +402,9 @@ if 'Type 05' in df_filtrado.columns:
 
 # Gráfico por Type 06
 if 'Type 06' in df_filtrado.columns:
-    @st.cache_data(ttl=900, max_entries=2)
     def create_type06_chart(df_data):
         try:
-            type06_data = df_data.groupby('Type 06')['Valor'].sum().reset_index()
-            type06_data = type06_data.sort_values('Valor', ascending=False)
+            type06_data = GRAFO.no("soma_type06", versao_filtrado, lambda: soma_por_coluna(df_data, 'Type 06'))
             
             chart = alt.Chart(type06_data).mark_bar().encode(
                 x=alt.X('Type 06:N', title='Type 06', sort='-y'),
@@ -509,20 +431,22 @@ if 'Type 07' in df_filtrado.columns:
     
     # Filtros específicos para o gráfico Type 07
     col_filtro1, col_filtro2, col_filtro3, col_filtro4 = st.columns(4)
+    # Opções independentes (todas sobre df_filtrado), aplicadas juntas depois
+    cascata_grafico = CascataFiltros(df_filtrado, cascata.versao_resultado())
+    type05_opcoes_grafico = cascata_grafico.opcoes('Type 05')
+    type06_opcoes_grafico = cascata_grafico.opcoes('Type 06')
+    periodo_opcoes_grafico = cascata_grafico.opcoes('Período')
     
     with col_filtro1:
         # Filtro Type 05 para o gráfico
-        type05_opcoes_grafico = get_filter_options(df_filtrado, 'Type 05')
         type05_grafico = st.selectbox("Type 05 (Gráfico):", type05_opcoes_grafico, key="type05_grafico")
     
     with col_filtro2:
         # Filtro Type 06 para o gráfico
-        type06_opcoes_grafico = get_filter_options(df_filtrado, 'Type 06')
         type06_grafico = st.selectbox("Type 06 (Gráfico):", type06_opcoes_grafico, key="type06_grafico")
     
     with col_filtro3:
         # Filtro Período para o gráfico
-        periodo_opcoes_grafico = get_filter_options(df_filtrado, 'Período')
         periodo_grafico = st.selectbox("Período (Gráfico):", periodo_opcoes_grafico, key="periodo_grafico")
     
     with col_filtro4:
@@ -531,26 +455,20 @@ if 'Type 07' in df_filtrado.columns:
         quantidade_grafico = st.selectbox("Top N:", quantidade_opcoes, index=0, key="quantidade_grafico")
     
     # Aplicar filtros específicos para o gráfico
-    df_grafico = df_filtrado.copy()
-    
-    if type05_grafico != "Todos":
-        df_grafico = df_grafico[df_grafico['Type 05'].astype(str) == str(type05_grafico)]
-    
-    if type06_grafico != "Todos":
-        df_grafico = df_grafico[df_grafico['Type 06'].astype(str) == str(type06_grafico)]
-    
-    if periodo_grafico != "Todos":
-        df_grafico = df_grafico[df_grafico['Período'].astype(str) == str(periodo_grafico)]
+    cascata_grafico.selecionar('Type 05', type05_grafico)
+    cascata_grafico.selecionar('Type 06', type06_grafico)
+    cascata_grafico.selecionar('Período', periodo_grafico)
+    df_grafico = cascata_grafico.resultado()
+    versao_grafico = cascata_grafico.versao_resultado()
     
     # Mostrar estatísticas dos filtros aplicados
     st.caption(f"📊 Dados filtrados: {len(df_grafico):,} registros | Total: R$ {df_grafico['Valor'].sum():,.2f}")
     
-    # Criar gráfico Type 07 com os dados filtrados
-    @st.cache_data(ttl=900, max_entries=2)
+    # Criar gráfico Type 07 com os dados filtrados (Top N não refaz a agregação)
     def create_type07_chart(df_data, quantidade):
         try:
-            type07_data = df_data.groupby('Type 07')['Valor'].sum().reset_index()
-            type07_data = type07_data.sort_values('Valor', ascending=False).head(quantidade)
+            type07_data = GRAFO.no("soma_type07", versao_grafico, lambda: soma_por_coluna(df_data, 'Type 07'))
+            type07_data = type07_data.head(quantidade)
             
             chart = alt.Chart(type07_data).mark_bar().encode(
                 x=alt.X('Type 07:N', title='Type 07', sort='-y'),
@@ -575,34 +493,14 @@ if 'Type 07' in df_filtrado.columns:
         if not df_grafico.empty:
             st.subheader(f"📋 Dados do Gráfico Type 07 (Top {quantidade_grafico})")
             
-            # Criar tabela pivot com Type 05, Type 06, Type 07 e valores por Período
-            type07_detailed = df_grafico.groupby(['Type 05', 'Type 06', 'Type 07', 'Período'])['Valor'].sum().reset_index()
-            
-            # Pivotar para ter Períodos como colunas
-            type07_pivot = type07_detailed.pivot_table(
-                index=['Type 05', 'Type 06', 'Type 07'], 
-                columns='Período', 
-                values='Valor', 
-                aggfunc='sum', 
-                fill_value=0
-            ).reset_index()
-            
-            # Calcular total por linha
-            numeric_cols = type07_pivot.select_dtypes(include=['number']).columns
-            type07_pivot['Total'] = type07_pivot[numeric_cols].sum(axis=1)
-            
-            # Ordenar por total e pegar top N
-            type07_pivot = type07_pivot.sort_values('Total', ascending=False).head(quantidade_grafico)
-            
-            # Formatar valores monetários
-            for col in numeric_cols:
-                type07_pivot[col] = type07_pivot[col].apply(lambda x: f"R$ {x:,.2f}" if x != 0 else "R$ 0,00")
-            type07_pivot['Total'] = type07_pivot['Total'].apply(lambda x: f"R$ {x:,.2f}")
+            # Tabela pivot com Type 05, Type 06, Type 07, valores por Período e Total (já ordenada)
+            type07_pivot = GRAFO.no("pivo_types_periodo", versao_grafico, lambda: pivo_types_periodo(df_grafico))
             
-            st.dataframe(type07_pivot, use_container_width=True, hide_index=True)
+            # Pegar top N (valores continuam numéricos; moeda pelo column_config)
+            exibir_tabela_valores(type07_pivot.head(quantidade_grafico), use_container_width=True, hide_index=True)
 
 # Tabela dinâmica com cores (modificada para mostrar apenas valores diferentes de zero)
-df_pivot = df_filtrado.pivot_table(index='USI', columns='Período', values='Valor', aggfunc='sum', margins=True, margins_name='Total', fill_value=0)
+df_pivot = GRAFO.no("pivo_usi_periodo", versao_filtrado, lambda: pivo_usi_periodo(df_filtrado))
 st.subheader("Tabela Dinâmica - Soma do Valor por USI e Período (Apenas Valores ≠ 0)")
 
 # Filtrar para mostrar apenas linhas e colunas com valores diferentes de zero
@@ -613,16 +511,7 @@ df_pivot_filtered = df_pivot.loc[(df_pivot != 0).any(axis=1)]
 df_pivot_filtered = df_pivot_filtered.loc[:, (df_pivot_filtered != 0).any(axis=0)]
 
 # Aplicar formatação com cores (verde para positivo, vermelho para negativo)
-def colorir_valores(val):
-    if isinstance(val, (int, float)):
-        if val < 0:
-            return 'color: #e74c3c; font-weight: bold;'  # Vermelho para negativo
-        elif val > 0:
-            return 'color: #27ae60; font-weight: bold;'  # Verde para positivo
-    return ''
-
-styled_pivot = df_pivot_filtered.style.format('R$ {:,.2f}').map(colorir_valores, subset=pd.IndexSlice[:, :])
-st.dataframe(styled_pivot, use_container_width=True)
+exibir_tabela_valores(df_pivot_filtered, colorir=True, use_container_width=True)
 
 # Mostrar estatísticas da filtragem
 linhas_originais = len(df_pivot)
@@ -635,113 +524,48 @@ st.caption(f"📊 Filtragem aplicada: {linhas_originais} → {linhas_filtradas}
 # Botão de download da Tabela Dinâmica (logo abaixo da tabela)
 if st.button("📥 Baixar Tabela Dinâmica (Excel)", use_container_width=True, key="download_pivot"):
     with st.spinner("Gerando arquivo da tabela dinâmica..."):
-        # Função para exportar para Excel
-        def exportar_excel_pivot(df, nome_arquivo):
-            from io import BytesIO
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=True, sheet_name='Tabela_Dinamica')
-            output.seek(0)
-            return output.getvalue()
-        
-        excel_data_pivot = exportar_excel_pivot(df_pivot_filtered, 'KE5Z_tabela_dinamica_filtrada.xlsx')
-        
-        # Forçar download usando JavaScript
-        import base64
-        b64 = base64.b64encode(excel_data_pivot).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="KE5Z_tabela_dinamica_filtrada.xlsx">💾 Clique aqui para baixar a Tabela Dinâmica Filtrada</a>'
-        st.markdown(href, unsafe_allow_html=True)
-        st.success("✅ Tabela Dinâmica gerada! Clique no link acima para baixar.")
-
-# Exibir o DataFrame filtrado (limitado para performance)
-st.subheader("Tabela Filtrada")
-display_limit = 500 if is_cloud else 2000
-if len(df_filtrado) > display_limit:
-    st.info(f"📊 Mostrando {display_limit:,} de {len(df_filtrado):,} registros para otimizar performance")
-    df_display = df_filtrado.head(display_limit)
-else:
-    df_display = df_filtrado
+        if oferecer_download(df_pivot_filtered, 'KE5Z_tabela_dinamica_filtrada.xlsx',
+                             "💾 Clique aqui para baixar a Tabela Dinâmica Filtrada", "arquivo_pivot",
+                             nome_aba='Tabela_Dinamica', indice=True):
+            st.success("✅ Tabela Dinâmica gerada! Clique no botão acima para baixar.")
 
-st.dataframe(df_display, use_container_width=True)
+# Exibir o DataFrame filtrado (paginado: só a página atual vai para o navegador)
+st.subheader("Tabela Filtrada")
+exibir_tabela_paginada(df_filtrado, versao_filtrado, "tabela_filtrada", tamanho_padrao=50 if is_cloud else 100)
 
 # Botão de download da Tabela Filtrada (logo abaixo da tabela)
 if st.button("📥 Baixar Tabela Filtrada (Excel)", use_container_width=True, key="download_filtered"):
     with st.spinner("Gerando arquivo da tabela filtrada..."):
-        # Função para exportar tabela filtrada
-        def exportar_excel_filtrada(df, nome_arquivo):
-            from io import BytesIO
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Dados_Filtrados')
-            output.seek(0)
-            return output.getvalue()
-        
-        excel_data_filtrada = exportar_excel_filtrada(df_filtrado, 'KE5Z_tabela_filtrada.xlsx')
-        
-        # Forçar download usando JavaScript
-        import base64
-        b64 = base64.b64encode(excel_data_filtrada).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="KE5Z_tabela_filtrada.xlsx">💾 Clique aqui para baixar a Tabela Filtrada</a>'
-        st.markdown(href, unsafe_allow_html=True)
-        st.success("✅ Tabela Filtrada gerada! Clique no link acima para baixar.")
+        if oferecer_download(df_filtrado, 'KE5Z_tabela_filtrada.xlsx',
+                             "💾 Clique aqui para baixar a Tabela Filtrada", "arquivo_filtrada",
+                             nome_aba='Dados_Filtrados'):
+            st.success("✅ Tabela Filtrada gerada! Clique no botão acima para baixar.")
 
 # Tabela de soma por Types separada por Período (apenas valores ≠ 0)
 if all(col in df_filtrado.columns for col in ['Type 05', 'Type 06', 'Type 07', 'Período']):
     st.markdown("---")
     st.subheader("📊 Soma dos Valores por Type 05, Type 06 e Type 07 (Separado por Período)")
     
-    # Criar tabela pivot com Type 05, Type 06, Type 07 e valores por Período
-    soma_por_type_periodo = df_filtrado.groupby(['Type 05', 'Type 06', 'Type 07', 'Período'])['Valor'].sum().reset_index()
-    
-    # Pivotar para ter Períodos como colunas
-    tabela_pivot = soma_por_type_periodo.pivot_table(
-        index=['Type 05', 'Type 06', 'Type 07'], 
-        columns='Período', 
-        values='Valor', 
-        aggfunc='sum', 
-        fill_value=0
-    ).reset_index()
-    
-    # Calcular total por linha
-    numeric_cols = tabela_pivot.select_dtypes(include=['number']).columns
+    # Tabela pivot com Type 05, Type 06, Type 07, valores por Período e Total (já ordenada)
+    tabela_pivot = GRAFO.no("pivo_types_periodo", versao_filtrado, lambda: pivo_types_periodo(df_filtrado))
+    numeric_cols = tabela_pivot.select_dtypes(include=['number']).columns.drop('Total')
     if len(numeric_cols) > 0:
-        tabela_pivot['Total'] = tabela_pivot[numeric_cols].sum(axis=1)
-        
         # Filtrar apenas linhas com valores diferentes de zero
         tabela_pivot = tabela_pivot[(tabela_pivot[numeric_cols] != 0).any(axis=1)]
         
-        # Ordenar por total (decrescente)
-        tabela_pivot = tabela_pivot.sort_values('Total', ascending=False)
-        
-        # Formatar valores monetários
-        for col in numeric_cols:
-            tabela_pivot[col] = tabela_pivot[col].apply(lambda x: f"R$ {x:,.2f}" if x != 0 else "R$ 0,00")
-        tabela_pivot['Total'] = tabela_pivot['Total'].apply(lambda x: f"R$ {x:,.2f}")
-        
-        st.dataframe(tabela_pivot, use_container_width=True, hide_index=True)
+        # Valores continuam numéricos; moeda pelo column_config
+        exibir_tabela_valores(tabela_pivot, use_container_width=True, hide_index=True)
     else:
         st.info("Nenhum período encontrado nos dados filtrados.")
     
     # Botão de download da Tabela de Soma por Types (logo abaixo da tabela)
     if st.button("📥 Baixar Soma por Types (Excel)", use_container_width=True, key="download_types"):
         with st.spinner("Gerando arquivo da soma por types..."):
-            # Função para exportar soma por types
-            def exportar_excel_types(df, nome_arquivo):
-                from io import BytesIO
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df.to_excel(writer, index=False, sheet_name='Soma_por_Types')
-                output.seek(0)
-                return output.getvalue()
-            
-            excel_data_types = exportar_excel_types(soma_por_type_completa, 'KE5Z_soma_por_types.xlsx')
-            
-            # Forçar download usando JavaScript
-            import base64
-            b64 = base64.b64encode(excel_data_types).decode()
-            href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="KE5Z_soma_por_types.xlsx">💾 Clique aqui para baixar a Soma por Types</a>'
-            st.markdown(href, unsafe_allow_html=True)
-            st.success("✅ Soma por Types gerada! Clique no link acima para baixar.")
+            # Mesma tabela exibida acima (valores numéricos)
+            if oferecer_download(tabela_pivot, 'KE5Z_soma_por_types.xlsx',
+                                 "💾 Clique aqui para baixar a Soma por Types", "arquivo_types",
+                                 nome_aba='Soma_por_Types'):
+                st.success("✅ Soma por Types gerada! Clique no botão acima para baixar.")
 
 # Footer
 st.markdown("---")
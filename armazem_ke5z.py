@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Armazém de dados KE5Z compartilhado pelo processo do Streamlit
+Cada visão é lida uma única vez do dataset (Arrow, tipos já otimizados) e servida a todas as páginas e
+sessões como visão rasa (sem copiar colunas). As entradas caem sozinhas quando a
+extração grava novos dados (mudança no _esquema.json ou nos parquets antigos).
+
+As páginas só filtram o que recebem; nunca devem alterar colunas no lugar.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from calculos_ke5z import limpar_calculos
+from dataset_ke5z import GRUPO_POR_VISAO, assinatura_dados, ler_cubo, ler_visao
+from filtros_ke5z import limpar_opcoes
+
+# Visões oferecidas pelas páginas (arquivo_tipo) e filtro de USI de cada uma
+TIPOS_DADOS = ("completo", "main", "others", "main_filtered")
+
+
+def pasta_ke5z_padrao() -> str:
+    """Pasta KE5Z de leitura: _internal no executável, pasta do projeto em desenvolvimento"""
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, "KE5Z")
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "KE5Z")
+
+
+def filtrar_tipo(df: pd.DataFrame, arquivo_tipo: str) -> pd.DataFrame:
+    """Recorte por USI da visão pedida (main/main_filtered sem Others, others só Others)"""
+    if 'USI' not in df.columns or arquivo_tipo == "completo":
+        return df
+    if arquivo_tipo in ("main", "main_filtered"):
+        return df[df['USI'] != 'Others']
+    if arquivo_tipo == "others":
+        return df[df['USI'] == 'Others']
+    raise ValueError(f"Tipo de dados desconhecido: {arquivo_tipo}")
+
+
+class _Entrada:
+    """DataFrame carregado e dados para o resumo"""
+
+    def __init__(self, df: pd.DataFrame, segundos: float):
+        self.df = df
+        self.segundos = segundos
+        self.memoria_mb = float(df.memory_usage(deep=True).sum()) / (1024 * 1024)
+        self.acessos = 0
+
+
+class ArmazemKE5Z:
+    """Cache em memória por (pasta, visão, tipo[, períodos]), único no processo.
+
+    Duas sessões pedindo a mesma visão ao mesmo tempo esperam uma única leitura.
+    As visões inteiras são poucas (visão x tipo) e ficam; as recortadas por períodos
+    variam com cada seleção de meses e ficam num LRU de max_por_periodos entradas.
+    """
+
+    def __init__(self, max_por_periodos: int = 8):
+        self._trava = threading.Lock()
+        self._travas_carga: Dict[tuple, threading.Lock] = {}
+        self._entradas: "OrderedDict[tuple, _Entrada]" = OrderedDict()
+        self._assinaturas: Dict[str, tuple] = {}
+        self._max_por_periodos = max_por_periodos
+
+    def _validar_pasta(self, pasta: str):
+        """Descarta as entradas da pasta se os dados mudaram desde a carga"""
+        assinatura = assinatura_dados(pasta)
+        with self._trava:
+            if self._assinaturas.get(pasta) != assinatura:
+                for chave in [c for c in self._entradas if c[0] == pasta]:
+                    del self._entradas[chave]
+                    self._travas_carga.pop(chave, None)
+                self._assinaturas[pasta] = assinatura
+
+    def _obter(self, chave: tuple, carregar: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+            else:
+                trava_carga = self._travas_carga.setdefault(chave, threading.Lock())
+        if entrada is None:
+            with trava_carga:
+                with self._trava:
+                    entrada = self._entradas.get(chave)
+                if entrada is None:
+                    inicio = time.perf_counter()
+                    df = carregar()
+                    entrada = _Entrada(df, time.perf_counter() - inicio)
+                    with self._trava:
+                        self._entradas[chave] = entrada
+                        self._descartar_periodos_antigos()
+        entrada.acessos += 1
+        # Visão rasa: cada chamador pode renomear/reordenar sem afetar os outros
+        return entrada.df.copy(deep=False)
+
+    def _descartar_periodos_antigos(self):
+        """LRU das visões por períodos (chamado com self._trava): sai a usada há mais tempo"""
+        por_periodos = [c for c in self._entradas if len(c) > 3]
+        for chave in por_periodos[:max(0, len(por_periodos) - self._max_por_periodos)]:
+            del self._entradas[chave]
+            self._travas_carga.pop(chave, None)
+
+    def dados(self, arquivo_tipo: str = "completo", pasta: Optional[str] = None) -> pd.DataFrame:
+        """Todas as colunas da visão (o que o load_data_optimized do app.py devolvia)"""
+        if arquivo_tipo not in TIPOS_DADOS:
+            raise ValueError(f"Tipo de dados desconhecido: {arquivo_tipo}")
+        pasta = os.path.abspath(pasta or pasta_ke5z_padrao())
+        self._validar_pasta(pasta)
+        return self._obter((pasta, "dados", arquivo_tipo), lambda: ler_visao(pasta, arquivo_tipo))
+
+    def waterfall(self, arquivo_tipo: str = "completo", pasta: Optional[str] = None,
+                  periodos: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """Colunas do waterfall (Dash Mês, IUD, Total accounts, Waterfall) recortadas por tipo.
+
+        O waterfall completo é lido uma vez; main/others são filtros dele e
+        compartilham as mesmas categorias. Com `periodos`, só as partições desses
+        meses são lidas (grupo e Período filtrados pelo pyarrow).
+        """
+        if arquivo_tipo not in TIPOS_DADOS:
+            raise ValueError(f"Tipo de dados desconhecido: {arquivo_tipo}")
+        pasta = os.path.abspath(pasta or pasta_ke5z_padrao())
+        self._validar_pasta(pasta)
+        if periodos is not None:
+            periodos = tuple(sorted(periodos))
+            return self._obter((pasta, "waterfall", arquivo_tipo, periodos),
+                               lambda: ler_visao(pasta, "waterfall", periodos=periodos,
+                                                 grupo=GRUPO_POR_VISAO.get(arquivo_tipo)))
+        carregar_base = lambda: ler_visao(pasta, "waterfall")
+        if arquivo_tipo == "completo":
+            return self._obter((pasta, "waterfall", "completo"), carregar_base)
+        return self._obter((pasta, "waterfall", arquivo_tipo),
+                           lambda: filtrar_tipo(self._obter((pasta, "waterfall", "completo"), carregar_base),
+                                                arquivo_tipo))
+
+    def cubo(self, arquivo_tipo: str = "completo", pasta: Optional[str] = None) -> pd.DataFrame:
+        """Cubo agregado (cubo_ke5z) recortado por tipo: pivôs e gráficos sem ler os lançamentos"""
+        if arquivo_tipo not in TIPOS_DADOS:
+            raise ValueError(f"Tipo de dados desconhecido: {arquivo_tipo}")
+        pasta = os.path.abspath(pasta or pasta_ke5z_padrao())
+        self._validar_pasta(pasta)
+        return self._obter((pasta, "cubo", arquivo_tipo),
+                           lambda: ler_cubo(pasta, GRUPO_POR_VISAO.get(arquivo_tipo)))
+
+    def versao(self, visao: str, arquivo_tipo: str = "completo", pasta: Optional[str] = None,
+               periodos: Optional[Iterable[int]] = None) -> tuple:
+        """Identifica a visão servida (chave + assinatura dos dados): chave de caches derivados, como as opções de filtro"""
+        pasta = os.path.abspath(pasta or pasta_ke5z_padrao())
+        periodos = tuple(sorted(periodos)) if periodos is not None else None
+        return (pasta, visao, arquivo_tipo, periodos, assinatura_dados(pasta))
+
+    def limpar(self):
+        """Esvazia o armazém (botões de limpar cache/recarregar dados)"""
+        with self._trava:
+            self._entradas.clear()
+            self._travas_carga.clear()
+            self._assinaturas.clear()
+
+    def resumo(self) -> List[Dict[str, Any]]:
+        """Uma linha por visão carregada: memória, tempo de carga e acessos"""
+        with self._trava:
+            itens = list(self._entradas.items())
+        return [{"pasta": chave[0], "visao": chave[1], "tipo": chave[2],
+                 "periodos": list(chave[3]) if len(chave) > 3 else None, "registros": int(len(e.df)),
+                 "memoria_mb": round(e.memoria_mb, 1), "segundos_carga": round(e.segundos, 2),
+                 "acessos": e.acessos}
+                for chave, e in itens]
+
+
+# Instância única do processo: o módulo é importado uma vez e vale para todas as sessões
+ARMAZEM = ArmazemKE5Z()
+
+
+def carregar_dados(arquivo_tipo: str = "completo", pasta: Optional[str] = None) -> pd.DataFrame:
+    """Atalho: ARMAZEM.dados"""
+    return ARMAZEM.dados(arquivo_tipo, pasta)
+
+
+def carregar_waterfall(arquivo_tipo: str = "completo", pasta: Optional[str] = None,
+                       periodos: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """Atalho: ARMAZEM.waterfall"""
+    return ARMAZEM.waterfall(arquivo_tipo, pasta, periodos)
+
+
+def carregar_cubo(arquivo_tipo: str = "completo", pasta: Optional[str] = None) -> pd.DataFrame:
+    """Atalho: ARMAZEM.cubo"""
+    return ARMAZEM.cubo(arquivo_tipo, pasta)
+
+
+def versao_visao(visao: str, arquivo_tipo: str = "completo", pasta: Optional[str] = None,
+                 periodos: Optional[Iterable[int]] = None) -> tuple:
+    """Atalho: ARMAZEM.versao"""
+    return ARMAZEM.versao(visao, arquivo_tipo, pasta, periodos)
+
+
+def limpar_armazem():
+    """Atalho: ARMAZEM.limpar (e as opções de filtro e tabelas derivadas dele)"""
+    ARMAZEM.limpar()
+    limpar_opcoes()
+    limpar_calculos()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Cache das planilhas de referência (Dados SAPIENS.xlsx e Fornecedores.xlsx)
+Cada aba é convertida para parquet uma única vez e reaproveitada enquanto a planilha
+não mudar (tamanho/mtime, confirmados pelo hash). Usado pelo Extracao.py e pelas páginas
+"""
+
+import os
+import json
+import datetime as dt
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from etl_cache import calcular_hash_arquivo
+
+VERSAO_CACHE_REFERENCIAS = 1
+PASTA_CACHE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_etl", "referencias")
+NOME_MANIFESTO = "manifesto_referencias.json"
+
+# Abas usadas pelo Extracao.py e parâmetros de leitura de cada uma
+ABAS_SAPIENS = {
+    'Conta contabil': {},
+    'CC': {},
+    'Hist_prov': {'skiprows': 1},
+}
+ABAS_FORNECEDORES = {
+    0: {'skiprows': 3},  # primeira aba
+}
+
+# Colunas object com tipos misturados (ex.: contas int e str) são gravadas como texto
+# + uma coluna de códigos de tipo, para voltar exatamente aos mesmos objetos Python
+PREFIXO_TIPO = "__tipo__"
+_TIPO_TEXTO, _TIPO_INT, _TIPO_FLOAT, _TIPO_BOOL, _TIPO_DATA, _TIPO_HORA = range(6)
+
+
+def _codigo_tipo(valor) -> int:
+    if isinstance(valor, str):
+        return _TIPO_TEXTO
+    if isinstance(valor, (bool, np.bool_)):
+        return _TIPO_BOOL
+    if isinstance(valor, (int, np.integer)):
+        return _TIPO_INT
+    if isinstance(valor, (float, np.floating)):
+        return _TIPO_FLOAT
+    if isinstance(valor, dt.datetime):
+        return _TIPO_DATA
+    if isinstance(valor, dt.time):
+        return _TIPO_HORA
+    raise TypeError(f"tipo não suportado no cache de referências: {type(valor).__name__}")
+
+
+def _restaurar_valor(texto: str, codigo: int):
+    if codigo == _TIPO_INT:
+        return int(texto)
+    if codigo == _TIPO_FLOAT:
+        return float(texto)
+    if codigo == _TIPO_BOOL:
+        return texto == 'True'
+    if codigo == _TIPO_DATA:
+        return pd.Timestamp(texto)
+    if codigo == _TIPO_HORA:
+        return dt.time.fromisoformat(texto)
+    return texto
+
+
+def _codificar_tipos_mistos(df: pd.DataFrame) -> pd.DataFrame:
+    """Prepara o DataFrame para parquet sem perder o tipo de cada valor"""
+    df = df.copy()
+    for coluna in list(df.select_dtypes(include=['object']).columns):
+        serie = df[coluna]
+        preenchidos = serie.notna()
+        codigos = serie[preenchidos].map(_codigo_tipo)
+        if (codigos == _TIPO_TEXTO).all():
+            continue
+        texto = serie.copy()
+        texto[preenchidos] = serie[preenchidos].map(
+            lambda v: v.isoformat() if isinstance(v, (dt.datetime, dt.time)) else str(v)
+        )
+        df[coluna] = texto
+        tipos = pd.Series(-1, index=df.index, dtype='int8')
+        tipos[preenchidos] = codigos.astype('int8')
+        df[f"{PREFIXO_TIPO}{coluna}"] = tipos
+    return df
+
+
+def _decodificar_tipos_mistos(df: pd.DataFrame) -> pd.DataFrame:
+    """Inverso de _codificar_tipos_mistos"""
+    colunas_tipo = [c for c in df.columns if str(c).startswith(PREFIXO_TIPO)]
+    for coluna_tipo in colunas_tipo:
+        coluna = coluna_tipo[len(PREFIXO_TIPO):]
+        codigos = df[coluna_tipo].to_numpy()
+        valores = df[coluna].to_numpy(dtype=object).copy()
+        for posicao in np.flatnonzero(codigos > _TIPO_TEXTO):
+            valores[posicao] = _restaurar_valor(valores[posicao], int(codigos[posicao]))
+        df[coluna] = valores
+    df = df.drop(columns=colunas_tipo)
+    # Parquet devolve None nas colunas texto; manter NaN como no read_excel
+    colunas_obj = df.select_dtypes(include=['object']).columns
+    if len(colunas_obj) > 0:
+        df[colunas_obj] = df[colunas_obj].fillna(np.nan)
+    return df
+
+
+def _nome_aba(aba: Union[str, int]) -> str:
+    return f"indice{aba}" if isinstance(aba, int) else str(aba)
+
+
+class CacheReferencias:
+    """Manifesto + um parquet por aba de cada planilha de referência"""
+
+    def __init__(self, pasta_cache: Optional[str] = None):
+        self.pasta_cache = pasta_cache or PASTA_CACHE_PADRAO
+        os.makedirs(self.pasta_cache, exist_ok=True)
+        self.manifesto: Dict[str, Any] = {"versao": VERSAO_CACHE_REFERENCIAS, "planilhas": {}}
+        self._carregar_manifesto()
+
+    @property
+    def caminho_manifesto(self) -> str:
+        return os.path.join(self.pasta_cache, NOME_MANIFESTO)
+
+    def _carregar_manifesto(self):
+        try:
+            if os.path.exists(self.caminho_manifesto):
+                with open(self.caminho_manifesto, 'r', encoding='utf-8') as f:
+                    manifesto = json.load(f)
+                if manifesto.get("versao") == VERSAO_CACHE_REFERENCIAS:
+                    self.manifesto = manifesto
+        except Exception as e:
+            print(f"Aviso: manifesto de referências ilegível ({e}) - relendo as planilhas")
+
+    def _salvar_manifesto(self):
+        temporario = self.caminho_manifesto + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self.manifesto, f, indent=2, ensure_ascii=False)
+        os.replace(temporario, self.caminho_manifesto)
+
+    def _caminho_parquet(self, hash_planilha: str, aba: Union[str, int]) -> str:
+        nome = "".join(c if c.isalnum() else "_" for c in _nome_aba(aba))
+        return os.path.join(self.pasta_cache, f"{hash_planilha}_{nome}.parquet")
+
+    def _entrada_valida(self, caminho_planilha: str) -> Optional[Dict[str, Any]]:
+        """Entrada do manifesto se a planilha não mudou (tamanho/mtime ou hash)"""
+        entrada = self.manifesto["planilhas"].get(os.path.basename(caminho_planilha))
+        if not entrada:
+            return None
+        stat = os.stat(caminho_planilha)
+        if stat.st_size != entrada.get("tamanho"):
+            return None
+        if stat.st_mtime != entrada.get("mtime"):
+            if calcular_hash_arquivo(caminho_planilha) != entrada.get("hash"):
+                return None
+            entrada["mtime"] = stat.st_mtime
+        return entrada
+
+    def ler_abas(self, caminho_planilha: str,
+                 abas: Dict[Union[str, int], Dict[str, Any]]) -> Dict[Union[str, int], pd.DataFrame]:
+        """Devolve {aba: DataFrame} como o pd.read_excel(caminho, sheet_name=aba, **parametros).
+
+        Abas sem cache válido são lidas de uma vez, abrindo a planilha uma única vez.
+        """
+        nome_planilha = os.path.basename(caminho_planilha)
+        entrada = self._entrada_valida(caminho_planilha)
+        resultado: Dict[Union[str, int], pd.DataFrame] = {}
+        faltantes = {}
+
+        for aba, parametros in abas.items():
+            item = (entrada or {}).get("abas", {}).get(_nome_aba(aba))
+            caminho_parquet = self._caminho_parquet(entrada["hash"], aba) if entrada else None
+            if item and item.get("parametros") == parametros and os.path.exists(caminho_parquet):
+                try:
+                    resultado[aba] = _decodificar_tipos_mistos(pd.read_parquet(caminho_parquet))
+                    continue
+                except Exception as e:
+                    print(f"Aviso: cache da aba '{aba}' de {nome_planilha} corrompido ({e})")
+            faltantes[aba] = parametros
+
+        if not faltantes:
+            print(f"Referências: {nome_planilha} carregada do cache ({len(resultado)} aba(s))")
+            return resultado
+
+        print(f"Referências: lendo {len(faltantes)} aba(s) de {nome_planilha} (Excel)")
+        if entrada is None:
+            anterior = self.manifesto["planilhas"].get(nome_planilha)
+            stat = os.stat(caminho_planilha)
+            entrada = {"tamanho": stat.st_size, "mtime": stat.st_mtime,
+                       "hash": calcular_hash_arquivo(caminho_planilha), "abas": {}}
+            self.manifesto["planilhas"][nome_planilha] = entrada
+            if anterior and anterior.get("hash") != entrada["hash"]:
+                self._remover_abas(anterior)
+
+        with pd.ExcelFile(caminho_planilha) as planilha:
+            for aba, parametros in faltantes.items():
+                df = planilha.parse(aba, **parametros)
+                resultado[aba] = df
+                try:
+                    _codificar_tipos_mistos(df).to_parquet(
+                        self._caminho_parquet(entrada["hash"], aba), index=False
+                    )
+                    entrada["abas"][_nome_aba(aba)] = {"parametros": parametros, "registros": int(len(df))}
+                except Exception as e:
+                    print(f"Aviso: aba '{aba}' de {nome_planilha} sem cache ({e})")
+
+        self._salvar_manifesto()
+        # Devolver na ordem pedida
+        return {aba: resultado[aba] for aba in abas}
+
+    def _remover_abas(self, entrada: Dict[str, Any]):
+        """Apaga os parquets de uma versão anterior da planilha"""
+        for nome in entrada.get("abas", {}):
+            caminho_parquet = self._caminho_parquet(entrada.get("hash", ""), nome)
+            try:
+                if os.path.exists(caminho_parquet):
+                    os.remove(caminho_parquet)
+            except OSError:
+                pass
+
+
+def carregar_referencias(caminho_planilha: str, abas: Dict[Union[str, int], Dict[str, Any]],
+                         pasta_cache: Optional[str] = None) -> Dict[Union[str, int], pd.DataFrame]:
+    """Atalho: {aba: DataFrame} usando o cache de referências"""
+    return CacheReferencias(pasta_cache).ler_abas(caminho_planilha, abas)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tabelas derivadas do dashboard principal (gráficos e pivôs) como nós memoizados
+Cada nó é calculado a partir do DataFrame filtrado e guardado pela impressão digital das
+entradas (CascataFiltros.versao_resultado() + parâmetros). Num rerun, só os nós cujas
+entradas mudaram são recalculados: mudar o Top N ou os filtros do gráfico Type 07 não
+refaz os pivôs da barra lateral, e voltar a uma seleção anterior é instantâneo.
+
+Os resultados são compartilhados: quem for formatar deve copiar antes (.copy()).
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+
+COLUNAS_TYPES = ['Type 05', 'Type 06', 'Type 07']
+
+
+# ============= NÓS (funções puras sobre o DataFrame filtrado) =============
+
+def soma_por_periodo(df: pd.DataFrame) -> pd.DataFrame:
+    """Período x soma do Valor (gráfico de barras principal)"""
+    return df.groupby('Período', observed=True)['Valor'].sum().reset_index()
+
+
+def soma_por_coluna(df: pd.DataFrame, coluna: str) -> pd.DataFrame:
+    """coluna x soma do Valor, maior valor primeiro (gráficos Type 05/06/07)"""
+    dados = df.groupby(coluna, observed=True)['Valor'].sum().reset_index()
+    return dados.sort_values('Valor', ascending=False)
+
+
+def pivo_usi_periodo(df: pd.DataFrame) -> pd.DataFrame:
+    """USI x Período com totais (tabela dinâmica principal)"""
+    return df.pivot_table(index='USI', columns='Período', values='Valor', aggfunc='sum',
+                          margins=True, margins_name='Total', fill_value=0, observed=True)
+
+
+def pivo_types_periodo(df: pd.DataFrame) -> pd.DataFrame:
+    """Type 05/06/07 x Período com coluna Total, maior total primeiro"""
+    soma = df.groupby(COLUNAS_TYPES + ['Período'], observed=True)['Valor'].sum().reset_index()
+    tabela = soma.pivot_table(index=COLUNAS_TYPES, columns='Período', values='Valor',
+                              aggfunc='sum', fill_value=0, observed=True).reset_index()
+    colunas_periodo = tabela.select_dtypes(include=['number']).columns
+    tabela['Total'] = tabela[colunas_periodo].sum(axis=1)
+    return tabela.sort_values('Total', ascending=False)
+
+
+# ============= GRAFO =============
+
+class GrafoCalculos:
+    """Memo por nó: (nome, impressão digital das entradas) -> resultado, LRU por nó."""
+
+    def __init__(self, max_por_no: int = 8):
+        self._trava = threading.Lock()
+        self._nos: Dict[str, OrderedDict] = {}
+        self._max_por_no = max_por_no
+
+    def no(self, nome: str, entradas: Optional[Hashable], calcular: Callable[[], Any]) -> Any:
+        """Resultado do nó; `entradas` None = sem impressão digital, sempre recalcula"""
+        if entradas is None:
+            return calcular()
+        with self._trava:
+            memo = self._nos.setdefault(nome, OrderedDict())
+            if entradas in memo:
+                memo.move_to_end(entradas)
+                return memo[entradas]
+        valor = calcular()
+        with self._trava:
+            memo[entradas] = valor
+            while len(memo) > self._max_por_no:
+                memo.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._trava:
+            self._nos.clear()
+
+
+# Instância única do processo (as impressões digitais já incluem a versão dos dados)
+GRAFO = GrafoCalculos()
+
+
+def limpar_calculos():
+    """Atalho: GRAFO.limpar"""
+    GRAFO.limpar()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Cubo agregado do KE5Z gravado junto com o dataset (KE5Z_dataset/_cubo.parquet)
+Uma linha por combinação de USI x Período x Nº conta x Type 05/06/07 x Fornecedor x
+Fornec. x Tipo, com Valor e Qtd. somados e a quantidade de lançamentos (Registros).
+
+Somas, pivôs e filtros nessas dimensões dão o mesmo resultado no cubo e nos lançamentos;
+contagens de linhas usam total_registros (soma de Registros).
+"""
+
+from typing import List
+
+import pandas as pd
+
+NOME_CUBO = "_cubo.parquet"  # "_" no início: ignorado na leitura do dataset particionado
+COLUNA_REGISTROS = "Registros"
+
+# Mesmas dimensões do waterfall (Fornec. incluído: é filtro das páginas que usam o cubo)
+DIMENSOES_CUBO = [
+    'Período',
+    'USI',
+    'Type 05',
+    'Type 06',
+    'Type 07',
+    'Fornecedor',
+    'Fornec.',
+    'Tipo',
+    'Nº conta',
+]
+MEDIDAS_CUBO = ['Valor', 'Qtd.']
+
+
+def gerar_cubo(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega os lançamentos nas dimensões do cubo (nulos formam grupo próprio)"""
+    dimensoes = [c for c in DIMENSOES_CUBO if c in df.columns]
+    medidas = [c for c in MEDIDAS_CUBO if c in df.columns]
+    # Mesmo recorte do waterfall: sem Período ou sem Valor a linha não entra
+    base = df[dimensoes + medidas].dropna(subset=[c for c in ('Período', 'Valor') if c in df.columns])
+    agrupado = base.groupby(dimensoes, dropna=False, observed=True, sort=False)
+    cubo = agrupado[medidas].sum()
+    cubo[COLUNA_REGISTROS] = agrupado.size()
+    cubo = cubo.reset_index()
+    cubo[COLUNA_REGISTROS] = pd.to_numeric(cubo[COLUNA_REGISTROS], downcast='integer')
+    return cubo
+
+
+def dimensoes_do_cubo(cubo: pd.DataFrame) -> List[str]:
+    return [c for c in DIMENSOES_CUBO if c in cubo.columns]
+
+
+def total_registros(df: pd.DataFrame) -> int:
+    """Lançamentos representados pelo DataFrame (cubo ou linhas do waterfall)"""
+    if COLUNA_REGISTROS in df.columns:
+        return int(df[COLUNA_REGISTROS].sum())
+    return int(len(df))
@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+"""
+Dataset KE5Z particionado (Hive) gravado pelo Extracao.py
+KE5Z/KE5Z_dataset/grupo=main|others/Período=N/part-0.parquet
+
+Substitui KE5Z.parquet, KE5Z_main.parquet, KE5Z_others.parquet e KE5Z_waterfall.parquet:
+cada linha é gravada uma única vez e as visões são obtidas por poda de partições
+e seleção de colunas. Sem o dataset, lê os arquivos antigos (compatibilidade).
+
+Os tipos otimizados (category/dicionário, inteiros e floats reduzidos) são decididos
+na gravação e ficam no _esquema.json ("tipos"): a leitura não refaz nenhuma inferência.
+
+Com ETL_ARROW_IPC=1 (padrão no executável) a extração grava também uma cópia Arrow IPC
+sem compressão em KE5Z/KE5Z_ipc/<versão>/, aberta com memory map: as páginas usam o
+cache de páginas do sistema em vez de descompactar o parquet a cada carga.
+
+O cubo agregado (cubo_ke5z) é gravado na mesma pasta, na mesma troca atômica.
+"""
+
+import os
+import json
+import shutil
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from cubo_ke5z import COLUNA_REGISTROS, NOME_CUBO, dimensoes_do_cubo, gerar_cubo
+
+NOME_DATASET = "KE5Z_dataset"
+NOME_ESQUEMA = "_esquema.json"
+NOME_IPC = "KE5Z_ipc"
+VERSAO_DATASET = 2  # 2: tipos otimizados gravados no parquet + contrato no esquema
+COLUNA_GRUPO = "grupo"
+COLUNA_PERIODO = "Período"
+CUBOS_POR_SOMA = 16  # gravação em blocos: cubos parciais acumulados antes de somar
+
+# Visões oferecidas pelas páginas e arquivos antigos equivalentes
+ARQUIVOS_LEGADOS = {
+    "completo": "KE5Z.parquet",
+    "main": "KE5Z_main.parquet",
+    "others": "KE5Z_others.parquet",
+    "main_filtered": "KE5Z.parquet",
+    "waterfall": "KE5Z_waterfall.parquet",
+}
+VISAO_POR_ARQUIVO = {
+    "KE5Z.parquet": "completo",
+    "KE5Z_main.parquet": "main",
+    "KE5Z_others.parquet": "others",
+    "KE5Z_waterfall.parquet": "waterfall",
+}
+GRUPO_POR_VISAO = {"main": "main", "main_filtered": "main", "others": "others"}
+
+# Colunas essenciais para o waterfall (COM Type 07 ORIGINAL!)
+COLUNAS_WATERFALL = [
+    'Período',      # OBRIGATÓRIA - Para seleção de meses
+    'Valor',        # OBRIGATÓRIA - Para cálculos
+    'USI',          # Filtro principal + dimensão
+    'Type 05',      # Dimensão de categoria
+    'Type 06',      # Dimensão de categoria
+    'Type 07',      # Dimensão de categoria (ANTES da renomeação!)
+    'Fornecedor',   # Dimensão de categoria + filtro
+    'Fornec.',      # Filtro
+    'Tipo',         # Filtro
+    'Nº conta'      # Filtro com EXCELENTE compressão (269 únicos/3M registros = 0.01%)
+]
+
+
+def caminho_dataset(pasta_ke5z: str) -> str:
+    return os.path.join(pasta_ke5z, NOME_DATASET)
+
+
+def caminho_ipc(pasta_ke5z: str, versao: str) -> str:
+    return os.path.join(pasta_ke5z, NOME_IPC, versao)
+
+
+def arrow_ipc_habilitado() -> bool:
+    """ETL_ARROW_IPC=1: gravar a cópia Arrow IPC (memory map) junto com o dataset"""
+    return os.environ.get('ETL_ARROW_IPC', '').strip().lower() in ('1', 'true', 'sim', 'yes', 'on')
+
+
+def dataset_disponivel(pasta_ke5z: str) -> bool:
+    return os.path.exists(os.path.join(caminho_dataset(pasta_ke5z), NOME_ESQUEMA))
+
+
+def _ler_esquema(pasta_ke5z: str) -> Dict[str, Any]:
+    with open(os.path.join(caminho_dataset(pasta_ke5z), NOME_ESQUEMA), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _particionamento(tipo_periodo: pa.DataType) -> ds.Partitioning:
+    return ds.partitioning(
+        pa.schema([(COLUNA_GRUPO, pa.string()), (COLUNA_PERIODO, tipo_periodo)]),
+        flavor='hive',
+    )
+
+
+# ------------------------------------------------------------------ gravação
+def _gravar_ipc(tabela, pasta_ke5z: str, tipo_periodo: pa.DataType) -> str:
+    """Cópia Arrow IPC sem compressão, mesmas partições; devolve a versão (nome da pasta).
+    tabela: pa.Table ou o dataset parquet recém-gravado (gravação em blocos).
+
+    Cada extração usa uma pasta nova: no Windows, arquivos abertos com memory map
+    por uma página não podem ser substituídos.
+    """
+    versao = uuid.uuid4().hex[:12]
+    if isinstance(tabela, pa.Table):
+        partes = [tabela]
+    else:
+        # Uma partição por vez: o IPC aceita um único dicionário por coluna e cada bloco trouxe o seu
+        expressoes = {str(f.partition_expression): f.partition_expression for f in tabela.get_fragments()}
+        partes = (tabela.to_table(filter=e).unify_dictionaries() for e in expressoes.values())
+    for parte in partes:
+        ds.write_dataset(
+            parte,
+            caminho_ipc(pasta_ke5z, versao),
+            format='ipc',
+            partitioning=_particionamento(tipo_periodo),
+            basename_template='part-{i}.arrow',
+            file_options=ds.IpcFileFormat().make_write_options(compression=None),
+            existing_data_behavior='overwrite_or_ignore',
+        )
+    return versao
+
+
+def _remover_ipc_antigos(pasta_ke5z: str, manter: Optional[str]):
+    """Apaga as cópias IPC de extrações anteriores (as que ainda estão abertas ficam para a próxima)"""
+    raiz = os.path.join(pasta_ke5z, NOME_IPC)
+    if not os.path.isdir(raiz):
+        return
+    for nome in os.listdir(raiz):
+        if nome != manter:
+            shutil.rmtree(os.path.join(raiz, nome), ignore_errors=True)
+
+
+def gravar_dataset(df: pd.DataFrame, pasta_ke5z: str, arrow_ipc: Optional[bool] = None) -> Dict[str, Any]:
+    """Grava o DataFrame final em uma única passada, particionado por grupo de USI e Período.
+
+    A gravação vai para uma pasta temporária que substitui a anterior no final,
+    para as páginas nunca lerem um dataset pela metade. Devolve o esquema gravado.
+    arrow_ipc: grava também a cópia Arrow IPC (None = ETL_ARROW_IPC).
+    """
+    if arrow_ipc is None:
+        arrow_ipc = arrow_ipc_habilitado()
+    temporario = _preparar_temporario(pasta_ke5z)
+
+    grupo = _grupo_usi(df)
+    # Cópia rasa: só as colunas convertidas ocupam memória nova; o df do chamador não muda
+    df_tipado = otimizar_tipos(df.copy(deep=False))
+    tipos = {str(c): str(df_tipado[c].dtype) for c in df_tipado.columns}
+    tabela = pa.Table.from_pandas(df_tipado, preserve_index=False)
+    # Cubo agregado (milhares de linhas) para os pivôs e gráficos das páginas
+    cubo = gerar_cubo(df_tipado)
+    del df_tipado
+    tabela = tabela.append_column(COLUNA_GRUPO, pa.array(grupo, type=pa.string()))
+    tipo_periodo = tabela.schema.field(COLUNA_PERIODO).type
+
+    ds.write_dataset(
+        tabela,
+        temporario,
+        format='parquet',
+        partitioning=_particionamento(tipo_periodo),
+        basename_template='part-{i}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+    esquema = {
+        "versao": VERSAO_DATASET,
+        "colunas": [str(c) for c in df.columns],
+        "tipo_periodo": str(tipo_periodo),
+        "tipos": tipos,
+        "registros": int(len(df)),
+        "registros_por_grupo": {g: int((grupo == g).sum()) for g in ('main', 'others')},
+    }
+    return _finalizar(pasta_ke5z, temporario, esquema, cubo, tabela if arrow_ipc else None)
+
+
+def gravar_dataset_em_blocos(blocos: Iterable[pd.DataFrame], pasta_ke5z: str,
+                             arrow_ipc: Optional[bool] = None) -> Dict[str, Any]:
+    """Mesmo dataset do gravar_dataset, gravado bloco a bloco (extração em blocos).
+
+    Só um bloco fica em memória: cada um vira row groups do parquet e um cubo parcial,
+    somado aos anteriores no final. Os tipos são decididos no primeiro bloco; os números
+    não são reduzidos, porque um bloco seguinte poderia não caber no tipo menor.
+    """
+    if arrow_ipc is None:
+        arrow_ipc = arrow_ipc_habilitado()
+    temporario = _preparar_temporario(pasta_ke5z)
+    estado: Dict[str, Any] = {"schema": None, "registros": 0, "por_grupo": {'main': 0, 'others': 0}}
+    cubos: List[pd.DataFrame] = []
+
+    def lotes():
+        for df in blocos:
+            grupo = _grupo_usi(df)
+            if estado["schema"] is None:
+                df_tipado = otimizar_tipos(df.copy(deep=False), reduzir_numeros=False)
+                estado["colunas"] = [str(c) for c in df.columns]
+                estado["tipos"] = {str(c): str(df_tipado[c].dtype) for c in df_tipado.columns}
+                campos = pa.Table.from_pandas(df_tipado.head(0), preserve_index=False).schema
+                # Índices do dicionário com largura fixa: cada bloco tem sua própria contagem
+                estado["schema"] = pa.schema(
+                    [pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+                     if pa.types.is_dictionary(f.type) else f for f in campos]
+                    + [pa.field(COLUNA_GRUPO, pa.string())])
+                del df_tipado
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            tabela = tabela.append_column(COLUNA_GRUPO, pa.array(grupo, type=pa.string()))
+            estado["registros"] += len(df)
+            for g in ('main', 'others'):
+                estado["por_grupo"][g] += int((grupo == g).sum())
+            cubos.append(gerar_cubo(df))
+            if len(cubos) >= CUBOS_POR_SOMA:
+                # Cubos parciais somados de tempos em tempos: a memória fica no tamanho do cubo
+                cubos[:] = [_somar_cubos(cubos)]
+            yield from tabela.cast(estado["schema"]).to_batches()
+
+    lotes = lotes()
+    primeiro = next(lotes, None)
+    if primeiro is None:
+        raise ValueError("Nenhum bloco para gravar no dataset KE5Z")
+    tipo_periodo = estado["schema"].field(COLUNA_PERIODO).type
+    particionamento = _particionamento(tipo_periodo)
+    ds.write_dataset(
+        _encadear(primeiro, lotes),
+        temporario,
+        schema=estado["schema"],
+        format='parquet',
+        partitioning=particionamento,
+        basename_template='part-{i}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+    cubo = _somar_cubos(cubos)
+    del cubos
+    for col in dimensoes_do_cubo(cubo):
+        if estado["tipos"].get(col) == 'category':
+            cubo[col] = cubo[col].astype('category')
+    esquema = {
+        "versao": VERSAO_DATASET,
+        "colunas": estado["colunas"],
+        "tipo_periodo": str(tipo_periodo),
+        "tipos": estado["tipos"],
+        "registros": int(estado["registros"]),
+        "registros_por_grupo": estado["por_grupo"],
+    }
+    gravado = ds.dataset(temporario, format='parquet', partitioning=particionamento) if arrow_ipc else None
+    return _finalizar(pasta_ke5z, temporario, esquema, cubo, gravado)
+
+
+def _encadear(primeiro, restantes):
+    yield primeiro
+    yield from restantes
+
+
+def _somar_cubos(cubos: List[pd.DataFrame]) -> pd.DataFrame:
+    """Cubos parciais (um por bloco) somados num só, na ordem em que as combinações apareceram"""
+    cubo = pd.concat(cubos, ignore_index=True)
+    dimensoes = dimensoes_do_cubo(cubo)
+    medidas = [c for c in cubo.columns if c not in dimensoes]
+    cubo = cubo.groupby(dimensoes, dropna=False, observed=True, sort=False)[medidas].sum().reset_index()
+    cubo[COLUNA_REGISTROS] = pd.to_numeric(cubo[COLUNA_REGISTROS], downcast='integer')
+    return cubo
+
+
+def _grupo_usi(df: pd.DataFrame) -> np.ndarray:
+    return np.where((df['USI'] == 'Others').fillna(False).to_numpy(dtype=bool), 'others', 'main')
+
+
+def _preparar_temporario(pasta_ke5z: str) -> str:
+    destino = caminho_dataset(pasta_ke5z)
+    for pasta in (destino + ".tmp", destino + ".old"):
+        shutil.rmtree(pasta, ignore_errors=True)
+    return destino + ".tmp"
+
+
+def _finalizar(pasta_ke5z: str, temporario: str, esquema: Dict[str, Any], cubo: pd.DataFrame,
+               dados_ipc=None) -> Dict[str, Any]:
+    """Cubo, cópia IPC e esquema na pasta temporária, depois a troca atômica pelo dataset atual"""
+    destino = caminho_dataset(pasta_ke5z)
+    antigo = destino + ".old"
+    cubo.to_parquet(os.path.join(temporario, NOME_CUBO), index=False)
+    esquema["cubo"] = {"dimensoes": dimensoes_do_cubo(cubo), "registros": int(len(cubo))}
+    if dados_ipc is not None:
+        esquema["ipc"] = _gravar_ipc(dados_ipc, pasta_ke5z, pa.type_for_alias(esquema["tipo_periodo"]))
+    with open(os.path.join(temporario, NOME_ESQUEMA), 'w', encoding='utf-8') as f:
+        json.dump(esquema, f, indent=2, ensure_ascii=False)
+
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+    _remover_ipc_antigos(pasta_ke5z, esquema.get("ipc"))
+    return esquema
+
+
+def tamanho_dataset_mb(pasta_ke5z: str) -> float:
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho_dataset(pasta_ke5z)):
+        total += sum(os.path.getsize(os.path.join(raiz, a)) for a in arquivos)
+    return total / (1024 * 1024)
+
+
+# ------------------------------------------------------------------ leitura
+def otimizar_tipos(df: pd.DataFrame, reduzir_numeros: bool = True) -> pd.DataFrame:
+    """Texto repetitivo vira category e números são reduzidos (sem alterar conteúdo).
+
+    Roda uma vez na gravação do dataset; na leitura só para os arquivos antigos.
+    """
+    for col in df.columns:
+        # Texto em object ou string (python/pyarrow, modo Arrow da extração) vira dicionário
+        if df[col].dtype == 'object' or isinstance(df[col].dtype, pd.StringDtype):
+            unique_ratio = df[col].nunique(dropna=True) / max(1, len(df))
+            if unique_ratio < 0.5:  # Se menos de 50% são valores únicos
+                df[col] = df[col].astype('category')
+    if not reduzir_numeros:
+        return df
+    for col in df.select_dtypes(include=['float64']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='float')
+    for col in df.select_dtypes(include=['int64']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def otimizar_waterfall(df: pd.DataFrame) -> pd.DataFrame:
+    """Mesmas otimizações de memória que o arquivo waterfall recebia na extração"""
+    df = otimizar_tipos(df)
+    return df.dropna(subset=[c for c in ('Período', 'Valor') if c in df.columns])
+
+
+def _tipo_confere(tipo: pa.DataType, esperado: str) -> bool:
+    """O tipo Arrow lido corresponde ao dtype pandas registrado (numpy ou de extensão: string, Int64...)?"""
+    if esperado == 'category':
+        return pa.types.is_dictionary(tipo)
+    if esperado == 'object':
+        return not pa.types.is_dictionary(tipo)
+    try:
+        dtype = pd.api.types.pandas_dtype(esperado)
+    except TypeError:
+        return False
+    if isinstance(dtype, pd.StringDtype):
+        # str(dtype) é "string" tanto para python quanto para pyarrow (este grava large_string)
+        return pa.types.is_string(tipo) or pa.types.is_large_string(tipo)
+    # Mesma conversão que o pa.Table.from_pandas fez na gravação
+    return tipo == pa.array(pd.Series([], dtype=dtype)).type
+
+
+def _conferir_contrato(schema: pa.Schema, tipos: Dict[str, str]):
+    """Confere o esquema lido com os tipos registrados na gravação (só metadados)"""
+    divergentes = []
+    for campo in schema:
+        esperado = tipos.get(campo.name)
+        if esperado is None:
+            continue
+        if not _tipo_confere(campo.type, esperado):
+            divergentes.append(f"{campo.name} ({campo.type}, esperado {esperado})")
+    if divergentes:
+        raise ValueError("Dataset KE5Z fora do contrato de tipos: " + ", ".join(divergentes)
+                         + " - execute a extração novamente")
+
+
+def _usa_ipc(pasta_ke5z: str, esquema: Dict[str, Any]) -> bool:
+    versao = esquema.get("ipc")
+    return bool(versao) and os.path.isdir(caminho_ipc(pasta_ke5z, versao))
+
+
+def _abrir_dataset(pasta_ke5z: str, esquema: Dict[str, Any]) -> ds.Dataset:
+    tipo_periodo = pa.type_for_alias(esquema["tipo_periodo"])
+    if _usa_ipc(pasta_ke5z, esquema):
+        return ds.dataset(os.path.abspath(caminho_ipc(pasta_ke5z, esquema["ipc"])), format='ipc',
+                          partitioning=_particionamento(tipo_periodo),
+                          filesystem=pafs.LocalFileSystem(use_mmap=True))
+    return ds.dataset(caminho_dataset(pasta_ke5z), format='parquet',
+                      partitioning=_particionamento(tipo_periodo),
+                      exclude_invalid_files=True)
+
+
+def _lista_filtro(valor) -> Optional[List[Any]]:
+    """None = sem filtro; valor único ou coleção viram lista para isin"""
+    if valor is None:
+        return None
+    if isinstance(valor, (list, tuple, set, frozenset, np.ndarray, pd.Index, pd.Series)):
+        return list(valor)
+    return [valor]
+
+
+def _expressao_filtro(grupo: Optional[str], periodos: Optional[Iterable[int]],
+                      filtros: Optional[Dict[str, Any]]) -> Optional[ds.Expression]:
+    """Grupo e Período podam partições; os demais filtros usam as estatísticas dos row groups"""
+    condicoes = []
+    if grupo is not None:
+        condicoes.append(ds.field(COLUNA_GRUPO) == grupo)
+    if periodos is not None:
+        condicoes.append(ds.field(COLUNA_PERIODO).isin(list(periodos)))
+    for coluna, valor in (filtros or {}).items():
+        valores = _lista_filtro(valor)
+        if valores is not None:
+            condicoes.append(ds.field(coluna).isin(valores))
+    if not condicoes:
+        return None
+    filtro = condicoes[0]
+    for condicao in condicoes[1:]:
+        filtro = filtro & condicao
+    return filtro
+
+
+def _grupo_da_leitura(visao: str, grupo: Optional[str]) -> Optional[str]:
+    grupo_visao = GRUPO_POR_VISAO.get(visao)
+    if grupo is not None and grupo not in ("main", "others"):
+        raise ValueError(f"Grupo desconhecido: {grupo}")
+    if grupo_visao is not None and grupo is not None and grupo != grupo_visao:
+        raise ValueError(f"Visão {visao} não combina com o grupo {grupo}")
+    return grupo_visao or grupo
+
+
+def _ler_dataset(pasta_ke5z: str, visao: str, colunas: Optional[List[str]],
+                 periodos: Optional[Iterable[int]], filtros: Optional[Dict[str, Any]],
+                 grupo: Optional[str]) -> pd.DataFrame:
+    esquema = _ler_esquema(pasta_ke5z)
+    dataset = _abrir_dataset(pasta_ke5z, esquema)
+
+    ordem = esquema["colunas"]
+    if visao == "waterfall" and colunas is None:
+        colunas = [c for c in COLUNAS_WATERFALL if c in ordem]
+    colunas = [c for c in (colunas or ordem) if c in ordem]
+    desconhecidas = [c for c in (filtros or {}) if c not in ordem]
+    if desconhecidas:
+        raise ValueError(f"Filtro por colunas inexistentes: {desconhecidas}")
+
+    filtro = _expressao_filtro(_grupo_da_leitura(visao, grupo), periodos, filtros)
+    tabela = dataset.to_table(columns=colunas, filter=filtro)
+    tipos = esquema.get("tipos")
+    if tipos is None:
+        # Dataset da versão 1: tipos ainda inferidos na leitura
+        df = tabela.to_pandas()
+        return otimizar_waterfall(df) if visao == "waterfall" else otimizar_tipos(df)
+
+    _conferir_contrato(tabela.schema, tipos)
+    # Do memory map, split_blocks evita consolidar as colunas numéricas em cópias
+    df = tabela.to_pandas(split_blocks=_usa_ipc(pasta_ke5z, esquema))
+    if visao == "waterfall":
+        df = df.dropna(subset=[c for c in ('Período', 'Valor') if c in df.columns])
+    return df
+
+
+def _ler_legado(pasta_ke5z: str, visao: str, colunas: Optional[List[str]],
+                periodos: Optional[Iterable[int]], filtros: Optional[Dict[str, Any]],
+                grupo: Optional[str]) -> pd.DataFrame:
+    arquivo = os.path.join(pasta_ke5z, ARQUIVOS_LEGADOS[visao])
+    if not os.path.exists(arquivo) and visao in ("main", "others", "waterfall"):
+        # Arquivo específico ausente: filtrar o completo
+        arquivo = os.path.join(pasta_ke5z, ARQUIVOS_LEGADOS["completo"])
+    if not os.path.exists(arquivo):
+        raise FileNotFoundError(f"Arquivo não encontrado: {arquivo}")
+
+    # Colunas usadas só nos filtros são lidas junto e descartadas no final
+    grupo = _grupo_da_leitura(visao, grupo)
+    necessarias = list(filtros or {}) + (['USI'] if grupo else []) + ([COLUNA_PERIODO] if periodos is not None else [])
+    extras = [c for c in dict.fromkeys(necessarias) if colunas is not None and c not in colunas]
+    df = pd.read_parquet(arquivo, columns=None if colunas is None else colunas + extras)
+    if 'USI' in df.columns:
+        if grupo == "main" and os.path.basename(arquivo) != ARQUIVOS_LEGADOS["main"]:
+            df = df[df['USI'] != 'Others']
+        elif grupo == "others" and os.path.basename(arquivo) != ARQUIVOS_LEGADOS["others"]:
+            df = df[df['USI'] == 'Others']
+    if periodos is not None and COLUNA_PERIODO in df.columns:
+        df = df[df[COLUNA_PERIODO].isin(list(periodos))]
+    for coluna, valor in (filtros or {}).items():
+        valores = _lista_filtro(valor)
+        if valores is not None:
+            df = df[df[coluna].isin(valores)]
+    df = df.drop(columns=extras).copy()
+    if visao == "waterfall" and os.path.basename(arquivo) != ARQUIVOS_LEGADOS["waterfall"]:
+        return otimizar_waterfall(df[[c for c in COLUNAS_WATERFALL if c in df.columns]].copy())
+    if visao != "waterfall":
+        return otimizar_tipos(df)
+    return df
+
+
+def ler_visao(pasta_ke5z: str, visao: str = "completo", colunas: Optional[List[str]] = None,
+              periodos: Optional[Iterable[int]] = None, filtros: Optional[Dict[str, Any]] = None,
+              grupo: Optional[str] = None) -> pd.DataFrame:
+    """Lê uma visão dos dados KE5Z.
+
+    visao: "completo", "main" (sem Others), "main_filtered" (igual a main),
+    "others" ou "waterfall" (colunas reduzidas). Os tipos já vêm otimizados.
+    colunas/periodos: seleção de colunas e de meses feita na leitura.
+    filtros: {coluna: valor ou lista de valores} (ex.: {'USI': 'PWT', 'Nº conta': [...]}),
+    aplicados pelo pyarrow antes de montar o DataFrame.
+    grupo: "main" ou "others" para recortar qualquer visão (ex.: waterfall sem Others).
+    """
+    if visao not in ARQUIVOS_LEGADOS:
+        raise ValueError(f"Visão desconhecida: {visao}")
+    if dataset_disponivel(pasta_ke5z):
+        return _ler_dataset(pasta_ke5z, visao, colunas, periodos, filtros, grupo)
+    return _ler_legado(pasta_ke5z, visao, colunas, periodos, filtros, grupo)
+
+
+def periodos_disponiveis(pasta_ke5z: str, grupo: Optional[str] = None) -> List[int]:
+    """Períodos gravados (pelas partições, sem ler dados)"""
+    if dataset_disponivel(pasta_ke5z):
+        dataset = _abrir_dataset(pasta_ke5z, _ler_esquema(pasta_ke5z))
+        periodos = set()
+        for fragmento in dataset.get_fragments(filter=_expressao_filtro(grupo, None, None)):
+            periodo = ds.get_partition_keys(fragmento.partition_expression).get(COLUNA_PERIODO)
+            if periodo is not None:
+                periodos.add(periodo)
+        return sorted(periodos)
+    df = ler_visao(pasta_ke5z, "completo", colunas=[COLUNA_PERIODO], grupo=grupo)
+    return sorted(df[COLUNA_PERIODO].dropna().unique().tolist())
+
+
+def contar_registros(pasta_ke5z: str, grupo: Optional[str] = None,
+                     periodos: Optional[Iterable[int]] = None) -> int:
+    """Quantidade de linhas (metadados dos parquets no dataset)"""
+    if dataset_disponivel(pasta_ke5z):
+        dataset = _abrir_dataset(pasta_ke5z, _ler_esquema(pasta_ke5z))
+        return int(dataset.count_rows(filter=_expressao_filtro(grupo, periodos, None)))
+    return int(len(ler_visao(pasta_ke5z, "completo", colunas=[COLUNA_PERIODO],
+                             periodos=periodos, grupo=grupo)))
+
+
+def status_visoes(pasta_ke5z: str) -> Dict[str, bool]:
+    """Quais visões podem ser lidas (dataset particionado ou arquivos antigos)"""
+    if dataset_disponivel(pasta_ke5z):
+        grupos = _ler_esquema(pasta_ke5z).get("registros_por_grupo", {})
+        return {
+            "completo": True,
+            "main": grupos.get("main", 1) > 0,
+            "others": grupos.get("others", 1) > 0,
+            "waterfall": True,
+        }
+    return {visao: os.path.exists(os.path.join(pasta_ke5z, nome))
+            for visao, nome in ARQUIVOS_LEGADOS.items() if visao != "main_filtered"}
+
+
+def assinatura_dados(pasta_ke5z: str) -> tuple:
+    """Muda sempre que a extração grava novos dados (dataset ou arquivos antigos)"""
+    if dataset_disponivel(pasta_ke5z):
+        arquivos = [os.path.join(caminho_dataset(pasta_ke5z), NOME_ESQUEMA)]
+    else:
+        arquivos = [os.path.join(pasta_ke5z, nome) for nome in VISAO_POR_ARQUIVO]
+    assinatura = []
+    for arquivo in arquivos:
+        try:
+            stat = os.stat(arquivo)
+            assinatura.append((os.path.basename(arquivo), stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            continue
+    return tuple(assinatura)
+
+
+def cubo_disponivel(pasta_ke5z: str) -> bool:
+    return (dataset_disponivel(pasta_ke5z)
+            and os.path.exists(os.path.join(caminho_dataset(pasta_ke5z), NOME_CUBO)))
+
+
+def ler_cubo(pasta_ke5z: str, grupo: Optional[str] = None) -> pd.DataFrame:
+    """Cubo agregado (cubo_ke5z) da última extração, opcionalmente só main ou others"""
+    if not cubo_disponivel(pasta_ke5z):
+        raise FileNotFoundError(f"Cubo não encontrado em {caminho_dataset(pasta_ke5z)} - execute a extração")
+    cubo = pd.read_parquet(os.path.join(caminho_dataset(pasta_ke5z), NOME_CUBO))
+    if grupo is not None:
+        eh_others = (cubo['USI'] == 'Others').fillna(False)
+        cubo = cubo[eh_others if _grupo_da_leitura("completo", grupo) == "others" else ~eh_others]
+    return cubo.reset_index(drop=True)
+
+
+# ------------------------------------------------------------------ compatibilidade
+def existe_parquet_ke5z(caminho_legado: str) -> bool:
+    """os.path.exists para os nomes antigos (KE5Z_main.parquet etc.), ciente do dataset"""
+    visao = VISAO_POR_ARQUIVO.get(os.path.basename(caminho_legado))
+    if visao is None:
+        return os.path.exists(caminho_legado)
+    return status_visoes(os.path.dirname(caminho_legado)).get(visao, False)
+
+
+def ler_parquet_ke5z(caminho_legado: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """pd.read_parquet para os nomes antigos, lendo a visão equivalente do dataset"""
+    visao = VISAO_POR_ARQUIVO.get(os.path.basename(caminho_legado))
+    if visao is None:
+        return pd.read_parquet(caminho_legado, columns=columns)
+    return ler_visao(os.path.dirname(caminho_legado), visao, colunas=columns)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads das páginas (tabela filtrada, tabelas dinâmicas, somas por Types, extrações do mês)
+O arquivo é gravado num temporário único por escritores de memória constante e entregue
+pelo st.download_button, que o serve por HTTP (/media) em vez de BytesIO + base64 + link
+"data:" no markdown pelo websocket.
+
+Formatos: xlsx (xlsxwriter constant_memory, abas extras a cada 1.048.575 linhas), parquet
+(pyarrow, zstd), csv, csv.gz e csv.zst (compressão do pyarrow). O teto não é um número fixo
+de linhas: o custo de cada formato é medido gravando uma amostra das linhas e extrapolado
+para o total, e o pedido é recusado se o tamanho ou o tempo estimado passar do limite do modo.
+"""
+
+import io
+import os
+import tempfile
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from auth_simple import get_modo_operacao
+from exportacao_usi import NOME_ABA, OPCOES_CSV, gravar_xlsx
+
+MB = 1024 * 1024
+MIME_DOWNLOAD = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'parquet': "application/vnd.apache.parquet",
+    'csv.zst': "application/zstd",
+    'csv.gz': "application/gzip",
+    'csv': "text/csv",
+}
+ROTULOS_FORMATO = {
+    'xlsx': "Excel (.xlsx)",
+    'parquet': "Parquet (.parquet) - mais rápido e menor",
+    'csv.zst': "CSV compactado zstd (.csv.zst)",
+    'csv.gz': "CSV compactado gzip (.csv.gz)",
+    'csv': "CSV (.csv)",
+}
+COMPRESSAO_CSV = {'csv': None, 'csv.gz': 'gzip', 'csv.zst': 'zstd'}
+
+# Limites por modo de operação (auth_simple.get_modo_operacao): o arquivo inteiro fica na
+# memória do servidor de mídia até o download, e o tempo é o de gravação estimado
+LIMITES_DOWNLOAD = {
+    'cloud': {'bytes': 100 * MB, 'segundos': 120},
+    'completo': {'bytes': 1024 * MB, 'segundos': 900},
+}
+AMOSTRA_CUSTO = 2_000           # linhas gravadas para medir o custo de um formato
+LINHAS_SEM_ESTIMATIVA = 20_000  # até aqui qualquer formato grava em poucos segundos
+LINHAS_POR_BLOCO_CSV = 50_000
+LINHAS_POR_GRUPO_PARQUET = 100_000
+
+
+def limites_do_modo(modo: Optional[str] = None) -> Dict[str, int]:
+    """Limites de bytes e segundos do modo (padrão: o da sessão)"""
+    return LIMITES_DOWNLOAD.get(modo or get_modo_operacao(), LIMITES_DOWNLOAD['completo'])
+
+
+def formato_do_arquivo(nome_arquivo: str) -> str:
+    """Formato pela extensão (a mais longa que casar: .csv.gz antes de .csv)"""
+    nome = nome_arquivo.lower()
+    for formato in sorted(MIME_DOWNLOAD, key=len, reverse=True):
+        if nome.endswith(f".{formato}"):
+            return formato
+    raise ValueError(f"Formato de download desconhecido: {nome_arquivo}")
+
+
+def _gravar_csv(df: pd.DataFrame, caminho: str, limite_bytes: Optional[int] = None,
+                progresso: Optional[Callable[[int], None]] = None, compressao: Optional[str] = None):
+    """CSV em blocos de linhas (compactado pelo pyarrow, se pedido); interrompe no
+    primeiro bloco que passar do limite"""
+    opcoes = dict(OPCOES_CSV)
+    encoding = opcoes.pop('encoding')
+    bruto = open(caminho, 'wb') if compressao is None else pa.CompressedOutputStream(caminho, compressao)
+    with io.TextIOWrapper(bruto, encoding=encoding, newline='') as arquivo:
+        for inicio in range(0, max(len(df), 1), LINHAS_POR_BLOCO_CSV):
+            df.iloc[inicio:inicio + LINHAS_POR_BLOCO_CSV].to_csv(arquivo, header=(inicio == 0), **opcoes)
+            arquivo.flush()
+            if limite_bytes is not None and os.path.getsize(caminho) > limite_bytes:
+                raise ValueError(f"Arquivo passou de {limite_bytes / MB:.0f} MB (limite de download) - aplique mais filtros")
+            if progresso is not None:
+                progresso(min(inicio + LINHAS_POR_BLOCO_CSV, len(df)))
+
+
+def _gravar_parquet(df: pd.DataFrame, caminho: str, progresso: Optional[Callable[[int], None]] = None):
+    """Parquet (zstd) a partir da tabela Arrow do DataFrame (categorias viram dicionários, sem cópia do texto)"""
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(caminho, tabela.schema, compression='zstd') as escritor:
+        for inicio in range(0, max(tabela.num_rows, 1), LINHAS_POR_GRUPO_PARQUET):
+            escritor.write_table(tabela.slice(inicio, LINHAS_POR_GRUPO_PARQUET))
+            if progresso is not None:
+                progresso(min(inicio + LINHAS_POR_GRUPO_PARQUET, tabela.num_rows))
+
+
+def _gravar(df: pd.DataFrame, caminho: str, formato: str, nome_aba: str = NOME_ABA,
+            limite_bytes: Optional[int] = None, progresso: Optional[Callable[[int], None]] = None):
+    if formato == 'xlsx':
+        gravar_xlsx(df, caminho, nome_aba, progresso, dividir_abas=True)
+    elif formato == 'parquet':
+        _gravar_parquet(df, caminho, progresso)
+    else:
+        _gravar_csv(df, caminho, limite_bytes, progresso, COMPRESSAO_CSV[formato])
+
+
+def _temporario(formato: str) -> str:
+    descritor, caminho = tempfile.mkstemp(prefix="KE5Z_download_", suffix=f".{formato}")
+    os.close(descritor)
+    return caminho
+
+
+def _medir(df: pd.DataFrame, formato: str) -> Tuple[float, int]:
+    """(segundos, bytes) de gravar df num temporário descartável"""
+    caminho = _temporario(formato)
+    try:
+        inicio = time.perf_counter()
+        _gravar(df, caminho, formato)
+        return time.perf_counter() - inicio, os.path.getsize(caminho)
+    finally:
+        os.remove(caminho)
+
+
+def estimar_custo(df: pd.DataFrame, formato: str) -> Dict[str, float]:
+    """Tempo (s) e tamanho (bytes) de gravar df no formato, medidos numa amostra espalhada das linhas.
+
+    O custo por linha é a diferença entre a amostra inteira e um quarto dela, para que o
+    custo fixo do arquivo (cabeçalho, metadados do parquet, estrutura do xlsx) não seja
+    multiplicado pelo total de linhas.
+    """
+    if len(df) <= AMOSTRA_CUSTO:
+        segundos, tamanho = _medir(df, formato)
+        return {'segundos': segundos, 'bytes': tamanho}
+    posicoes = np.linspace(0, len(df) - 1, AMOSTRA_CUSTO).astype(np.int64)
+    segundos_quarto, tamanho_quarto = _medir(df.iloc[posicoes[::4]], formato)
+    segundos, tamanho = _medir(df.iloc[posicoes], formato)
+    linhas_medidas = len(posicoes) - len(posicoes[::4])
+    restantes = len(df) - len(posicoes)
+    return {'segundos': segundos + max(segundos - segundos_quarto, 0) / linhas_medidas * restantes,
+            'bytes': tamanho + max(tamanho - tamanho_quarto, 0) / linhas_medidas * restantes}
+
+
+def verificar_custo(df: pd.DataFrame, formato: str, limites: Dict[str, int]):
+    """ValueError se o tamanho ou o tempo estimado passar dos limites"""
+    if len(df) <= LINHAS_SEM_ESTIMATIVA:
+        return
+    custo = estimar_custo(df, formato)
+    if custo['bytes'] > limites['bytes'] or custo['segundos'] > limites['segundos']:
+        raise ValueError(
+            f"{len(df):,} linhas em {formato}: ~{custo['bytes'] / MB:,.0f} MB e ~{custo['segundos']:,.0f} s "
+            f"estimados, acima do limite ({limites['bytes'] / MB:,.0f} MB / {limites['segundos']:,} s) - "
+            "use Parquet ou CSV compactado, ou aplique mais filtros")
+
+
+def gravar_download(df: pd.DataFrame, formato: str = 'xlsx', nome_aba: str = NOME_ABA,
+                    limites: Optional[Dict[str, int]] = None,
+                    progresso: Optional[Callable[[int], None]] = None) -> str:
+    """Grava df num arquivo temporário único e devolve o caminho (quem chama remove).
+
+    ValueError se o custo estimado ou o arquivo final passar dos limites do modo.
+    `progresso` recebe as linhas já gravadas; se ele lançar uma exceção, o arquivo
+    parcial é apagado.
+    """
+    if formato not in MIME_DOWNLOAD:
+        raise ValueError(f"Formato de download desconhecido: {formato}")
+    limites = limites or limites_do_modo()
+    verificar_custo(df, formato, limites)
+
+    caminho = _temporario(formato)
+    try:
+        _gravar(df, caminho, formato, nome_aba, limites['bytes'], progresso)
+        tamanho = os.path.getsize(caminho)
+        if tamanho > limites['bytes']:
+            raise ValueError(f"Arquivo de {tamanho / MB:.0f} MB excede o limite de download "
+                             f"({limites['bytes'] / MB:.0f} MB) - aplique mais filtros")
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+def oferecer_download(df: pd.DataFrame, nome_arquivo: str, rotulo: str, chave: str,
+                      nome_aba: str = NOME_ABA, indice: bool = False) -> bool:
+    """Gera o arquivo (formato pela extensão) e mostra o botão de download; False se bloqueado"""
+    if indice:
+        df = df.reset_index()
+    try:
+        formato = formato_do_arquivo(nome_arquivo)
+        caminho = gravar_download(df, formato, nome_aba)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return False
+    try:
+        tamanho_mb = os.path.getsize(caminho) / MB
+        with open(caminho, 'rb') as arquivo:
+            # on_click="ignore": baixar não refaz a página (o arquivo já está no servidor de mídia)
+            st.download_button(rotulo, data=arquivo, file_name=nome_arquivo, mime=MIME_DOWNLOAD[formato],
+                               key=chave, on_click="ignore", use_container_width=True)
+    finally:
+        os.remove(caminho)
+    st.caption(f"📁 {nome_arquivo}: {len(df):,} linhas, {tamanho_mb:.1f} MB")
+    return True
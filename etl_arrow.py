@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Modo Arrow do Extracao.py (ETL_MODO_ARROW=1)
+Colunas texto ficam como string[pyarrow] do início ao fim (nulos continuam nulos,
+sem 'nan' em texto e sem cópias object) e os merges usam o hash join do Arrow
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+TIPO_TEXTO_ARROW = pd.StringDtype('pyarrow')
+COLUNA_ORDEM = '__ordem_linha'
+
+
+def modo_arrow_habilitado() -> bool:
+    """Desligado por padrão; ETL_MODO_ARROW=1 liga o modo Arrow"""
+    return os.environ.get('ETL_MODO_ARROW', '0').strip().lower() in ('1', 'true', 'sim')
+
+
+def como_texto(serie: pd.Series, modo_arrow: bool) -> pd.Series:
+    """astype(str) no modo pandas; string[pyarrow] (mantendo nulos) no modo Arrow"""
+    if modo_arrow:
+        return serie.astype(TIPO_TEXTO_ARROW)
+    return serie.astype(str)
+
+
+def para_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas object para string[pyarrow] (numéricas ficam como estão)"""
+    colunas_obj = df.select_dtypes(include=['object']).columns
+    if len(colunas_obj) == 0:
+        return df
+    return df.astype({col: TIPO_TEXTO_ARROW for col in colunas_obj})
+
+
+def normalizar_texto_arrow(df: pd.DataFrame, colunas_texto) -> pd.DataFrame:
+    """Equivalente Arrow do bloco astype(str) + where(notnull, None) do script"""
+    conversoes = {col: TIPO_TEXTO_ARROW for col in colunas_texto if col in df.columns}
+    conversoes.update({col: TIPO_TEXTO_ARROW for col in df.select_dtypes(include=['object']).columns})
+    return df.astype(conversoes) if conversoes else df
+
+
+def _tipo_pandas(tipo: pa.DataType):
+    """types_mapper do to_pandas: texto vira string[pyarrow], o resto segue o padrão"""
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        return TIPO_TEXTO_ARROW
+    return None
+
+
+def tabela_para_pandas(tabela: pa.Table) -> pd.DataFrame:
+    return tabela.to_pandas(types_mapper=_tipo_pandas)
+
+
+def juntar(df: pd.DataFrame, df_ref: pd.DataFrame, chave: str, colunas, modo_arrow: bool) -> pd.DataFrame:
+    """Left join de df com df_ref[[chave] + colunas].
+
+    Modo pandas: pd.merge (comportamento original). Modo Arrow: Table.join, com a
+    ordem das linhas de df preservada e a chave da referência convertida para o
+    tipo da chave de df quando forem diferentes.
+    """
+    direita = df_ref[[chave] + [c for c in colunas if c != chave]]
+    if not modo_arrow:
+        return pd.merge(df, direita, on=chave, how='left')
+
+    # Colunas object restantes (ex.: abas do Excel com tipos mistos) também viram texto Arrow
+    df, direita = para_arrow(df), para_arrow(direita)
+    esquerda = pa.Table.from_pandas(df, preserve_index=False)
+    esquerda = esquerda.append_column(COLUNA_ORDEM, pa.array(np.arange(len(df), dtype=np.int64)))
+    tabela_ref = pa.Table.from_pandas(direita, preserve_index=False)
+
+    tipo_chave = esquerda.schema.field(chave).type
+    indice_chave = tabela_ref.schema.get_field_index(chave)
+    if tabela_ref.schema.field(chave).type != tipo_chave:
+        try:
+            tabela_ref = tabela_ref.set_column(
+                indice_chave, chave, tabela_ref.column(chave).cast(tipo_chave)
+            )
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            print(f"Aviso: chave '{chave}' com tipos incompatíveis no Arrow ({e}) - usando pd.merge")
+            return pd.merge(df, direita, on=chave, how='left')
+
+    resultado = esquerda.join(tabela_ref, keys=chave, join_type='left outer', use_threads=True)
+    resultado = resultado.sort_by(COLUNA_ORDEM).drop_columns([COLUNA_ORDEM])
+    return tabela_para_pandas(resultado)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Cache incremental da extração KE5Z
+Guarda um parquet limpo por arquivo de entrada e um manifesto (tamanho, mtime e hash)
+para que apenas exportações novas ou alteradas sejam processadas novamente.
+O parquet é separado por modo da extração (pandas/arrow): os tipos das colunas texto
+(object ou string[pyarrow]) de um modo não podem vazar para o outro
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, List
+
+import numpy as np
+import pandas as pd
+
+from etl_ke5z import ler_partes
+
+# Incrementar quando a lógica de limpeza por arquivo mudar (invalida o cache inteiro)
+VERSAO_CACHE = 4  # 4: parquet por modo (pandas/arrow)
+MODO_PANDAS = "pandas"
+MODO_ARROW = "arrow"
+NOME_MANIFESTO = "manifesto.json"
+
+
+def calcular_hash_arquivo(caminho: str, tamanho_bloco: int = 8 * 1024 * 1024) -> str:
+    """Calcula o hash BLAKE2b do conteúdo do arquivo (leitura em blocos)"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def incremental_habilitado() -> bool:
+    """Modo incremental ligado por padrão; ETL_INCREMENTAL=0 força reprocessamento total"""
+    return os.environ.get('ETL_INCREMENTAL', '1').strip().lower() not in ('0', 'false', 'nao', 'não')
+
+
+class CacheIncremental:
+    """Manifesto + parquet limpo por arquivo de entrada (um por modo da extração)"""
+
+    def __init__(self, pasta_cache: str, habilitado: bool = True, modo: str = MODO_PANDAS):
+        self.pasta_cache = pasta_cache
+        self.habilitado = habilitado
+        self.modo = modo
+        self.manifesto: Dict[str, Any] = {"versao": VERSAO_CACHE, "arquivos": {}}
+        self.reutilizados: List[str] = []
+        self.processados: List[str] = []
+        if habilitado:
+            os.makedirs(pasta_cache, exist_ok=True)
+            self._carregar_manifesto()
+
+    # ------------------------------------------------------------------ manifesto
+    @property
+    def caminho_manifesto(self) -> str:
+        return os.path.join(self.pasta_cache, NOME_MANIFESTO)
+
+    def _carregar_manifesto(self):
+        """Carrega o manifesto; versão diferente descarta o cache"""
+        try:
+            if os.path.exists(self.caminho_manifesto):
+                with open(self.caminho_manifesto, 'r', encoding='utf-8') as f:
+                    manifesto = json.load(f)
+                if manifesto.get("versao") == VERSAO_CACHE:
+                    self.manifesto = manifesto
+                else:
+                    print("Versão do cache incremental mudou - todos os arquivos serão reprocessados")
+        except Exception as e:
+            print(f"Aviso: manifesto do cache ilegível ({e}) - reprocessando tudo")
+
+    def salvar_manifesto(self):
+        """Grava o manifesto de forma atômica"""
+        if not self.habilitado:
+            return
+        temporario = self.caminho_manifesto + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self.manifesto, f, indent=2, ensure_ascii=False)
+        os.replace(temporario, self.caminho_manifesto)
+
+    # ------------------------------------------------------------------ entradas
+    @staticmethod
+    def _assinatura(caminho: str) -> Dict[str, Any]:
+        stat = os.stat(caminho)
+        return {"tamanho": stat.st_size, "mtime": stat.st_mtime}
+
+    def _caminho_parquet(self, grupo: str, hash_arquivo: str) -> str:
+        return os.path.join(self.pasta_cache, f"{grupo}_{self.modo}_{hash_arquivo}.parquet")
+
+    def _ler_parquet(self, caminho_parquet: str) -> pd.DataFrame:
+        if os.path.isdir(caminho_parquet):
+            # Arquivo lido em blocos: pasta de partes (EscritorBlocos)
+            return ler_partes(caminho_parquet, modo_arrow=self.modo == MODO_ARROW)
+        df = pd.read_parquet(caminho_parquet)
+        # Parquet devolve None nas colunas texto; manter NaN como no read_csv
+        colunas_obj = df.select_dtypes(include=['object']).columns
+        if len(colunas_obj) > 0:
+            df[colunas_obj] = df[colunas_obj].fillna(np.nan)
+        return df
+
+    def localizar(self, grupo: str, caminho: str) -> Optional[str]:
+        """Caminho do parquet (ou da pasta de partes) em cache se o arquivo não mudou, senão None"""
+        if not self.habilitado:
+            return None
+        chave = f"{grupo}/{os.path.basename(caminho)}"
+        entrada = self.manifesto["arquivos"].get(chave)
+        if not entrada:
+            return None
+
+        assinatura = self._assinatura(caminho)
+        if assinatura["tamanho"] != entrada.get("tamanho"):
+            return None
+        if assinatura["mtime"] != entrada.get("mtime"):
+            # mtime mudou (cópia, touch): confirmar pelo conteúdo antes de reprocessar
+            if calcular_hash_arquivo(caminho) != entrada.get("hash"):
+                return None
+            entrada["mtime"] = assinatura["mtime"]
+
+        caminho_parquet = self._caminho_parquet(grupo, entrada["hash"])
+        return caminho_parquet if os.path.exists(caminho_parquet) else None
+
+    def _reaproveitado(self, caminho: str, registros: int):
+        print(f"Cache incremental: {os.path.basename(caminho)} sem alterações ({registros:,} registros)")
+        self.reutilizados.append(caminho)
+
+    def buscar(self, grupo: str, caminho: str) -> Optional[pd.DataFrame]:
+        """Retorna o DataFrame em cache se o arquivo não mudou, senão None"""
+        caminho_parquet = self.localizar(grupo, caminho)
+        if caminho_parquet is None:
+            return None
+        try:
+            df = self._ler_parquet(caminho_parquet)
+        except Exception as e:
+            print(f"Aviso: cache corrompido para {grupo}/{os.path.basename(caminho)} ({e}) - reprocessando")
+            return None
+        self._reaproveitado(caminho, len(df))
+        return df
+
+    def reaproveitar(self, grupo: str, caminho: str) -> Optional[str]:
+        """localizar sem carregar os dados (leitura em blocos); o resultado conta como reaproveitado"""
+        caminho_parquet = self.localizar(grupo, caminho)
+        if caminho_parquet is not None:
+            entrada = self.manifesto["arquivos"][f"{grupo}/{os.path.basename(caminho)}"]
+            self._reaproveitado(caminho, int(entrada.get("registros", 0)))
+        return caminho_parquet
+
+    def gravar(self, grupo: str, caminho: str, df: pd.DataFrame):
+        """Grava o DataFrame limpo do arquivo e atualiza o manifesto"""
+        self.processados.append(caminho)
+        if not self.habilitado:
+            return
+        chave = f"{grupo}/{os.path.basename(caminho)}"
+        hash_arquivo = calcular_hash_arquivo(caminho)
+        caminho_parquet = self._caminho_parquet(grupo, hash_arquivo)
+        # Pode haver uma pasta de partes de uma leitura anterior em blocos
+        self._apagar(caminho_parquet)
+        try:
+            df.to_parquet(caminho_parquet, index=False)
+        except Exception as e:
+            # Tipos mistos não suportados pelo PyArrow: seguir sem cache para este arquivo
+            print(f"Aviso: não foi possível gravar cache de {chave}: {e}")
+            return
+
+        self._registrar(grupo, caminho, hash_arquivo, len(df))
+
+    def gravar_partes(self, grupo: str, caminho: str, pasta_partes: str, registros: int) -> str:
+        """Move para o cache a pasta de partes de um arquivo lido em blocos e atualiza o
+        manifesto; devolve onde as partes ficaram (a própria pasta, sem cache)"""
+        self.processados.append(caminho)
+        if not self.habilitado:
+            return pasta_partes
+        hash_arquivo = calcular_hash_arquivo(caminho)
+        caminho_parquet = self._caminho_parquet(grupo, hash_arquivo)
+        self._apagar(caminho_parquet)
+        shutil.move(pasta_partes, caminho_parquet)
+        self._registrar(grupo, caminho, hash_arquivo, registros)
+        return caminho_parquet
+
+    def _registrar(self, grupo: str, caminho: str, hash_arquivo: str, registros: int):
+        chave = f"{grupo}/{os.path.basename(caminho)}"
+        anterior = self.manifesto["arquivos"].get(chave)
+        self.manifesto["arquivos"][chave] = {
+            **self._assinatura(caminho),
+            "hash": hash_arquivo,
+            "registros": int(registros),
+            "atualizado_em": datetime.now().isoformat(),
+        }
+        # Conteúdo mudou: descartar o parquet da versão anterior
+        if anterior and anterior.get("hash") != hash_arquivo:
+            self._remover_parquet(grupo, anterior.get("hash"))
+
+    def obter(self, grupo: str, caminho: str, processar: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """Busca no cache ou processa o arquivo (e grava o resultado)"""
+        df = self.buscar(grupo, caminho)
+        if df is not None:
+            return df
+        df = processar(caminho)
+        self.gravar(grupo, caminho, df)
+        return df
+
+    def _remover_parquet(self, grupo: str, hash_arquivo: Optional[str]):
+        if not hash_arquivo:
+            return
+        # O mesmo conteúdo pode estar em outro arquivo de entrada (cópia)
+        em_uso = any(
+            chave.startswith(f"{grupo}/") and e.get("hash") == hash_arquivo
+            for chave, e in self.manifesto["arquivos"].items()
+        )
+        if em_uso:
+            return
+        # Parquets (ou pastas de partes) do arquivo em todos os modos
+        for caminho_parquet in glob.glob(os.path.join(glob.escape(self.pasta_cache), f"{grupo}_*_{hash_arquivo}.parquet")):
+            self._apagar(caminho_parquet)
+
+    @staticmethod
+    def _apagar(caminho_parquet: str):
+        if os.path.isdir(caminho_parquet):
+            shutil.rmtree(caminho_parquet, ignore_errors=True)
+            return
+        try:
+            os.remove(caminho_parquet)
+        except OSError:
+            pass
+
+    def limpar_ausentes(self, grupo: str, caminhos_atuais: List[str]):
+        """Remove do manifesto (e do disco) arquivos que saíram da pasta de entrada"""
+        if not self.habilitado:
+            return
+        atuais = {f"{grupo}/{os.path.basename(c)}" for c in caminhos_atuais}
+        ausentes = [
+            chave for chave in self.manifesto["arquivos"]
+            if chave.startswith(f"{grupo}/") and chave not in atuais
+        ]
+        for chave in ausentes:
+            entrada = self.manifesto["arquivos"].pop(chave)
+            self._remover_parquet(grupo, entrada.get("hash"))
+            print(f"Cache incremental: {chave} removido (arquivo não existe mais)")
+
+    def resumo(self) -> str:
+        return (f"Cache incremental: {len(self.reutilizados)} arquivo(s) reaproveitado(s), "
+                f"{len(self.processados)} processado(s)")
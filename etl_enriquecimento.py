@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Regras de enriquecimento do Extracao.py
+Cada regra preenche uma coluna de destino com o primeiro valor não nulo de uma lista
+de colunas de origem (coalesce por coluna, sem apply linha a linha)
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+class RegraCoalesce:
+    """destino = primeira origem não nula, na ordem de prioridade informada"""
+
+    def __init__(self, nome: str, destino: str, origens: List[str]):
+        self.nome = nome
+        self.destino = destino
+        self.origens = origens
+
+    def colunas_faltantes(self, df: pd.DataFrame) -> List[str]:
+        return [c for c in self.origens if c not in df.columns]
+
+    def aplicar(self, df: pd.DataFrame) -> int:
+        """Aplica a regra no próprio DataFrame e devolve quantos valores mudaram"""
+        resultado = df[self.origens[0]]
+        for coluna in self.origens[1:]:
+            resultado = resultado.where(resultado.notna(), df[coluna])
+
+        anterior = df[self.destino] if self.destino in df.columns else None
+        if anterior is None:
+            alterados = int(resultado.notna().sum())
+        else:
+            # ne + fillna: com string[pyarrow]/nullable a comparação com nulo dá NA, que conta como mudança
+            diferente = resultado.ne(anterior).fillna(True).astype(bool)
+            alterados = int((diferente & ~(resultado.isna() & anterior.isna())).sum())
+        df[self.destino] = resultado
+        return alterados
+
+    def __repr__(self):
+        return f"RegraCoalesce({self.nome!r}: {self.destino} <- {' > '.join(self.origens)})"
+
+
+def aplicar_regras(df: pd.DataFrame, regras: List[RegraCoalesce],
+                   relatorio: Optional[List[Dict[str, Any]]] = None,
+                   verboso: bool = True) -> List[Dict[str, Any]]:
+    """Aplica as regras em ordem e imprime o tempo de cada uma.
+
+    Regras com colunas de origem ausentes são puladas (mesmo comportamento dos
+    `if ... in df_total.columns` do script). Devolve o relatório acumulado: uma regra
+    já presente no relatório (extração em blocos) soma alterados e tempo na mesma linha.
+    """
+    if relatorio is None:
+        relatorio = []
+    for regra in regras:
+        faltantes = regra.colunas_faltantes(df)
+        if faltantes:
+            if verboso:
+                print(f"Regra '{regra.nome}' ignorada - colunas ausentes: {faltantes}")
+            _acumular(relatorio, {"regra": regra.nome, "destino": regra.destino,
+                                  "alterados": 0, "segundos": 0.0, "ignorada": True})
+            continue
+        inicio = time.perf_counter()
+        alterados = regra.aplicar(df)
+        segundos = time.perf_counter() - inicio
+        if verboso:
+            print(f"Regra '{regra.nome}': {alterados:,} valores de '{regra.destino}' alterados em {segundos:.3f}s")
+        _acumular(relatorio, {"regra": regra.nome, "destino": regra.destino,
+                              "alterados": alterados, "segundos": segundos, "ignorada": False})
+    return relatorio
+
+
+def _acumular(relatorio: List[Dict[str, Any]], item: Dict[str, Any]):
+    existente = next((i for i in relatorio if i["regra"] == item["regra"]), None)
+    if existente is None:
+        relatorio.append(item)
+        return
+    existente["alterados"] += item["alterados"]
+    existente["segundos"] += item["segundos"]
+    existente["ignorada"] = existente["ignorada"] and item["ignorada"]
+
+
+def imprimir_relatorio(relatorio: List[Dict[str, Any]]):
+    """Resumo final do tempo gasto por regra"""
+    if not relatorio:
+        return
+    print("Enriquecimento - tempo por regra:")
+    for item in relatorio:
+        situacao = "ignorada" if item["ignorada"] else f"{item['alterados']:,} alterados"
+        print(f"  {item['regra']:<30} {item['segundos']:>8.3f}s  ({situacao})")
+    print(f"  {'Total':<30} {sum(i['segundos'] for i in relatorio):>8.3f}s")
+
+
+# Regras usadas pelo Extracao.py (na ordem em que os dados ficam disponíveis)
+# Texto do lançamento substituído pela descrição do material da KSBB, quando houver
+REGRA_TEXTO_MATERIAL = RegraCoalesce('Texto <- Descrição Material', 'Texto', ['Descrição Material', 'Texto'])
+# Fornecedor substituído pelo nome da provisão (Hist_prov), quando houver
+REGRA_FORNECEDOR_PROVISAO = RegraCoalesce('Fornecedor <- Hist_prov', 'Fornecedor', ['Nome do fornecedor', 'Fornecedor'])
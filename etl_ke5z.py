@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura e limpeza dos arquivos exportados do SAP (KE5Z e KSBB)
+Funções usadas pelo Extracao.py para processar os arquivos .txt, um por vez
+ou em paralelo (um processo por arquivo), inteiros ou em blocos.
+Em blocos, o resultado fica em partes parquet (EscritorBlocos) e é consumido bloco a
+bloco (ler_blocos) pelas etapas seguintes do pipeline
+"""
+
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from numeros_br import converter_numero_br
+from etl_arrow import para_arrow, tabela_para_pandas
+
+# Estimativa de memória do DataFrame em relação ao tamanho do .txt (colunas texto)
+FATOR_MEMORIA_ARQUIVO = 6
+LIMITE_MEMORIA_PADRAO_MB = 4096
+# Leitura em blocos (arquivos maiores que a memória): linhas por bloco quando não configurado
+LINHAS_POR_BLOCO_PADRAO = 500_000
+
+# Opções do read_csv comuns à leitura inteira e à leitura em blocos
+OPCOES_CSV_KE5Z = dict(
+    sep='\t',
+    skiprows=9,
+    encoding='latin1',
+    engine='c',  # Engine C é mais rápida para arquivos grandes
+)
+
+
+def memoria_processo_mb() -> float:
+    """Memória residente (RSS) do processo atual em MB; 0 se o psutil não estiver disponível"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        return 0.0
+
+
+def linhas_por_bloco_configuradas() -> int:
+    """ETL_LINHAS_POR_BLOCO > 0 força a leitura em blocos para todos os arquivos KE5Z"""
+    valor = os.environ.get('ETL_LINHAS_POR_BLOCO', '').strip()
+    if not valor:
+        return 0
+    try:
+        return max(0, int(valor))
+    except ValueError:
+        print(f"Aviso: ETL_LINHAS_POR_BLOCO='{valor}' inválido - leitura em blocos só para arquivos grandes")
+        return 0
+
+
+def _limpar_ke5z(df: pd.DataFrame, modo_arrow: bool = False, verboso: bool = True) -> pd.DataFrame:
+    """Limpeza de um DataFrame (arquivo inteiro ou bloco) lido do .txt da KE5Z"""
+    # mudar o nome da coluna Doc.ref. pelo seu índice
+    if len(df.columns) > 9:
+        df.rename(columns={df.columns[9]: 'doc.ref'}, inplace=True)
+
+    # Remover espaços em branco dos nomes das colunas
+    df.columns = df.columns.str.strip()
+    if verboso:
+        print("Limpando dados...")
+
+    # Filtrar a coluna 'Ano' com valores não nulos e diferentes de 0
+    df = df[df['Ano'].notna() & (df['Ano'] != 0)]
+    # Linhas sem conta são descartadas depois no Extracao.py; filtrar aqui economiza memória
+    if 'Nº conta' in df.columns:
+        df = df[df['Nº conta'].notna() & (df['Nº conta'] != 0)]
+    if verboso:
+        print(f"Após filtro Ano/Nº conta: {len(df):,} registros")
+
+    # Formato brasileiro do SAP ("1.234,56" e sinal no fim "82,02-"); inválidos viram 0
+    if verboso:
+        print("Convertendo colunas Em MCont. e Qtd...")
+    df['Em MCont.'] = converter_numero_br(df['Em MCont.'], valor_padrao=0)
+    df['Qtd.'] = converter_numero_br(df['Qtd.'], valor_padrao=0)
+
+    if modo_arrow:
+        df = para_arrow(df)
+    return df
+
+
+def precisa_ler_em_blocos(caminho_arquivo: str, linhas_por_bloco: int = 0,
+                          limite_memoria_mb: Optional[int] = None) -> bool:
+    """ETL_LINHAS_POR_BLOCO configurado ou estimativa de memória acima do limite"""
+    return bool(linhas_por_bloco) or bool(
+        limite_memoria_mb and estimar_memoria_mb(caminho_arquivo) > limite_memoria_mb)
+
+
+def ler_arquivo_ke5z(caminho_arquivo: str, modo_arrow: bool = False, linhas_por_bloco: int = 0,
+                     limite_memoria_mb: Optional[int] = None,
+                     pasta_blocos: Optional[str] = None) -> Union[pd.DataFrame, Dict[str, Any]]:
+    """Lê um arquivo .txt da KE5Z e devolve o DataFrame limpo
+
+    Com modo_arrow=True as colunas texto já saem como string[pyarrow] (menos
+    memória e transferência mais barata entre processos). Com linhas_por_bloco > 0,
+    ou quando a estimativa de memória do arquivo passa de limite_memoria_mb, a
+    leitura é feita em blocos (ler_arquivo_ke5z_em_blocos) para pasta_blocos/<arquivo>
+    e o retorno é o resumo da leitura, não um DataFrame.
+    O pico de memória observado fica em df.attrs['pico_memoria_mb'].
+    """
+    arquivo = os.path.basename(caminho_arquivo)
+
+    # Verificar tamanho do arquivo
+    tamanho_mb = os.path.getsize(caminho_arquivo) / (1024 * 1024)
+    print(f"Tamanho: {tamanho_mb:.1f} MB")
+
+    if precisa_ler_em_blocos(caminho_arquivo, linhas_por_bloco, limite_memoria_mb):
+        if not linhas_por_bloco:
+            print(f"{arquivo}: estimativa acima de {limite_memoria_mb:,} MB - leitura em blocos")
+        destino = os.path.join(pasta_blocos or tempfile.mkdtemp(prefix='ke5z_blocos_'), arquivo)
+        return ler_arquivo_ke5z_em_blocos(caminho_arquivo, destino, linhas_por_bloco, modo_arrow)
+
+    # Ler o arquivo em um DataFrame com tratamento de erro
+    print("Carregando dados...")
+    df = pd.read_csv(
+        caminho_arquivo,
+        **OPCOES_CSV_KE5Z,
+        low_memory=False  # Evitar warnings de tipos mistos
+    )
+    print(f"Carregado: {len(df):,} registros, {len(df.columns)} colunas")
+    pico_mb = memoria_processo_mb()
+
+    print(f"Processando dados de {arquivo}...")
+    df = _limpar_ke5z(df, modo_arrow)
+    df.attrs['pico_memoria_mb'] = max(pico_mb, memoria_processo_mb())
+    return df
+
+
+# ------------------------------------------------------------------ partes em blocos
+def _tipo_unificado(atual: pa.DataType, novo: pa.DataType) -> pa.DataType:
+    """Menor tipo que guarda os dois: coluna vazia assume o outro, inteiro + float = float,
+    número + texto = texto (large_string se algum dos dois for)"""
+    if atual == novo or pa.types.is_null(novo):
+        return atual
+    if pa.types.is_null(atual):
+        return novo
+    if pa.types.is_integer(atual) and pa.types.is_integer(novo):
+        return pa.int64()
+    numericos = (pa.types.is_integer, pa.types.is_floating)
+    if any(f(atual) for f in numericos) and any(f(novo) for f in numericos):
+        return pa.float64()
+    if pa.types.is_large_string(atual) or pa.types.is_large_string(novo):
+        return pa.large_string()
+    return pa.string()
+
+
+def _conformar(tabela: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Colunas na ordem e nos tipos do schema (as ausentes viram nulas)"""
+    colunas = []
+    for campo in schema:
+        if campo.name in tabela.column_names:
+            coluna = tabela.column(campo.name)
+            colunas.append(coluna if coluna.type == campo.type else coluna.cast(campo.type))
+        else:
+            colunas.append(pa.nulls(len(tabela), campo.type))
+    return pa.Table.from_arrays(colunas, schema=schema)
+
+
+def _para_pandas(tabela: pa.Table, modo_arrow: bool) -> pd.DataFrame:
+    if modo_arrow:
+        return tabela_para_pandas(tabela)
+    df = tabela.to_pandas()
+    # Parquet devolve None nas colunas texto; manter NaN como no read_csv
+    colunas_obj = df.select_dtypes(include=['object']).columns
+    if len(colunas_obj) > 0:
+        df[colunas_obj] = df[colunas_obj].fillna(np.nan)
+    return df
+
+
+class EscritorBlocos:
+    """Grava DataFrames (blocos) como row groups de parquet em pasta/part-N.parquet.
+
+    O schema vem do primeiro bloco. Um bloco com tipo mais largo (coluna vazia que
+    ganha valores, inteiro que vira float, número que vira texto) ou com colunas
+    novas fecha a parte atual e abre outra com o schema ampliado: cada bloco é
+    gravado uma vez, sem reler nada. A última parte tem o schema de todas (ler_blocos).
+    """
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self.registros = 0
+        self.partes = 0
+        self.schema: Optional[pa.Schema] = None
+        self._escritor: Optional[pq.ParquetWriter] = None
+        os.makedirs(pasta, exist_ok=True)
+
+    def _ampliar(self, tabela: pa.Table) -> pa.Schema:
+        if self.schema is None:
+            return tabela.schema
+        tipos = {campo.name: campo.type for campo in tabela.schema}
+        campos = [pa.field(campo.name, _tipo_unificado(campo.type, tipos.pop(campo.name, pa.null())))
+                  for campo in self.schema]
+        campos += [campo for campo in tabela.schema if campo.name in tipos]
+        return pa.schema(campos)
+
+    def escrever(self, df: pd.DataFrame):
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        tabela = tabela.replace_schema_metadata(None)
+        schema = self._ampliar(tabela)
+        if self._escritor is None or not schema.equals(self.schema):
+            self._fechar_parte()
+            self.schema = schema
+            self._escritor = pq.ParquetWriter(os.path.join(self.pasta, f"part-{self.partes}.parquet"), schema)
+            self.partes += 1
+        self._escritor.write_table(_conformar(tabela, self.schema))
+        self.registros += len(tabela)
+
+    def _fechar_parte(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+
+    def fechar(self):
+        self._fechar_parte()
+
+
+def _partes(pasta: str) -> List[str]:
+    nomes = [n for n in os.listdir(pasta) if n.startswith('part-') and n.endswith('.parquet')]
+    return [os.path.join(pasta, n) for n in sorted(nomes, key=lambda n: int(n[5:-8]))]
+
+
+def _schema_fonte(fonte: str) -> pa.Schema:
+    """Schema de um parquet ou da última parte de uma pasta do EscritorBlocos"""
+    arquivos = _partes(fonte) if os.path.isdir(fonte) else [fonte]
+    return pq.read_schema(arquivos[-1]).remove_metadata()
+
+
+def schema_comum(fontes: List[str]) -> pa.Schema:
+    """Schema que guarda todas as fontes, como o pd.concat dos arquivos inteiros faria
+    (inteiro em um arquivo e float em outro = float em todos)"""
+    tipos: Dict[str, pa.DataType] = {}
+    for fonte in fontes:
+        for campo in _schema_fonte(fonte):
+            tipos[campo.name] = _tipo_unificado(tipos.get(campo.name, pa.null()), campo.type)
+    return pa.schema(list(tipos.items()))
+
+
+def ler_lotes(fonte: str, linhas_por_bloco: int = 0, schema: Optional[pa.Schema] = None,
+              colunas: Optional[List[str]] = None) -> Iterator[pa.Table]:
+    """Tabelas Arrow de até linhas_por_bloco linhas, na ordem gravada, de um parquet ou
+    de uma pasta de partes do EscritorBlocos (todas no schema da última, ou no `schema`
+    informado, ex.: schema_comum de várias fontes); colunas: só as colunas pedidas"""
+    linhas_por_bloco = linhas_por_bloco or LINHAS_POR_BLOCO_PADRAO
+    arquivos = _partes(fonte) if os.path.isdir(fonte) else [fonte]
+    if not arquivos:
+        return
+    schema = schema or _schema_fonte(fonte)
+    if colunas is not None:
+        schema = pa.schema([schema.field(c) for c in colunas])
+    for arquivo in arquivos:
+        arquivo_parquet = pq.ParquetFile(arquivo)
+        presentes = [c for c in schema.names if c in arquivo_parquet.schema_arrow.names]
+        for lote in arquivo_parquet.iter_batches(batch_size=linhas_por_bloco, columns=presentes):
+            yield _conformar(pa.Table.from_batches([lote]), schema)
+
+
+def ler_blocos(fonte: Union[str, pd.DataFrame], modo_arrow: bool = False,
+               linhas_por_bloco: int = 0, schema: Optional[pa.Schema] = None) -> Iterator[pd.DataFrame]:
+    """ler_lotes como DataFrames (texto em string[pyarrow] no modo Arrow); um DataFrame
+    também é aceito e devolvido em fatias"""
+    if isinstance(fonte, pd.DataFrame):
+        linhas_por_bloco = linhas_por_bloco or LINHAS_POR_BLOCO_PADRAO
+        for inicio in range(0, len(fonte), linhas_por_bloco):
+            yield fonte.iloc[inicio:inicio + linhas_por_bloco]
+        return
+    for tabela in ler_lotes(fonte, linhas_por_bloco, schema):
+        yield _para_pandas(tabela, modo_arrow)
+
+
+def ler_partes(pasta: str, modo_arrow: bool = False) -> pd.DataFrame:
+    """Todas as partes de uma pasta do EscritorBlocos num DataFrame"""
+    arquivos = _partes(pasta)
+    schema = pq.read_schema(arquivos[-1]).remove_metadata()
+    tabela = pa.concat_tables([_conformar(pq.read_table(a).replace_schema_metadata(None), schema)
+                               for a in arquivos])
+    return _para_pandas(tabela, modo_arrow)
+
+
+def _filtrar(tabela: pa.Table, filtros: Optional[Dict[str, List[Any]]]) -> pa.Table:
+    for coluna, valores in (filtros or {}).items():
+        aceitos = pa.array(list(valores)).cast(tabela.schema.field(coluna).type)
+        tabela = tabela.filter(pc.is_in(tabela.column(coluna), value_set=aceitos))
+    return tabela
+
+
+def contar_selecao(fonte: str, filtros: Optional[Dict[str, List[Any]]] = None) -> int:
+    """Linhas de um parquet ou pasta de partes que passam nos filtros ({coluna: valores aceitos})"""
+    return sum(len(_filtrar(tabela, filtros)) for tabela in ler_lotes(fonte, colunas=list(filtros or {}) or None))
+
+
+def ler_selecao_em_blocos(fonte: str, modo_arrow: bool = False, colunas: Optional[List[str]] = None,
+                          filtros: Optional[Dict[str, List[Any]]] = None,
+                          linhas_por_bloco: int = 0) -> Iterator[pd.DataFrame]:
+    """Colunas e linhas ({coluna: valores aceitos}) de um parquet ou pasta de partes, na ordem
+    gravada e bloco a bloco (ler_lotes filtrado pelo pyarrow antes de montar cada DataFrame)"""
+    necessarias = None if colunas is None else list(dict.fromkeys(list(colunas) + list(filtros or {})))
+    for tabela in ler_lotes(fonte, linhas_por_bloco, colunas=necessarias):
+        tabela = _filtrar(tabela, filtros)
+        if len(tabela):
+            yield _para_pandas(tabela.select(colunas) if colunas is not None else tabela, modo_arrow)
+
+
+def ler_arquivo_ke5z_em_blocos(caminho_arquivo: str, destino: str, linhas_por_bloco: int = 0,
+                               modo_arrow: bool = False) -> Dict[str, Any]:
+    """Leitura em blocos para exportações maiores que a memória disponível.
+
+    Uma única passada pelo .txt: cada bloco é lido, limpo, filtrado e gravado como
+    row group nas partes de `destino` (EscritorBlocos); o arquivo inteiro nunca é
+    carregado, nem no final. Devolve o resumo: caminho (destino), lidos, registros
+    (válidos) e pico_memoria_mb (RSS amostrado a cada bloco).
+    """
+    arquivo = os.path.basename(caminho_arquivo)
+    linhas_por_bloco = linhas_por_bloco or LINHAS_POR_BLOCO_PADRAO
+    print(f"Leitura em blocos de {linhas_por_bloco:,} linhas: {arquivo}")
+
+    escritor = EscritorBlocos(destino)
+    total_lido = 0
+    pico_mb = memoria_processo_mb()
+    try:
+        blocos = pd.read_csv(caminho_arquivo, **OPCOES_CSV_KE5Z, chunksize=linhas_por_bloco, low_memory=False)
+        for numero, bloco in enumerate(blocos, 1):
+            total_lido += len(bloco)
+            bloco = _limpar_ke5z(bloco, modo_arrow, verboso=False)
+            escritor.escrever(bloco)
+            pico_mb = max(pico_mb, memoria_processo_mb())
+            print(f"  bloco {numero}: {total_lido:,} lidos, {escritor.registros:,} válidos, RSS {pico_mb:,.0f} MB")
+            del bloco
+        if escritor.partes == 0:
+            # Arquivo sem linhas: só o cabeçalho, para as colunas existirem
+            vazio = pd.read_csv(caminho_arquivo, **OPCOES_CSV_KE5Z, nrows=0)
+            escritor.escrever(_limpar_ke5z(vazio, modo_arrow, verboso=False))
+    finally:
+        escritor.fechar()
+
+    print(f"Lido em blocos: {total_lido:,} registros, {escritor.registros:,} após filtros "
+          f"({escritor.partes} parte(s) em {destino})")
+    return {"caminho": destino, "lidos": total_lido, "registros": escritor.registros,
+            "pico_memoria_mb": pico_mb}
+
+
+def imprimir_pico_memoria(picos: Dict[str, float]):
+    """Relatório do pico de memória (RSS amostrado) por arquivo lido"""
+    if not picos:
+        return
+    print("Pico de memória por arquivo (RSS do processo que leu o arquivo):")
+    for arquivo, pico in picos.items():
+        print(f"  {arquivo:<40} {pico:>10,.0f} MB")
+
+
+def ler_arquivo_ksbb(caminho_arquivo: str) -> pd.DataFrame:
+    """Lê um arquivo .txt da KSBB e devolve materiais únicos"""
+    # Ler o arquivo em um DataFrame
+    df_ksbb = pd.read_csv(
+        caminho_arquivo,
+        sep='\t',
+        encoding='latin1',
+        engine='python',
+        skiprows=3,
+        skipfooter=1,
+    )
+
+    # remover espaços em branco dos nomes das colunas
+    df_ksbb.columns = df_ksbb.columns.str.strip()
+
+    # Filtrar a coluna Material com não vazias e diferentes de 0
+    df_ksbb = df_ksbb[
+        df_ksbb['Material'].notna() & (df_ksbb['Material'] != 0)
+    ]
+
+    # remover as linhas duplicadas pela coluna Material
+    df_ksbb = df_ksbb.drop_duplicates(subset=['Material'])
+
+    return df_ksbb
+
+
+def configuracao_paralelismo(total_arquivos: int) -> Tuple[int, int]:
+    """Lê ETL_WORKERS e ETL_LIMITE_MEMORIA_MB do ambiente (com padrões seguros)"""
+    workers_env = os.environ.get('ETL_WORKERS', '').strip()
+    try:
+        workers = int(workers_env) if workers_env else (os.cpu_count() or 1)
+    except ValueError:
+        print(f"Aviso: ETL_WORKERS='{workers_env}' inválido - usando {os.cpu_count() or 1}")
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, total_arquivos))
+
+    # Executável PyInstaller não chama freeze_support: processos filhos reabririam o app
+    if getattr(sys, 'frozen', False) or hasattr(sys, '_MEIPASS'):
+        workers = 1
+
+    limite_env = os.environ.get('ETL_LIMITE_MEMORIA_MB', '').strip()
+    limite_mb = LIMITE_MEMORIA_PADRAO_MB
+    if limite_env:
+        try:
+            limite_mb = int(limite_env)
+        except ValueError:
+            print(f"Aviso: ETL_LIMITE_MEMORIA_MB='{limite_env}' inválido - usando padrão")
+    else:
+        try:
+            import psutil
+            # Metade da memória livre no início da extração
+            limite_mb = int(psutil.virtual_memory().available / (1024 * 1024) * 0.5)
+        except Exception:
+            pass
+    return workers, max(1, limite_mb)
+
+
+def estimar_memoria_mb(caminho_arquivo: str) -> float:
+    """Estimativa do pico de memória para ler e limpar um arquivo"""
+    return os.path.getsize(caminho_arquivo) / (1024 * 1024) * FATOR_MEMORIA_ARQUIVO
+
+
+def processar_arquivos_paralelo(
+    caminhos: List[str],
+    funcao: Callable[[str], pd.DataFrame],
+    workers: int,
+    limite_memoria_mb: Optional[int] = None,
+) -> Iterator[Tuple[str, Union[pd.DataFrame, Exception]]]:
+    """Processa cada arquivo em um processo separado e devolve (caminho, DataFrame ou erro).
+
+    Arquivos só são enviados ao pool enquanto a soma estimada de memória em uso
+    couber em `limite_memoria_mb` (sempre ao menos um arquivo em processamento).
+    Com workers=1 tudo roda no processo atual, na ordem recebida.
+    """
+    if workers <= 1 or len(caminhos) <= 1:
+        for caminho in caminhos:
+            try:
+                yield caminho, funcao(caminho)
+            except Exception as e:
+                yield caminho, e
+        return
+
+    limite = limite_memoria_mb or LIMITE_MEMORIA_PADRAO_MB
+    # Maiores primeiro: evita que o último arquivo grande rode sozinho no final
+    fila = sorted(caminhos, key=os.path.getsize, reverse=True)
+    print(f"Leitura paralela: {len(fila)} arquivos, {workers} processos, limite {limite:,} MB")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        em_andamento = {}
+        memoria_em_uso = 0.0
+        inicio = time.time()
+        while fila or em_andamento:
+            # Enviar enquanto houver processo livre e memória estimada disponível
+            while fila and len(em_andamento) < workers:
+                estimativa = estimar_memoria_mb(fila[0])
+                if em_andamento and memoria_em_uso + estimativa > limite:
+                    break
+                caminho = fila.pop(0)
+                futuro = pool.submit(funcao, caminho)
+                em_andamento[futuro] = (caminho, estimativa)
+                memoria_em_uso += estimativa
+
+            concluidos, _ = wait(list(em_andamento), return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                caminho, estimativa = em_andamento.pop(futuro)
+                memoria_em_uso -= estimativa
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    resultado = e
+                print(f"[{time.time() - inicio:.1f}s] Concluído: {os.path.basename(caminho)}")
+                yield caminho, resultado
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação dos arquivos por USI do Extracao.py (pasta arquivos/)
+KE5Z_veiculos, KE5Z_pwt e um KE5Z_<USI> por USI restante, gravados em paralelo
+(um processo por arquivo) em xlsx (xlsxwriter constant_memory), csv ou parquet.
+
+ETL_FORMATO_EXPORTACAO: xlsx (padrão), csv, parquet ou lista (ex.: "xlsx,parquet")
+ETL_WORKERS: processos usados (o mesmo da leitura dos TXT)
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl_ke5z import configuracao_paralelismo
+
+FORMATOS_EXPORTACAO = ('xlsx', 'csv', 'parquet')
+FORMATO_PADRAO = 'xlsx'
+LIMITE_LINHAS_EXCEL = 1_048_576
+NOME_ABA = 'Sheet1'  # mesmo nome do DataFrame.to_excel
+
+# CSV pensado para abrir direto no Excel em português
+OPCOES_CSV = {'sep': ';', 'decimal': ',', 'encoding': 'utf-8-sig', 'index': False}
+LINHAS_POR_PROGRESSO = 5_000  # intervalo entre chamadas do callback de progresso do xlsx
+
+
+def formatos_configurados() -> List[str]:
+    """Lê ETL_FORMATO_EXPORTACAO; valores inválidos são ignorados (com aviso)"""
+    valor = os.environ.get('ETL_FORMATO_EXPORTACAO', '').strip().lower()
+    if not valor:
+        return [FORMATO_PADRAO]
+    formatos = []
+    for formato in valor.replace(';', ',').split(','):
+        formato = formato.strip().lstrip('.')
+        if formato in FORMATOS_EXPORTACAO and formato not in formatos:
+            formatos.append(formato)
+        elif formato:
+            print(f"Aviso: formato de exportação '{formato}' desconhecido - ignorado")
+    return formatos or [FORMATO_PADRAO]
+
+
+def nome_arquivo_usi(usi: str) -> str:
+    """Normaliza o nome da USI para o nome do arquivo (KE5Z_<nome>)"""
+    return (usi.replace(" ", "_").replace("/", "_").replace("ç", "c").replace("ã", "a")
+            .replace("é", "e").replace("í", "i").replace("ó", "o").replace("ú", "u"))
+
+
+# ------------------------------------------------------------------ gravação de um arquivo
+def _valores_coluna(serie: pd.Series) -> List[Any]:
+    """Valores Python prontos para o xlsxwriter (nulos viram None = célula vazia)"""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return [None if pd.isna(v) else v.to_pydatetime() for v in serie]
+    return serie.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def _escritor_coluna(aba, serie: pd.Series, formato_data):
+    """Método do xlsxwriter para a coluna, sem o despacho por tipo do write() a cada célula"""
+    tipo = serie.dtype
+    if pd.api.types.is_datetime64_any_dtype(tipo):
+        return lambda linha, coluna, valor: aba.write_datetime(linha, coluna, valor, formato_data)
+    if pd.api.types.is_numeric_dtype(tipo) and not pd.api.types.is_bool_dtype(tipo):
+        return aba.write_number
+    if pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty'):
+        return aba.write_string
+    return aba.write
+
+
+class PlanilhaXlsx:
+    """Planilha xlsxwriter em modo constant_memory preenchida bloco a bloco.
+
+    As linhas vão direto para o arquivo, uma de cada vez, sem montar a planilha
+    inteira na memória como o openpyxl faz. O método de escrita de cada coluna vem
+    do primeiro bloco. `progresso` recebe as linhas já gravadas (a cada
+    LINHAS_POR_PROGRESSO); uma exceção lançada nele interrompe a gravação.
+    Acima do limite do Excel: ValueError, ou, com dividir_abas, abas <nome_aba>_2, _3...
+    total (se conhecido) permite recusar o arquivo antes de gravar qualquer linha.
+    """
+
+    def __init__(self, caminho: str, nome_aba: str = NOME_ABA,
+                 progresso: Optional[Callable[[int], None]] = None, dividir_abas: bool = False,
+                 total: Optional[int] = None):
+        import xlsxwriter
+
+        self.linhas_por_aba = LIMITE_LINHAS_EXCEL - 1  # a primeira linha é o cabeçalho
+        if total is not None and total > self.linhas_por_aba and not dividir_abas:
+            raise ValueError(f"{total:,} linhas excedem o limite do Excel ({LIMITE_LINHAS_EXCEL:,})")
+        self.nome_aba = nome_aba
+        self.progresso = progresso
+        self.dividir_abas = dividir_abas
+        self.registros = 0
+        self._livro = xlsxwriter.Workbook(caminho, {
+            'constant_memory': True,
+            'strings_to_urls': False,      # textos com "http" não viram links (limite de 65k por aba)
+            'strings_to_formulas': False,  # textos começando com "=" continuam texto
+            'strings_to_numbers': False,
+        })
+        self._formato_cabecalho = self._livro.add_format({'bold': True, 'border': 1, 'align': 'center',
+                                                          'valign': 'top'})
+        self._formato_data = self._livro.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        self._modelo: Optional[pd.DataFrame] = None  # primeiro bloco: define o tipo de cada coluna
+        self._aba = None
+        self._abas = 0
+        self._linha = 0
+        self._escritores = []
+
+    def _nova_aba(self):
+        self._abas += 1
+        self._aba = self._livro.add_worksheet(self.nome_aba if self._abas == 1 else f"{self.nome_aba}_{self._abas}")
+        self._aba.write_row(0, 0, [str(c) for c in self._modelo.columns], self._formato_cabecalho)
+        self._escritores = [_escritor_coluna(self._aba, self._modelo[c], self._formato_data)
+                            for c in self._modelo.columns]
+        self._linha = 0
+
+    def escrever(self, df: pd.DataFrame):
+        if self._modelo is None:
+            self._modelo = df
+        for valores in zip(*[_valores_coluna(df[c]) for c in df.columns]):
+            if self._aba is None or self._linha == self.linhas_por_aba:
+                if self._aba is not None and not self.dividir_abas:
+                    raise ValueError(f"Mais linhas que o limite do Excel ({LIMITE_LINHAS_EXCEL:,})")
+                self._nova_aba()
+            # constant_memory exige a gravação linha a linha, em ordem
+            self._linha += 1
+            for coluna, valor in enumerate(valores):
+                if valor is not None:
+                    self._escritores[coluna](self._linha, coluna, valor)
+            self.registros += 1
+            if self.progresso is not None and self.registros % LINHAS_POR_PROGRESSO == 0:
+                self.progresso(self.registros)
+
+    def fechar(self):
+        if self._aba is None and self._modelo is not None:
+            self._nova_aba()  # sem linhas: só o cabeçalho
+        self._livro.close()
+
+
+def gravar_xlsx(df: pd.DataFrame, caminho: str, nome_aba: str = NOME_ABA,
+                progresso: Optional[Callable[[int], None]] = None, dividir_abas: bool = False):
+    """Equivalente ao df.to_excel(caminho, index=False, sheet_name=nome_aba), em modo constant_memory
+    (PlanilhaXlsx com o DataFrame inteiro como único bloco)"""
+    planilha = PlanilhaXlsx(caminho, nome_aba, progresso, dividir_abas, total=len(df))
+    try:
+        planilha.escrever(df)
+        if progresso is not None:
+            progresso(len(df))
+    finally:
+        planilha.fechar()
+
+
+def gravar_arquivo(df: pd.DataFrame, caminho_base: str, formato: str) -> Dict[str, Any]:
+    """Grava df em caminho_base + '.<formato>' e devolve um resumo da gravação"""
+    inicio = time.perf_counter()
+    caminho = f"{caminho_base}.{formato}"
+    if formato == 'xlsx':
+        gravar_xlsx(df, caminho)
+    elif formato == 'csv':
+        df.to_csv(caminho, **OPCOES_CSV)
+    elif formato == 'parquet':
+        df.to_parquet(caminho, index=False)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    return {"caminho": caminho, "formato": formato, "registros": int(len(df)),
+            "segundos": time.perf_counter() - inicio}
+
+
+class EscritorExportacao:
+    """Um arquivo de exportação gravado bloco a bloco, com o mesmo conteúdo do
+    gravar_arquivo do DataFrame inteiro (extração em blocos)"""
+
+    def __init__(self, caminho_base: str, formato: str, total: Optional[int] = None):
+        if formato not in FORMATOS_EXPORTACAO:
+            raise ValueError(f"Formato de exportação desconhecido: {formato}")
+        self.formato = formato
+        self.caminho = f"{caminho_base}.{formato}"
+        self.registros = 0
+        self._inicio = time.perf_counter()
+        self._arquivo = None
+        self._cabecalho = True
+        self._parquet: Optional[pq.ParquetWriter] = None
+        self._schema: Optional[pa.Schema] = None
+        self._planilha = PlanilhaXlsx(self.caminho, total=total) if formato == 'xlsx' else None
+
+    def escrever(self, df: pd.DataFrame):
+        if self.formato == 'xlsx':
+            self._planilha.escrever(df)
+        elif self.formato == 'csv':
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho, 'w', encoding=OPCOES_CSV['encoding'], newline='')
+            opcoes = {k: v for k, v in OPCOES_CSV.items() if k != 'encoding'}
+            df.to_csv(self._arquivo, header=self._cabecalho, **opcoes)
+            self._cabecalho = False
+        else:
+            if self._parquet is None:
+                # Coluna sem valores no primeiro bloco: texto (o tipo das demais colunas de texto)
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                self._schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                                          for f in schema], metadata=schema.metadata)
+                self._parquet = pq.ParquetWriter(self.caminho, self._schema)
+            self._parquet.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        self.registros += len(df)
+
+    def fechar(self) -> Dict[str, Any]:
+        if self._planilha is not None:
+            self._planilha.fechar()
+        if self._arquivo is not None:
+            self._arquivo.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        return {"caminho": self.caminho, "formato": self.formato, "registros": int(self.registros),
+                "segundos": time.perf_counter() - self._inicio}
+
+
+# ------------------------------------------------------------------ etapa de exportação
+def grupos_exportacao(usis_disponiveis, usis_veiculos: List[str]) -> List[Tuple[str, str, List[str]]]:
+    """Lista de (rótulo, nome do arquivo sem extensão, USIs do arquivo) na regra do Extracao.py:
+    veículos agrupados, PWT sozinha e um arquivo por USI restante (exceto Others)"""
+    usis_disponiveis = list(usis_disponiveis)
+    grupos = []
+
+    usis_veiculos_existentes = [usi for usi in usis_veiculos if usi in usis_disponiveis]
+    if usis_veiculos_existentes:
+        grupos.append(('Veículos', 'KE5Z_veiculos', usis_veiculos_existentes))
+    else:
+        print("Nenhuma USI de veículos encontrada nos dados")
+
+    if 'PWT' in usis_disponiveis:
+        grupos.append(('PWT', 'KE5Z_pwt', ['PWT']))
+    else:
+        print("USI PWT não encontrada nos dados")
+
+    usis_ja_salvas = set(usis_veiculos_existentes + (['PWT'] if 'PWT' in usis_disponiveis else []))
+    for usi in usis_disponiveis:
+        if pd.notna(usi) and usi != 'Others' and usi not in usis_ja_salvas:
+            grupos.append((usi, f'KE5Z_{nome_arquivo_usi(usi)}', [usi]))
+    return grupos
+
+
+def planejar_exportacoes(df: pd.DataFrame, usis_veiculos: List[str]) -> List[Tuple[str, str, pd.DataFrame]]:
+    """Lista de (rótulo, nome do arquivo sem extensão, DataFrame) dos grupos_exportacao"""
+    if 'USI' not in df.columns:
+        return []
+    tarefas = []
+    for rotulo, nome, usis in grupos_exportacao(df['USI'].unique(), usis_veiculos):
+        df_grupo = df[df['USI'].isin(usis)]
+        if len(df_grupo) > 0:
+            tarefas.append((rotulo, nome, df_grupo))
+    return tarefas
+
+
+def exportar_arquivos(tarefas: List[Tuple[str, str, pd.DataFrame]], pasta_destino: str,
+                      formatos: List[str],
+                      ao_concluir: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Grava cada (rótulo, nome, DataFrame) em cada formato, um processo por arquivo.
+
+    Erros de um arquivo não interrompem os demais; ficam no resumo com a chave "erro".
+    `ao_concluir` recebe o resumo de cada arquivo assim que ele termina.
+    """
+    trabalhos = [(rotulo, os.path.join(pasta_destino, nome), df, formato)
+                 for rotulo, nome, df in tarefas for formato in formatos]
+    if not trabalhos:
+        return []
+    # Maiores primeiro: o último arquivo grande não fica rodando sozinho no final
+    trabalhos.sort(key=lambda t: len(t[2]), reverse=True)
+    workers, _ = configuracao_paralelismo(len(trabalhos))
+    print(f"Exportação: {len(trabalhos)} arquivo(s) {'/'.join(formatos)}, {workers} processo(s)")
+
+    resultados = []
+    inicio = time.time()
+
+    def registrar(rotulo, caminho_base, formato, obter_resumo):
+        resultados.append(_registrar(rotulo, caminho_base, formato, obter_resumo, inicio, ao_concluir))
+
+    if workers <= 1:
+        for rotulo, caminho_base, df, formato in trabalhos:
+            registrar(rotulo, caminho_base, formato, lambda: gravar_arquivo(df, caminho_base, formato))
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(gravar_arquivo, df, caminho_base, formato): (rotulo, caminho_base, formato)
+                   for rotulo, caminho_base, df, formato in trabalhos}
+        for futuro in as_completed(futuros):
+            rotulo, caminho_base, formato = futuros[futuro]
+            registrar(rotulo, caminho_base, formato, futuro.result)
+    return resultados
+
+
+def exportar_em_blocos(rotulo: str, nome: str, blocos: Iterable[pd.DataFrame], pasta_destino: str,
+                       formatos: List[str], total: Optional[int] = None,
+                       ao_concluir: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Grava um arquivo (rótulo, nome) em cada formato numa única passada pelos blocos,
+    sem montar o DataFrame do grupo (extração em blocos).
+
+    Mesmos resumos do exportar_arquivos; um formato com erro é abandonado sem
+    interromper os demais. total: linhas esperadas (limite do Excel).
+    """
+    caminho_base = os.path.join(pasta_destino, nome)
+    inicio = time.time()
+    escritores: Dict[str, EscritorExportacao] = {}
+    erros: Dict[str, Exception] = {}
+    for formato in formatos:
+        try:
+            escritores[formato] = EscritorExportacao(caminho_base, formato, total)
+        except Exception as e:
+            erros[formato] = e
+    try:
+        for bloco in blocos:
+            for formato, escritor in list(escritores.items()):
+                try:
+                    escritor.escrever(bloco)
+                except Exception as e:
+                    erros[formato] = e
+                    del escritores[formato]
+                    _fechar_sem_erro(escritor)
+    except Exception:
+        for escritor in escritores.values():
+            _fechar_sem_erro(escritor)
+        raise
+
+    resultados = []
+    for formato in formatos:
+        if formato in erros:
+            def obter_resumo(erro=erros[formato]):
+                raise erro
+        else:
+            obter_resumo = escritores[formato].fechar
+        resultados.append(_registrar(rotulo, caminho_base, formato, obter_resumo, inicio, ao_concluir))
+    return resultados
+
+
+def _fechar_sem_erro(escritor: EscritorExportacao):
+    try:
+        escritor.fechar()
+    except Exception:
+        pass
+
+
+def _registrar(rotulo: str, caminho_base: str, formato: str, obter_resumo: Callable[[], Dict[str, Any]],
+               inicio: float, ao_concluir: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+    """Resumo de um arquivo gravado (ou do erro), impresso e enviado a ao_concluir"""
+    try:
+        resumo = obter_resumo()
+        print(f"[{time.time() - inicio:.1f}s] Arquivo {formato} {rotulo} salvo: {resumo['caminho']} "
+              f"({resumo['registros']} registros, {resumo['segundos']:.1f}s)")
+    except Exception as e:
+        resumo = {"caminho": f"{caminho_base}.{formato}", "formato": formato, "erro": str(e)}
+        print(f"❌ Erro ao salvar arquivo {formato} {rotulo}: {e}")
+    resumo["rotulo"] = rotulo
+    if ao_concluir is not None:
+        ao_concluir(resumo)
+    return resumo
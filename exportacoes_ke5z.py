@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Exportações em segundo plano (download Excel/CSV dos dados filtrados)
+Cada pedido vira uma tarefa num pool limitado de threads: a página só enfileira e volta a
+responder, e o painel "Minhas exportações" acompanha o progresso, permite cancelar e
+oferece o arquivo pronto. Cada tarefa grava no seu próprio temporário (downloads_ke5z),
+então dois usuários exportando o mesmo período não disputam o mesmo nome de arquivo.
+
+Threads e não processos: o DataFrame filtrado é lido direto da memória, sem ser copiado
+(pickle) para outro processo. As tarefas ficam no processo (como o ARMAZEM), por usuário.
+"""
+
+import atexit
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+import streamlit as st
+
+from downloads_ke5z import MB, MIME_DOWNLOAD, formato_do_arquivo, gravar_download, limites_do_modo
+from exportacao_usi import NOME_ABA
+
+NA_FILA = "na fila"
+GRAVANDO = "gravando"
+CONCLUIDA = "concluída"
+CANCELADA = "cancelada"
+ERRO = "erro"
+ICONES_ESTADO = {NA_FILA: "⏳", GRAVANDO: "⚙️", CONCLUIDA: "✅", CANCELADA: "🚫", ERRO: "❌"}
+
+
+class ExportacaoCancelada(Exception):
+    """Lançada pelo callback de progresso para interromper a gravação"""
+
+
+class TarefaExportacao:
+    """Uma exportação: estado e progresso são lidos pela página a cada rerun"""
+
+    def __init__(self, usuario: str, df: pd.DataFrame, nome_arquivo: str, nome_aba: str,
+                 limites: Dict[str, int]):
+        self.id = uuid.uuid4().hex[:12]
+        self.usuario = usuario
+        self.nome_arquivo = nome_arquivo
+        self.formato = formato_do_arquivo(nome_arquivo)
+        self.nome_aba = nome_aba
+        self.limites = limites
+        self.total = len(df)
+        self.gravadas = 0
+        self.estado = NA_FILA
+        self.caminho: Optional[str] = None
+        self.tamanho = 0
+        self.erro: Optional[str] = None
+        self.criada_em = time.time()
+        self.concluida_em: Optional[float] = None
+        self._df: Optional[pd.DataFrame] = df
+        self._cancelar = threading.Event()
+        self._trava = threading.Lock()  # fim da gravação x descartar()
+
+    @property
+    def ativa(self) -> bool:
+        return self.estado in (NA_FILA, GRAVANDO)
+
+    @property
+    def progresso(self) -> float:
+        if self.estado == CONCLUIDA:
+            return 1.0
+        return min(self.gravadas / self.total, 1.0) if self.total else 0.0
+
+    def cancelar(self):
+        """Pede o cancelamento; a gravação para no próximo aviso de progresso"""
+        self._cancelar.set()
+
+    def _registrar_progresso(self, gravadas: int):
+        if self._cancelar.is_set():
+            raise ExportacaoCancelada()
+        self.gravadas = gravadas
+
+    def _executar(self):
+        estado, erro = CANCELADA, None
+        try:
+            if not self._cancelar.is_set():
+                self.estado = GRAVANDO
+                self.caminho = gravar_download(self._df, self.formato, self.nome_aba, self.limites,
+                                               self._registrar_progresso)
+                self.tamanho = os.path.getsize(self.caminho)
+                estado = CONCLUIDA
+        except ExportacaoCancelada:
+            pass
+        except Exception as e:
+            estado, erro = ERRO, str(e)
+        finally:
+            self._df = None  # libera a referência aos dados assim que termina
+        with self._trava:
+            if estado == CONCLUIDA and self._cancelar.is_set():
+                # Cancelada depois do último aviso de progresso
+                self.apagar_arquivo()
+                estado = CANCELADA
+            self.erro = erro
+            self.concluida_em = time.time()
+            self.estado = estado
+
+    def apagar_arquivo(self):
+        if self.caminho and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+        self.caminho = None
+
+    def descartar(self):
+        """Cancela e apaga o arquivo: já, se terminou; senão, ao terminar"""
+        with self._trava:
+            self._cancelar.set()
+            if not self.ativa:
+                self.apagar_arquivo()
+
+
+class FilaExportacoes:
+    """Pool limitado de threads + tarefas por usuário.
+
+    max_ativas_por_usuario: pedidos simultâneos (na fila ou gravando) de um usuário;
+    max_por_usuario: tarefas guardadas no painel (as terminadas mais antigas saem antes);
+    validade: segundos que um arquivo pronto fica disponível.
+    """
+
+    def __init__(self, max_workers: int = 2, max_ativas_por_usuario: int = 2,
+                 max_por_usuario: int = 5, validade: int = 30 * 60):
+        self._trava = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._tarefas: Dict[str, List[TarefaExportacao]] = {}
+        self.max_workers = max_workers
+        self.max_ativas_por_usuario = max_ativas_por_usuario
+        self.max_por_usuario = max_por_usuario
+        self.validade = validade
+
+    def _descartar(self, tarefas: List[TarefaExportacao]) -> List[TarefaExportacao]:
+        """Remove terminadas vencidas e o excesso (mais antigas primeiro); devolve as mantidas"""
+        agora = time.time()
+        mantidas = [t for t in tarefas if t.ativa or agora - t.concluida_em < self.validade]
+        while len(mantidas) > self.max_por_usuario:
+            terminadas = [t for t in mantidas if not t.ativa]
+            if not terminadas:
+                break
+            mantidas.remove(terminadas[0])
+        for tarefa in tarefas:
+            if tarefa not in mantidas:
+                tarefa.descartar()
+        return mantidas
+
+    def enviar(self, usuario: str, df: pd.DataFrame, nome_arquivo: str, nome_aba: str = NOME_ABA,
+               limites: Optional[Dict[str, int]] = None) -> TarefaExportacao:
+        """Enfileira a exportação de df (que não deve ser alterado depois); ValueError se recusada.
+
+        O custo do formato é verificado já na tarefa: se passar dos limites, ela termina em erro.
+        """
+        limites = limites or limites_do_modo()
+        formato_do_arquivo(nome_arquivo)
+        with self._trava:
+            tarefas = self._tarefas.setdefault(usuario, [])
+            if sum(t.ativa for t in tarefas) >= self.max_ativas_por_usuario:
+                raise ValueError(f"Já há {self.max_ativas_por_usuario} exportação(ões) em andamento - "
+                                 "aguarde terminar ou cancele uma delas")
+            tarefa = TarefaExportacao(usuario, df, nome_arquivo, nome_aba, limites)
+            tarefas.append(tarefa)
+            self._tarefas[usuario] = self._descartar(tarefas)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="exportacao")
+            pool = self._pool
+        pool.submit(tarefa._executar)
+        return tarefa
+
+    def tarefas(self, usuario: str) -> List[TarefaExportacao]:
+        """Tarefas do usuário, mais recente primeiro"""
+        with self._trava:
+            mantidas = self._tarefas[usuario] = self._descartar(self._tarefas.get(usuario, []))
+            return list(reversed(mantidas))
+
+    def remover(self, usuario: str, tarefa_id: str):
+        """Cancela (se ainda ativa), apaga o arquivo e tira a tarefa do painel"""
+        with self._trava:
+            tarefas = self._tarefas.get(usuario, [])
+            for tarefa in [t for t in tarefas if t.id == tarefa_id]:
+                tarefas.remove(tarefa)
+                tarefa.descartar()
+
+    def encerrar(self):
+        """Cancela tudo e apaga os arquivos (saída do processo)"""
+        with self._trava:
+            tarefas = [t for lista in self._tarefas.values() for t in lista]
+            self._tarefas.clear()
+            pool, self._pool = self._pool, None
+        for tarefa in tarefas:
+            tarefa.cancelar()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        for tarefa in tarefas:
+            tarefa.descartar()
+
+
+# Instância única do processo (compartilhada entre páginas e sessões)
+EXPORTACOES = FilaExportacoes()
+atexit.register(EXPORTACOES.encerrar)
+
+
+def enviar_exportacao(usuario: str, df: pd.DataFrame, nome_arquivo: str, nome_aba: str = NOME_ABA,
+                      limites: Optional[Dict[str, int]] = None) -> TarefaExportacao:
+    """Atalho: EXPORTACOES.enviar"""
+    return EXPORTACOES.enviar(usuario, df, nome_arquivo, nome_aba, limites)
+
+
+def _chave_preparo(tarefa: TarefaExportacao) -> str:
+    return f"exportacao_preparada_{tarefa.id}"
+
+
+def _oferecer_arquivo(tarefa: TarefaExportacao):
+    """Arquivo pronto: só é lido para o st.download_button depois de "Preparar download".
+
+    Sem isso cada rerun (e cada atualização do painel) releria até o limite do modo por
+    tarefa para a memória do servidor. O clique em Baixar desfaz o preparo.
+    """
+    chave = _chave_preparo(tarefa)
+    if not st.session_state.get(chave):
+        st.button("📦 Preparar download", key=f"preparar_{tarefa.id}", use_container_width=True,
+                  on_click=lambda: st.session_state.update({chave: True}))
+        return
+    with open(tarefa.caminho, 'rb') as arquivo:
+        st.download_button("📥 Baixar", data=arquivo, file_name=tarefa.nome_arquivo,
+                           mime=MIME_DOWNLOAD[tarefa.formato], key=f"baixar_{tarefa.id}",
+                           on_click=lambda: st.session_state.pop(chave, None),
+                           use_container_width=True)
+
+
+def _exibir_tarefa(usuario: str, tarefa: TarefaExportacao):
+    col_info, col_acao = st.columns([4, 1])
+    with col_info:
+        rotulo = f"{ICONES_ESTADO[tarefa.estado]} **{tarefa.nome_arquivo}** - {tarefa.estado}"
+        if tarefa.ativa:
+            st.progress(tarefa.progresso, text=f"{rotulo} ({tarefa.gravadas:,} de {tarefa.total:,} linhas)")
+        elif tarefa.estado == CONCLUIDA:
+            st.markdown(f"{rotulo} ({tarefa.total:,} linhas, {tarefa.tamanho / MB:.1f} MB)")
+        elif tarefa.estado == ERRO:
+            st.markdown(f"{rotulo}: {tarefa.erro}")
+        else:
+            st.markdown(rotulo)
+    with col_acao:
+        if tarefa.estado == CONCLUIDA and tarefa.caminho:
+            _oferecer_arquivo(tarefa)
+        rotulo_botao = "✖️ Cancelar" if tarefa.ativa else "🗑️ Remover"
+        if st.button(rotulo_botao, key=f"remover_{tarefa.id}", use_container_width=True):
+            EXPORTACOES.remover(usuario, tarefa.id)
+            st.session_state.pop(_chave_preparo(tarefa), None)
+            st.rerun()
+
+
+def exibir_minhas_exportacoes(usuario: str, intervalo: float = 1.0):
+    """Painel "Minhas exportações".
+
+    Só as tarefas ativas ficam no fragmento atualizado a cada `intervalo` s; as terminadas são
+    desenhadas fora dele, uma vez por rerun. Quando alguma ativa termina, um rerun completo a
+    move para baixo e, sem ativas, o fragmento nem é criado (a atualização para).
+    """
+    tarefas = EXPORTACOES.tarefas(usuario)
+    if not tarefas:
+        return
+    st.markdown("#### 📦 Minhas exportações")
+    ids_ativas = {t.id for t in tarefas if t.ativa}
+
+    if ids_ativas:
+        @st.fragment(run_every=intervalo)
+        def painel_ativas():
+            ativas = [t for t in EXPORTACOES.tarefas(usuario) if t.id in ids_ativas]
+            if any(not t.ativa for t in ativas) or len(ativas) < len(ids_ativas):
+                st.rerun(scope="app")
+            for tarefa in ativas:
+                _exibir_tarefa(usuario, tarefa)
+
+        painel_ativas()
+
+    for tarefa in tarefas:
+        if tarefa.id not in ids_ativas:
+            _exibir_tarefa(usuario, tarefa)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Filtros em cascata da barra lateral (USI, Período, Centro cst, Nº conta, Types, Fornecedor...)
+Cada coluna vira um vetor de códigos (os códigos da category, ou pd.factorize) e cada
+seleção vira uma tabela de consulta booleana sobre esses códigos: a cascata inteira é
+uma única máscara numpy e o DataFrame filtrado é montado uma vez, no final.
+
+Mesma regra do df[col].astype(str).isin(selecionadas) de antes, inclusive para nulos ("nan").
+
+Com `versao` (armazem_ke5z.versao_visao), índices e opções ficam no cache do processo (OPCOES):
+a chave é a versão dos dados + coluna + seleções ativas, sem hashear o DataFrame a cada rerun.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+OPCAO_TODOS = "Todos"
+ROTULO_NULO = "nan"  # o que astype(str) mostra para valores nulos
+
+
+class _IndiceColuna:
+    """Códigos por linha (-1 = nulo) e o texto de cada código"""
+
+    def __init__(self, serie: pd.Series):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            self.codigos = serie.cat.codes.to_numpy()
+            valores = serie.cat.categories
+        else:
+            self.codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+        self.rotulos = pd.Series(valores).astype(str).to_numpy(dtype=object)
+
+    def consulta(self, selecionadas: Iterable[str]) -> np.ndarray:
+        """Tabela booleana por código; a última posição responde pelos nulos (código -1)"""
+        selecionadas = {str(v) for v in selecionadas}
+        tabela = np.zeros(len(self.rotulos) + 1, dtype=bool)
+        tabela[:-1] = [rotulo in selecionadas for rotulo in self.rotulos]
+        tabela[-1] = ROTULO_NULO in selecionadas
+        return tabela
+
+    def presentes(self, mascara: Optional[np.ndarray]) -> List[str]:
+        """Textos dos valores não nulos nas linhas da máscara, em ordem alfabética"""
+        codigos = self.codigos if mascara is None else self.codigos[mascara]
+        contagem = np.bincount(codigos[codigos >= 0], minlength=len(self.rotulos))
+        return sorted(self.rotulos[contagem > 0].tolist())
+
+    def com_texto(self, texto: str) -> np.ndarray:
+        """Máscara das linhas cujo texto contém `texto` (sem diferenciar maiúsculas; nulos não entram)"""
+        achados = pd.Series(self.rotulos, dtype=object).str.contains(texto, case=False, regex=False)
+        return np.append(achados.to_numpy(dtype=bool), False)[self.codigos]
+
+
+class CacheOpcoes:
+    """LRU do processo: opções por (versão, coluna, seleções) e índices por (versão, coluna)"""
+
+    def __init__(self, max_opcoes: int = 512, max_indices: int = 48):
+        self._trava = threading.Lock()
+        self._tabelas = {"opcoes": OrderedDict(), "indices": OrderedDict()}
+        self._limites = {"opcoes": max_opcoes, "indices": max_indices}
+        self.acertos = 0
+        self.falhas = 0
+
+    def _obter(self, tabela: str, chave: Hashable, calcular: Callable[[], Any]) -> Any:
+        itens = self._tabelas[tabela]
+        with self._trava:
+            if chave in itens:
+                itens.move_to_end(chave)
+                self.acertos += 1
+                return itens[chave]
+            self.falhas += 1
+        valor = calcular()
+        with self._trava:
+            itens[chave] = valor
+            while len(itens) > self._limites[tabela]:
+                itens.popitem(last=False)
+        return valor
+
+    def opcoes(self, chave: Hashable, calcular: Callable[[], Tuple[str, ...]]) -> Tuple[str, ...]:
+        return self._obter("opcoes", chave, calcular)
+
+    def indice(self, chave: Hashable, calcular: Callable[[], "_IndiceColuna"]) -> "_IndiceColuna":
+        return self._obter("indices", chave, calcular)
+
+    def limpar(self):
+        with self._trava:
+            for itens in self._tabelas.values():
+                itens.clear()
+
+    def resumo(self) -> Dict[str, int]:
+        with self._trava:
+            return {"opcoes": len(self._tabelas["opcoes"]), "indices": len(self._tabelas["indices"]),
+                    "acertos": self.acertos, "falhas": self.falhas}
+
+
+# Instância única do processo (compartilhada entre páginas e sessões, como o ARMAZEM)
+OPCOES = CacheOpcoes()
+
+
+def indice_coluna(df: pd.DataFrame, coluna: str, versao: Optional[Hashable] = None) -> _IndiceColuna:
+    """Códigos e textos de uma coluna (com `versao`, do cache do processo) - usado também pela busca das tabelas"""
+    calcular = lambda: _IndiceColuna(df[coluna])
+    return calcular() if versao is None else OPCOES.indice((versao, coluna), calcular)
+
+
+class CascataFiltros:
+    """Filtros aplicados em sequência sobre um DataFrame base.
+
+    opcoes(col) devolve as opções considerando os filtros já selecionados;
+    selecionar(col, valores) restringe a máscara; resultado() monta o DataFrame.
+    `versao` identifica o conteúdo exato de `df` (None = sem cache entre reruns).
+    """
+
+    def __init__(self, df: pd.DataFrame, versao: Optional[Hashable] = None):
+        self.df = df
+        self.versao = versao
+        self.mascara: Optional[np.ndarray] = None  # None = nenhuma linha excluída
+        self.selecoes: Dict[str, List[str]] = {}
+        self._pendentes: List[str] = []  # seleções ainda fora da máscara
+        self._indices: Dict[str, _IndiceColuna] = {}
+
+    def _indice(self, coluna: str) -> _IndiceColuna:
+        indice = self._indices.get(coluna)
+        if indice is None:
+            indice = self._indices[coluna] = indice_coluna(self.df, coluna, self.versao)
+        return indice
+
+    def _mascara_atual(self) -> Optional[np.ndarray]:
+        """Aplica as seleções pendentes (só quando alguma opção ou o resultado precisa)"""
+        for coluna in self._pendentes:
+            indice = self._indice(coluna)
+            filtro = indice.consulta(self.selecoes[coluna])[indice.codigos]
+            self.mascara = filtro if self.mascara is None else (self.mascara & filtro)
+        self._pendentes = []
+        return self.mascara
+
+    def chave_selecoes(self) -> tuple:
+        """Descrição canônica dos filtros ativos (a máscara é um E, a ordem não importa)"""
+        return tuple(sorted((coluna, tuple(sorted(set(valores)))) for coluna, valores in self.selecoes.items()))
+
+    def versao_resultado(self) -> Optional[Hashable]:
+        """Versão do DataFrame de resultado(), para uma cascata sobre ele"""
+        return None if self.versao is None else (self.versao, self.chave_selecoes())
+
+    def tem_coluna(self, coluna: str) -> bool:
+        return coluna in self.df.columns
+
+    def opcoes(self, coluna: str, incluir_todos: bool = True) -> List[str]:
+        """["Todos"] + valores disponíveis após os filtros anteriores"""
+        todos = [OPCAO_TODOS] if incluir_todos else []
+        if not self.tem_coluna(coluna):
+            return todos
+        calcular = lambda: tuple(self._indice(coluna).presentes(self._mascara_atual()))
+        if self.versao is None:
+            return todos + list(calcular())
+        return todos + list(OPCOES.opcoes((self.versao, coluna, self.chave_selecoes()), calcular))
+
+    def selecionar(self, coluna: str, valores) -> None:
+        """Aplica a seleção de um widget; vazio ou "Todos" não filtra"""
+        if valores is None or not self.tem_coluna(coluna):
+            return
+        if isinstance(valores, (str, int, float, np.integer, np.floating)):
+            valores = [valores]
+        valores = [str(v) for v in valores]
+        if not valores or OPCAO_TODOS in valores:
+            return
+        if coluna in self.selecoes:
+            # Segunda seleção na mesma coluna: vale a interseção
+            valores = [v for v in valores if v in set(self.selecoes[coluna])]
+        self.selecoes[coluna] = valores
+        self._pendentes.append(coluna)
+
+    def quantidade(self) -> int:
+        mascara = self._mascara_atual()
+        return int(len(self.df) if mascara is None else mascara.sum())
+
+    def resultado(self) -> pd.DataFrame:
+        """DataFrame filtrado (uma única seleção de linhas)"""
+        mascara = self._mascara_atual()
+        if mascara is None:
+            return self.df.copy(deep=False)
+        return self.df[mascara]
+
+
+def limpar_opcoes():
+    """Atalho: OPCOES.limpar"""
+    OPCOES.limpar()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Exibição de tabelas de valores (pivôs por Período, USI, Nº conta, Types) no st.dataframe
+Os números continuam numéricos: o formato de moeda vai no column_config (quem formata é o
+navegador, no idioma dele: 1.234.567,89 em pt-BR) e as cores por sinal saem de máscaras
+sobre o array inteiro, sem apply/map célula a célula nem colunas de texto "R$ ...".
+Tabelas pequenas coloridas usam o Styler, com o formato "R$ 1.234,56" de antes.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Formato do navegador: agrupa milhares com os separadores do idioma (printf não agrupa);
+# o "R$" vai na ajuda das colunas
+FORMATO_MOEDA = "localized"
+AJUDA_MOEDA = "Valores em R$"
+# Formato do caminho com Styler (mesmo texto que o app mostrava antes)
+FORMATO_MOEDA_STYLER = {"formatter": "R$ {:,.2f}", "decimal": ",", "thousands": "."}
+COR_NEGATIVO = 'color: #e74c3c; font-weight: bold;'  # Vermelho para negativo
+COR_POSITIVO = 'color: #27ae60; font-weight: bold;'  # Verde para positivo
+# O Styler serializa CSS e texto por célula (~0,05 ms cada): acima disso, sem cores
+LIMITE_CELULAS_COR = 2000
+
+
+def configuracao_moeda(df: pd.DataFrame, formato: Optional[str] = FORMATO_MOEDA) -> Dict[str, object]:
+    """column_config de moeda para todas as colunas numéricas (formato None = o do Styler)"""
+    return {str(coluna): st.column_config.NumberColumn(format=formato, help=AJUDA_MOEDA)
+            for coluna in df.select_dtypes(include=['number']).columns}
+
+
+def cores_por_sinal(df: pd.DataFrame) -> pd.DataFrame:
+    """CSS por célula (verde > 0, vermelho < 0) calculado de uma vez para a tabela toda"""
+    cores = np.full(df.shape, '', dtype=object)
+    numericas = np.array([pd.api.types.is_numeric_dtype(t) for t in df.dtypes])
+    if numericas.any():
+        valores = df.loc[:, numericas].to_numpy(dtype=float)
+        cores[:, numericas] = np.select([valores < 0, valores > 0], [COR_NEGATIVO, COR_POSITIVO], '')
+    return pd.DataFrame(cores, index=df.index, columns=df.columns)
+
+
+def exibir_tabela_valores(df: pd.DataFrame, colorir: bool = False, **kwargs):
+    """st.dataframe com valores em moeda (e cores por sinal, se pedido) mantendo os números"""
+    tabela = df.copy(deep=False)
+    # Nomes de coluna em texto: o column_config é por nome e o Arrow não aceita nomes mistos (int/str)
+    tabela.columns = [str(coluna) for coluna in tabela.columns]
+    if colorir and tabela.size <= LIMITE_CELULAS_COR:
+        # O formato do column_config passaria na frente do Styler: aqui quem formata é o Styler
+        numericas = list(tabela.select_dtypes(include=['number']).columns)
+        estilo = (tabela.style.apply(cores_por_sinal, axis=None)
+                  .format(subset=numericas, na_rep="", **FORMATO_MOEDA_STYLER))
+        st.dataframe(estilo, column_config=configuracao_moeda(tabela, formato=None), **kwargs)
+        return
+    if colorir:
+        limite = f"{LIMITE_CELULAS_COR:,}".replace(',', '.')
+        st.caption(f"Tabela com mais de {limite} células: exibida sem as cores por sinal")
+    # "localized" mostra até 3 casas: centavos arredondados antes
+    numericas = tabela.select_dtypes(include=['number']).columns
+    if len(numericas) > 0:
+        tabela[numericas] = tabela[numericas].round(2)
+    st.dataframe(tabela, column_config=configuracao_moeda(tabela), **kwargs)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Conversão vetorizada de números no formato brasileiro do SAP
+Ex.: "1.234.567,89" -> 1234567.89 | "82,02-" -> -82.02 | "-5" -> -5.0
+
+Trabalha direto sobre os buffers de uma string Arrow (offsets + bytes), sem criar
+objetos Python por valor e sem colunas intermediárias de texto.
+"""
+
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Acima disso a mantissa deixa de ser exata em float64: essas linhas vão para o caminho pandas
+MAX_DIGITOS_EXATOS = 15
+# Contadores por linha são somados em campos de 8 bits
+MAX_BYTES_POR_VALOR = 255
+
+# Tabelas por byte: valor do dígito e contadores empacotados (dígito | vírgula | sinal | outros)
+_DIGITO = np.zeros(256, dtype=np.float64)
+_DIGITO[48:58] = np.arange(10)
+_CONTADORES = np.full(256, 1 << 24, dtype=np.int32)  # "outros" = caractere inválido
+_CONTADORES[48:58] = 1
+_CONTADORES[ord(',')] = 1 << 8
+_CONTADORES[ord('-')] = 1 << 16
+_CONTADORES[ord('+')] = 1 << 16
+_CONTADORES[ord('.')] = 0  # separador de milhar: ignorado
+_POTENCIAS_10 = np.power(10.0, np.arange(MAX_BYTES_POR_VALOR + 1))
+_MENOS, _MAIS = ord('-'), ord('+')
+
+
+def _converter_pandas(valores: pd.Series) -> np.ndarray:
+    """Caminho antigo (remove '.', troca ',' por '.', to_numeric) - usado só para linhas atípicas"""
+    texto = (
+        valores.astype(str)
+        .str.replace('.', '', regex=False)
+        .str.replace(',', '.', regex=False)
+    )
+    return pd.to_numeric(texto, errors='coerce').to_numpy(dtype='float64')
+
+
+def _converter_array(arr: pa.Array) -> np.ndarray:
+    """Converte um pa.StringArray/BinaryArray (ou large_*) em float64 sem objetos Python"""
+    n = len(arr)
+    if n == 0:
+        return np.empty(0, dtype='float64')
+
+    if pa.types.is_binary(arr.type):
+        arr = arr.view(pa.string())
+    elif pa.types.is_large_binary(arr.type):
+        arr = arr.view(pa.large_string())
+    # Espaços nas pontas (alinhamento do SAP) não fazem parte do número
+    arr = pc.ascii_trim(arr, characters=' \t')
+
+    tipo_offset = np.int64 if pa.types.is_large_string(arr.type) else np.int32
+    _, buf_offsets, buf_dados = arr.buffers()
+    offsets = np.frombuffer(buf_offsets, dtype=tipo_offset)[arr.offset:arr.offset + n + 1].astype(np.int64)
+    dados = (np.frombuffer(buf_dados, dtype=np.uint8)[offsets[0]:offsets[-1]]
+             if buf_dados is not None else np.empty(0, dtype=np.uint8))
+    offsets -= offsets[0]
+    inicios, fins = offsets[:-1], offsets[1:]
+    tamanhos = fins - inicios
+    com_texto = tamanhos > 0
+
+    def somar_por_linha(valores_por_byte, dtype):
+        soma = np.zeros(n, dtype=dtype)
+        if com_texto.any():
+            soma[com_texto] = np.add.reduceat(valores_por_byte, inicios[com_texto])
+        return soma
+
+    # Uma passada para os contadores de cada linha
+    contadores = somar_por_linha(_CONTADORES[dados], np.int32)
+    n_digitos = contadores & 0xFF
+    n_virgulas = (contadores >> 8) & 0xFF
+    n_sinais = (contadores >> 16) & 0xFF
+    n_outros = (contadores >> 24) & 0xFF
+
+    # Sinal só vale na primeira ou na última posição ("-82,02" ou "82,02-", padrão SAP)
+    pos_sinal = np.flatnonzero((dados == _MENOS) | (dados == _MAIS))
+    linha_sinal = np.searchsorted(fins, pos_sinal, side='right')
+    sinal_na_ponta = (pos_sinal == inicios[linha_sinal]) | (pos_sinal == fins[linha_sinal] - 1)
+    sinal_ok = np.ones(n, dtype=bool)
+    sinal_ok[linha_sinal[~sinal_na_ponta]] = False
+    negativo = np.zeros(n, dtype=bool)
+    negativo[linha_sinal[dados[pos_sinal] == _MENOS]] = True
+
+    valido = (
+        (n_outros == 0) & (n_virgulas <= 1) & (n_sinais <= 1) & sinal_ok
+        & (n_digitos > 0) & (n_digitos <= MAX_DIGITOS_EXATOS)
+        & (tamanhos <= MAX_BYTES_POR_VALOR)
+    )
+
+    # Mantissa inteira: cada dígito pesa 10^(dígitos à sua direita na mesma linha)
+    digitos_acumulados = np.zeros(len(dados) + 1, dtype=np.int32)
+    np.cumsum((dados >= 48) & (dados <= 57), out=digitos_acumulados[1:])
+    digitos_ate_fim = np.repeat(digitos_acumulados[fins], tamanhos) - digitos_acumulados[1:]
+    pesos = _DIGITO[dados] * _POTENCIAS_10[np.minimum(digitos_ate_fim, MAX_BYTES_POR_VALOR)]
+    mantissa = somar_por_linha(pesos, np.float64)
+
+    # Casas decimais = dígitos depois da vírgula
+    decimais = np.zeros(n, dtype=np.int64)
+    pos_virgula = np.flatnonzero(dados == ord(','))
+    linha_virgula = np.searchsorted(fins, pos_virgula, side='right')
+    decimais[linha_virgula] = digitos_acumulados[fins[linha_virgula]] - digitos_acumulados[pos_virgula + 1]
+
+    # Mantissa exata (< 2^53) dividida por potência de 10 exata: mesmo arredondamento do to_numeric
+    resultado = mantissa / _POTENCIAS_10[np.minimum(decimais, MAX_BYTES_POR_VALOR)]
+    np.negative(resultado, out=resultado, where=negativo)
+
+    # Nulos e vazios continuam NaN; linhas fora do padrão usam a conversão antiga
+    nulos = arr.is_null().to_numpy(zero_copy_only=False)
+    atipicos = ~valido & ~nulos & com_texto
+    resultado[~valido] = np.nan
+    if atipicos.any():
+        textos = pd.Series(arr.filter(pa.array(atipicos)).to_pylist(), dtype=object)
+        resultado[atipicos] = _converter_pandas(textos)
+    return resultado
+
+
+def _para_arrow(valores) -> Union[pa.Array, pa.ChunkedArray]:
+    """Obtém um array Arrow de texto/bytes com o mínimo de cópias possível"""
+    if isinstance(valores, (pa.Array, pa.ChunkedArray)):
+        return valores
+    if isinstance(valores, pd.Series):
+        if isinstance(valores.dtype, pd.ArrowDtype) or str(valores.dtype) == 'string[pyarrow]':
+            return pa.array(valores.array)
+        try:
+            return pa.array(valores, type=pa.string(), from_pandas=True)
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            # Objetos mistos (ex.: int e str na mesma coluna)
+            return pa.array(valores.where(valores.isna(), valores.astype(str)), type=pa.string(), from_pandas=True)
+    valores = list(valores)
+    if valores and isinstance(next((v for v in valores if v is not None), None), (bytes, bytearray)):
+        return pa.array(valores, type=pa.binary())
+    return pa.array(valores, type=pa.string(), from_pandas=True)
+
+
+def converter_numero_br(valores, valor_padrao: Optional[float] = None):
+    """Converte números no formato SAP/brasileiro para float64.
+
+    Aceita pd.Series (object, string[pyarrow]), pa.Array/ChunkedArray de texto ou
+    bytes, ou uma lista de str/bytes. Valores vazios ou inválidos viram NaN (ou
+    `valor_padrao`, se informado). Para pd.Series devolve uma Series com o mesmo
+    índice; para os demais, um np.ndarray.
+    """
+    indice = valores.index if isinstance(valores, pd.Series) else None
+    nome = valores.name if isinstance(valores, pd.Series) else None
+
+    if isinstance(valores, pd.Series) and pd.api.types.is_numeric_dtype(valores.dtype):
+        # Coluna já numérica (ex.: arquivo sem separadores)
+        resultado = valores.to_numpy(dtype='float64', na_value=np.nan)
+    else:
+        arr = _para_arrow(valores)
+        if isinstance(arr, pa.ChunkedArray):
+            partes = [_converter_array(c) for c in arr.chunks]
+            resultado = np.concatenate(partes) if partes else np.empty(0, dtype='float64')
+        elif pa.types.is_null(arr.type):
+            resultado = np.full(len(arr), np.nan)
+        else:
+            resultado = _converter_array(arr)
+
+    if valor_padrao is not None:
+        resultado = np.where(np.isnan(resultado), valor_padrao, resultado)
+
+    if indice is not None:
+        return pd.Series(resultado, index=indice, name=nome, dtype='float64')
+    return resultado
@@ -14,6 +14,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from auth_simple import (verificar_autenticacao, exibir_header_usuario,
                          eh_administrador, verificar_status_aprovado, is_modo_cloud, get_modo_operacao)
+from dataset_ke5z import GRUPO_POR_VISAO, contar_registros, existe_parquet_ke5z, periodos_disponiveis
+from armazem_ke5z import carregar_waterfall, limpar_armazem, versao_visao
+from filtros_ke5z import CascataFiltros
+from tabela_ke5z import exibir_tabela_paginada
+from downloads_ke5z import MB, ROTULOS_FORMATO, limites_do_modo
+from exportacoes_ke5z import enviar_exportacao, exibir_minhas_exportacoes
 
 # Detectar se está rodando no executável PyInstaller
 def get_base_path():
@@ -68,110 +74,18 @@ else:
     st.sidebar.info("💻 **Modo Completo** (Mensal)")
 
 
-# Sistema de cache inteligente para otimização de memória e conexão
-@st.cache_data(
-    ttl=3600,
-    max_entries=3,  # Cache para os 3 tipos de arquivo
-    show_spinner=True,
-    persist="disk"
-)
-def load_data_optimized(arquivo_tipo="completo"):
-    """Carrega dados com otimização inteligente de memória - WATERFALL OTIMIZADO
+# Dados compartilhados por todas as sessões e páginas (armazem_ke5z): lidos uma vez por processo
+def load_data_optimized(arquivo_tipo="completo", periodo=None):
+    """Carrega as colunas do waterfall do armazém compartilhado - WATERFALL OTIMIZADO
     
     Args:
         arquivo_tipo: "completo", "main" (sem Others), "others", ou "main_filtered"
+        periodo: lê só a partição deste mês (None = todos)
     """
-    
-    # PRIORIDADE 1: Tentar arquivo waterfall otimizado (68% menor + Nº conta!)
-    base_path = get_base_path()
-    arquivo_waterfall = os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")
-    if os.path.exists(arquivo_waterfall):
-        try:
-            df = pd.read_parquet(arquivo_waterfall)
-            # Aplicar filtro se necessário baseado no tipo solicitado
-            if arquivo_tipo == "main" and 'USI' in df.columns:
-                df = df[df['USI'] != 'Others'].copy()
-            elif arquivo_tipo == "others" and 'USI' in df.columns:
-                df = df[df['USI'] == 'Others'].copy()
-            elif arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-                df = df[df['USI'] != 'Others'].copy()
-            # arquivo_tipo "completo" usa todos os dados do waterfall
-            
-            st.sidebar.success("⚡ **WATERFALL OTIMIZADO**\nUsando arquivo 68% menor + Nº conta!")
-            return df
-        except Exception as e:
-            st.sidebar.warning(f"⚠️ Erro no arquivo waterfall: {str(e)}")
-    
-    # FALLBACK: Usar arquivos originais se waterfall não estiver disponível
-    arquivos_disponiveis = {
-        "completo": "KE5Z.parquet",
-        "main": "KE5Z_main.parquet", 
-        "others": "KE5Z_others.parquet",
-        "main_filtered": "KE5Z.parquet"  # Usa arquivo completo mas filtra Others
-    }
-    
-    nome_arquivo = arquivos_disponiveis.get(arquivo_tipo, "KE5Z.parquet")
-    arquivo_parquet = os.path.join(base_path, "KE5Z", nome_arquivo)
-    
-    try:
-        if not os.path.exists(arquivo_parquet):
-            # Se arquivo específico não existe, tentar arquivo completo
-            if arquivo_tipo != "completo":
-                st.warning(f"⚠️ Arquivo {nome_arquivo} não encontrado, carregando dados completos...")
-                # CORREÇÃO: Evitar loop infinito - carregar diretamente o arquivo completo
-                arquivo_completo = os.path.join(base_path, "KE5Z", "KE5Z.parquet")
-                if os.path.exists(arquivo_completo):
-                    df = pd.read_parquet(arquivo_completo)
-                    # Aplicar filtro especial para main_filtered (cloud mode)
-                    if arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-                        df = df[df['USI'] != 'Others'].copy()
-                        st.sidebar.info(f"🔄 Filtro aplicado: {len(df):,} registros (Others removidos)")
-                    return df
-                else:
-                    raise FileNotFoundError(f"Arquivo completo também não encontrado: {arquivo_completo}")
-            raise FileNotFoundError(f"Arquivo não encontrado: {arquivo_parquet}")
-        
-        # Verificar tamanho do arquivo
-        file_size_mb = os.path.getsize(arquivo_parquet) / (1024 * 1024)
-        
-        # Carregar dados
-        df = pd.read_parquet(arquivo_parquet)
-        
-        # Aplicar filtro especial para main_filtered (cloud mode)
-        if arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-            # Filtrar para remover Others, simulando arquivo main
-            df = df[df['USI'] != 'Others'].copy()
-            st.sidebar.info(f"🔄 Filtro aplicado: {len(df):,} registros (Others removidos)")
-        
-        # Otimizar tipos de dados para economizar memória (sem alterar conteúdo)
-        original_memory = df.memory_usage(deep=True).sum() / (1024 * 1024)
-        
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                unique_ratio = df[col].nunique() / len(df)
-                if unique_ratio < 0.5:  # Menos de 50% valores únicos
-                    df[col] = df[col].astype('category')
-        
-        # Converter floats para tipos menores
-        for col in df.select_dtypes(include=['float64']).columns:
-            df[col] = pd.to_numeric(df[col], downcast='float')
-
-        
-        # Converter ints para tipos menores
-        for col in df.select_dtypes(include=['int64']).columns:
-            df[col] = pd.to_numeric(df[col], downcast='integer')
-        
-        # Calcular economia de memória
-        optimized_memory = df.memory_usage(deep=True).sum() / (1024 * 1024)
-        saved_memory = original_memory - optimized_memory
-        
-        if saved_memory > 1:  # Economia significativa
-            st.sidebar.success(f"💾 Memória economizada: {saved_memory:.1f}MB")
-        
-        return df
-        
-    except Exception as e:
-        raise e
+    periodos = None if periodo is None else [periodo]
+    df = carregar_waterfall(arquivo_tipo, os.path.join(get_base_path(), "KE5Z"), periodos)
+    st.sidebar.success("⚡ **WATERFALL OTIMIZADO**\nUsando arquivo 68% menor + Nº conta!")
+    return df
 
 # Interface para seleção de dados (COMPACTO)
 st.sidebar.markdown("---")
@@ -182,7 +96,7 @@ base_path = get_base_path()
 arquivos_status = {}
 for tipo, nome in [("completo", "KE5Z.parquet"), ("main", "KE5Z_main.parquet"), ("others", "KE5Z_others.parquet")]:
     caminho = os.path.join(base_path, "KE5Z", nome)
-    arquivos_status[tipo] = os.path.exists(caminho)
+    arquivos_status[tipo] = existe_parquet_ke5z(caminho)
 
 # Opções disponíveis baseadas nos arquivos existentes
 opcoes_dados = []
@@ -268,14 +182,16 @@ if is_cloud:
     st.sidebar.success("⚡ **Otimização Ativa**\n"
                       "Dashboard otimizado para um mês por vez!")
 
-# Carregar dados
+# Períodos e total de registros vêm das partições do dataset; os dados são lidos só para o mês escolhido
+pasta_ke5z = os.path.join(get_base_path(), "KE5Z")
+grupo_selecionado = GRUPO_POR_VISAO.get(opcao_selecionada)
 try:
-    df_total = load_data_optimized(opcao_selecionada)
-    st.sidebar.success("✅ Dados carregados com sucesso")
+    periodos_opcoes = periodos_disponiveis(pasta_ke5z, grupo_selecionado)
+    total_registros = contar_registros(pasta_ke5z, grupo_selecionado)
     
     # Log informativo
     if not is_cloud:
-        st.sidebar.info(f"📊 {len(df_total)} registros carregados")
+        st.sidebar.info(f"📊 {total_registros:,} registros disponíveis")
         
 except FileNotFoundError:
     st.error("❌ Arquivo de dados não encontrado!")
@@ -303,9 +219,6 @@ except Exception as e:
     
     st.stop()
 
-# Filtrar o df_total com a coluna 'USI' que não seja nula (incluindo 'Others')
-df_total = df_total[df_total['USI'].notna()]
-
 # Header com informações do usuário e botão de logout
 col1, col2, col3 = st.columns([2, 1, 1])
 with col1:
@@ -315,6 +228,7 @@ with col1:
 with col2:
     if st.button("🔄 Recarregar Dados"):
         st.cache_data.clear()
+        limpar_armazem()
         st.rerun()
 
 with col3:
@@ -326,74 +240,69 @@ st.markdown("---")
 st.sidebar.markdown("---")
 st.sidebar.subheader("📅 Filtro Principal - Período")
 
-# Verificar se existe coluna 'Período' para filtro
-if 'Período' in df_total.columns:
-    periodos_disponiveis = sorted(df_total['Período'].dropna().unique())
-    
+if periodos_opcoes:
     # Seleção de período único
     periodo_selecionado = st.sidebar.selectbox(
         "🎯 Selecione UM período para análise:",
-        options=periodos_disponiveis,
-        index=len(periodos_disponiveis)-1 if periodos_disponiveis else 0  # Último período disponível
+        options=periodos_opcoes,
+        index=len(periodos_opcoes)-1  # Último período disponível
     )
     
-    # Aplicar filtro de período
-    df_mes = df_total[df_total['Período'] == periodo_selecionado].copy()
+    # Ler apenas o período selecionado
+    df_mes = load_data_optimized(opcao_selecionada, periodo_selecionado)
     
     st.sidebar.success(f"📊 **Período {periodo_selecionado}**")
     st.sidebar.info(f"📈 {len(df_mes):,} registros neste período")
     
     # Mostrar economia de dados
-    if len(df_total) > 0:
-        reducao_percentual = (1 - len(df_mes) / len(df_total)) * 100
+    if total_registros > 0:
+        reducao_percentual = (1 - len(df_mes) / total_registros) * 100
         st.sidebar.success(f"⚡ Redução: {reducao_percentual:.1f}% dos dados")
     else:
         st.sidebar.warning("⚠️ Nenhum dado disponível")
     
 else:
     st.sidebar.error("❌ Coluna 'Mes' ou 'Período' não encontrada nos dados!")
-    df_mes = df_total.copy()
+    df_mes = load_data_optimized(opcao_selecionada)
     periodo_selecionado = "Todos"
 
+# Filtrar o df_mes com a coluna 'USI' que não seja nula (incluindo 'Others')
+df_mes = df_mes[df_mes['USI'].notna()]
+
 # Filtros (COMPACTO)
 st.sidebar.markdown("---")
 st.sidebar.markdown("**🔍 Filtros**")
 
+# Filtros em cascata (filtros_ke5z): uma máscara única, DataFrame montado uma vez no final;
+# opções no cache do processo pela versão dos dados + filtros ativos
+periodos_carga = None if periodo_selecionado == "Todos" else [periodo_selecionado]
+versao_mes = (versao_visao("waterfall", opcao_selecionada, os.path.join(get_base_path(), "KE5Z"), periodos_carga),
+              "USI não nula")
+cascata = CascataFiltros(df_mes, versao_mes)
+
 # Filtro USI
-if 'USI' in df_mes.columns:
-    usi_opcoes = ["Todos"] + sorted(df_mes['USI'].dropna().unique().tolist())
+if cascata.tem_coluna('USI'):
+    usi_opcoes = cascata.opcoes('USI')
     usi_selecionada = st.sidebar.multiselect(
         "Selecione USI:",
         usi_opcoes,
         default=["Todos"]
     )
-    
-    if "Todos" not in usi_selecionada and usi_selecionada:
-        df_mes = df_mes[df_mes['USI'].isin(usi_selecionada)]
-
-# Cache para opções de filtros (otimização de performance)
-@st.cache_data(ttl=1800, max_entries=3)
-def get_filter_options(df, column_name):
-    """Obtém opções de filtro com cache para melhor performance"""
-    if column_name in df.columns:
-        return ["Todos"] + sorted(df[column_name].dropna().astype(str).unique().tolist())
-    return ["Todos"]
-
-# Filtro 3: Centro cst (com cache otimizado)
-if 'Centro cst' in df_mes.columns:
-    centro_cst_opcoes = get_filter_options(df_mes, 'Centro cst')
+    cascata.selecionar('USI', usi_selecionada)
+
+# Filtro 3: Centro cst
+if cascata.tem_coluna('Centro cst'):
+    centro_cst_opcoes = cascata.opcoes('Centro cst')
     centro_cst_selecionado = st.sidebar.selectbox("Selecione o Centro cst:", centro_cst_opcoes)
-    if centro_cst_selecionado != "Todos":
-        df_mes = df_mes[df_mes['Centro cst'].astype(str) == str(centro_cst_selecionado)]
+    cascata.selecionar('Centro cst', centro_cst_selecionado)
 
-# Filtro 4: Conta contábil (com cache otimizado)
-if 'Nº conta' in df_mes.columns:
-    conta_contabil_opcoes = get_filter_options(df_mes, 'Nº conta')[1:]  # Remove "Todos" para multiselect
+# Filtro 4: Conta contábil
+if cascata.tem_coluna('Nº conta'):
+    conta_contabil_opcoes = cascata.opcoes('Nº conta', incluir_todos=False)
     conta_contabil_selecionadas = st.sidebar.multiselect("Selecione a Conta contábil:", conta_contabil_opcoes)
-    if conta_contabil_selecionadas:
-        df_mes = df_mes[df_mes['Nº conta'].astype(str).isin(conta_contabil_selecionadas)]
+    cascata.selecionar('Nº conta', conta_contabil_selecionadas)
 
-# Filtros principais (com cache otimizado)
+# Filtros principais
 filtros_principais = [
     ("Type 05", "Type 05", "multiselect"),
     ("Type 06", "Type 06", "multiselect"), 
@@ -404,12 +313,11 @@ filtros_principais = [
 ]
 
 for col_name, label, widget_type in filtros_principais:
-    if col_name in df_mes.columns:
-        opcoes = get_filter_options(df_mes, col_name)
+    if cascata.tem_coluna(col_name):
+        opcoes = cascata.opcoes(col_name)
         if widget_type == "multiselect":
             selecionadas = st.sidebar.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-            if selecionadas and "Todos" not in selecionadas:
-                df_mes = df_mes[df_mes[col_name].astype(str).isin(selecionadas)]
+            cascata.selecionar(col_name, selecionadas)
 
 # Filtros avançados (expansível)
 with st.sidebar.expander("🔍 Filtros Avançados"):
@@ -421,8 +329,8 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
     ]
     
     for col_name, label, widget_type in filtros_avancados:
-        if col_name in df_mes.columns:
-            opcoes = get_filter_options(df_mes, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             # Limitar opções para melhor performance
             if len(opcoes) > 101:  # 100 + "Todos"
                 opcoes = opcoes[:101]
@@ -430,8 +338,9 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
             
             if widget_type == "multiselect":
                 selecionadas = st.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-                if selecionadas and "Todos" not in selecionadas:
-                    df_mes = df_mes[df_mes[col_name].astype(str).isin(selecionadas)]
+                cascata.selecionar(col_name, selecionadas)
+
+df_mes = cascata.resultado()
 
 # Resumo (COMPACTO)
 st.sidebar.markdown("---")
@@ -484,28 +393,6 @@ if not df_mes.empty:
     # Layout em abas para organizar visualizações
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Gráficos Principais", "📈 Análise USI", "🔍 Detalhes", "📋 Tabela"])
     
-    # Função específica para carregar dados waterfall APENAS para gráficos
-    @st.cache_data(ttl=1800, max_entries=2, persist="disk")
-    def load_waterfall_for_graphs():
-        """Carrega dados waterfall APENAS para gráficos (otimização de memória)"""
-        base_path = get_base_path()
-        arquivo_waterfall = os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")
-        if os.path.exists(arquivo_waterfall):
-            try:
-                df_waterfall = pd.read_parquet(arquivo_waterfall)
-                
-                # Aplicar mesmo filtro de mês que foi aplicado aos dados originais
-                if 'Período' in df_waterfall.columns:
-                    df_waterfall_mes = df_waterfall[df_waterfall['Período'] == periodo_selecionado].copy()
-                else:
-                    df_waterfall_mes = df_waterfall.copy()
-                
-                return df_waterfall_mes
-            except Exception as e:
-                st.warning(f"⚠️ Erro no waterfall para gráficos: {e}")
-                return df_mes  # Fallback para dados da tabela
-        return df_mes  # Fallback para dados da tabela
-
     with tab1:
         col1, col2 = st.columns(2)
         
@@ -533,7 +420,7 @@ if not df_mes.empty:
                 
                 # Indicador de otimização
                 base_path = get_base_path()
-                if os.path.exists(os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")):
+                if existe_parquet_ke5z(os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")):
                     st.caption("⚡ Gráfico otimizado com dados waterfall")
         
         with col2:
@@ -560,7 +447,7 @@ if not df_mes.empty:
                 
                 # Indicador de otimização
                 base_path = get_base_path()
-                if os.path.exists(os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")):
+                if existe_parquet_ke5z(os.path.join(base_path, "KE5Z", "KE5Z_waterfall.parquet")):
                     st.caption("⚡ Gráfico otimizado com dados waterfall")
     
     with tab2:
@@ -643,157 +530,40 @@ if not df_mes.empty:
         # Tabela completa filtrada - USA ARQUIVOS ORIGINAIS (não waterfall)
         st.subheader(f"📋 Dados Completos - Período {periodo_selecionado}")
         
-        # Carregar dados originais para tabela completa
-        @st.cache_data(ttl=3600, max_entries=2, persist="disk")
-        def load_original_data_for_table(arquivo_tipo):
-            """Carrega dados dos arquivos originais APENAS para a tabela completa"""
-            base_path = get_base_path()
-            arquivos_originais = {
-                "main": "KE5Z_main.parquet",
-                "others": "KE5Z_others.parquet", 
-                "completo": "KE5Z.parquet",
-                "main_filtered": "KE5Z.parquet"
-            }
-            
-            nome_arquivo = arquivos_originais.get(arquivo_tipo, "KE5Z.parquet")
-            arquivo_path = os.path.join(base_path, "KE5Z", nome_arquivo)
-            
-            if os.path.exists(arquivo_path):
-                df = pd.read_parquet(arquivo_path)
-                
-                # Aplicar filtro para main_filtered
-                if arquivo_tipo == "main_filtered" and 'USI' in df.columns:
-                    df = df[df['USI'] != 'Others'].copy()
-                
-                return df
-            return pd.DataFrame()
-        
         # TABELA: Usar dados waterfall (otimizado para visualização)
         st.info("⚡ **Tabela otimizada:** Usando dados waterfall para melhor performance")
         
-        # Opção para limitar número de linhas mostradas
-        max_rows = st.selectbox("Máximo de linhas para exibir:", [100, 500, 1000, 5000], index=1)
+        # Tabela paginada: navega por todos os registros enviando só a página atual
+        exibir_tabela_paginada(df_mes, cascata.versao_resultado(), "tabela_mes")
         
-        if len(df_mes) > max_rows:
-            st.info(f"📊 Mostrando primeiras {max_rows:,} linhas de {len(df_mes):,} registros totais")
-            st.dataframe(df_mes.head(max_rows), use_container_width=True)
-        else:
-            st.dataframe(df_mes, use_container_width=True)
+        # DOWNLOAD: o teto vem do custo medido do formato (tamanho e tempo), não de um número fixo de linhas
+        limites = limites_do_modo()
+        ambiente = "Streamlit Cloud" if is_modo_cloud() else "ambiente local"
+        # Fila de exportações por usuário (compartilhada entre as sessões do mesmo login)
+        usuario_exportacao = st.session_state.get('usuario_nome', 'anonimo')
         
-        # VERIFICAÇÃO PREVENTIVA DE LIMITES
-        limite_cloud = 50000  # Limite seguro para Streamlit Cloud
-        limite_local = 100000  # Limite para ambiente local
-        limite_atual = limite_cloud if is_modo_cloud() else limite_local
+        col_formato, col_limite = st.columns([2, 3])
+        with col_formato:
+            formato_download = st.selectbox("Formato do download:", list(ROTULOS_FORMATO),
+                                            format_func=ROTULOS_FORMATO.get, key="formato_download_mes")
+        with col_limite:
+            st.caption(f"📊 {len(df_mes):,} linhas | Limite para {ambiente}: até {limites['bytes'] / MB:,.0f} MB "
+                       f"e ~{limites['segundos'] // 60} min de gravação estimados")
+            if formato_download == 'xlsx':
+                st.caption("Excel grava ~3 mil linhas/s e abre uma aba nova a cada 1.048.575 linhas; "
+                           "para o mês inteiro prefira Parquet ou CSV compactado")
         
-        # Mostrar aviso preventivo se necessário
-        if len(df_mes) > limite_atual:
-            ambiente = "Streamlit Cloud" if is_modo_cloud() else "ambiente local"
-            st.error(f"❌ **DOWNLOAD INDISPONÍVEL**")
-            st.error(f"📊 **Dados filtrados:** {len(df_mes):,} linhas")
-            st.error(f"⚠️ **Limite para {ambiente}:** {limite_atual:,} linhas")
-            st.warning("🔧 **Como resolver:**")
-            st.warning("• Aplique mais filtros na barra lateral")
-            st.warning("• Use filtros de Type 05, Type 06, ou Fornecedor")
-            st.warning("• Selecione categorias específicas")
-            if is_modo_cloud():
-                st.info("💡 **Streamlit Cloud:** Limite de 50.000 linhas para estabilidade")
-            else:
-                st.info("💡 **Ambiente Local:** Limite de 100.000 linhas recomendado")
+        # Botão para download: a exportação roda em segundo plano (painel "Minhas exportações")
+        if st.button("📥 Preparar Download"):
+            # Os MESMOS dados da tabela exibida (df_mes não é alterado depois; a tarefa só lê)
+            try:
+                enviar_exportacao(usuario_exportacao, df_mes,
+                                  f"KE5Z_Periodo_{periodo_selecionado}_filtrado.{formato_download}", limites=limites)
+                st.success(f"✅ **Exportação iniciada:** {len(df_mes):,} linhas - acompanhe abaixo e continue usando o dashboard")
+            except ValueError as e:
+                st.error(f"❌ {e}")
         
-        # Mostrar status e botão (sempre disponível no modo local, restrito no cloud)
-        if not is_modo_cloud() or len(df_mes) <= limite_atual:
-            # Mostrar status do arquivo
-            if is_modo_cloud() and limite_atual > 0:
-                percentual = (len(df_mes) / limite_atual) * 100
-                if percentual < 50:
-                    st.success(f"✅ **Download seguro:** {len(df_mes):,} linhas ({percentual:.1f}% do limite cloud)")
-                elif percentual < 80:
-                    st.warning(f"⚠️ **Download moderado:** {len(df_mes):,} linhas ({percentual:.1f}% do limite cloud)")
-                else:
-                    st.warning(f"🔥 **Download no limite:** {len(df_mes):,} linhas ({percentual:.1f}% do limite cloud)")
-            else:
-                # Modo local - mostrar status em relação ao limite do Excel
-                if len(df_mes) < 100000:
-                    st.success(f"✅ **Download ótimo:** {len(df_mes):,} linhas (modo local)")
-                elif len(df_mes) < 500000:
-                    st.info(f"📊 **Download moderado:** {len(df_mes):,} linhas (modo local)")
-                else:
-                    st.warning(f"⚠️ **Download grande:** {len(df_mes):,} linhas - pode demorar mais")
-            
-            # Botão para download
-            if st.button("📥 Preparar Download Excel"):
-                with st.spinner("Preparando arquivo com dados originais completos..."):
-                    # Criar arquivo Excel com dados originais filtrados
-                    output_filename = f"KE5Z_Periodo_{periodo_selecionado}_filtrado.xlsx"
-                    
-                    # SOLUÇÃO: Usar os MESMOS dados da tabela (df_mes) para garantir consistência
-                    # Isso garante que o Excel tenha EXATAMENTE os mesmos dados e filtros da tabela exibida
-                    df_download = df_mes.copy()
-                    
-                    # VERIFICAÇÃO DE LIMITES PARA STREAMLIT CLOUD
-                    limite_cloud = 50000  # Limite seguro para Streamlit Cloud
-                    limite_local = 100000  # Limite para ambiente local
-                    limite_atual = limite_cloud if is_modo_cloud() else limite_local
-                    
-                    if len(df_download) > limite_atual:
-                        ambiente = "Streamlit Cloud" if is_modo_cloud() else "ambiente local"
-                        st.error(f"❌ **DOWNLOAD BLOQUEADO**")
-                        st.error(f"📊 **Arquivo muito grande:** {len(df_download):,} linhas")
-                        st.error(f"⚠️ **Limite para {ambiente}:** {limite_atual:,} linhas")
-                        st.warning("🔧 **Soluções:**")
-                        st.warning("• Aplique mais filtros para reduzir o número de linhas")
-                        st.warning("• Use filtros de Type 05, Type 06, ou Fornecedor")
-                        st.warning("• Selecione períodos específicos")
-                        if is_modo_cloud():
-                            st.info("💡 **Dica:** No modo cloud, recomendamos máximo 50.000 linhas para estabilidade")
-                        st.stop()
-                    
-                    st.success(f"✅ **Download aprovado:** {len(df_download):,} linhas (limite: {limite_atual:,})")
-                    st.info("🎯 **Download otimizado:** Usando exatamente os mesmos dados da tabela exibida")
-                    st.info("✅ **Filtros garantidos:** Todos os filtros aplicados estão incluídos")
-                    
-                    # Mostrar informações sobre o arquivo
-                    ambiente = "Streamlit Cloud" if is_modo_cloud() else "Local"
-                    st.success(f"✅ **Arquivo preparado:** {len(df_download):,} linhas ({ambiente})")
-                    
-                    # Informações sobre limites
-                    if len(df_download) < 10000:
-                        st.info("🚀 **Excelente:** Arquivo pequeno, download muito rápido!")
-                    elif len(df_download) < 25000:
-                        st.info("✅ **Bom:** Arquivo de tamanho moderado, download estável")
-                    elif len(df_download) < limite_atual:
-                        st.warning(f"⚠️ **Atenção:** Arquivo grande ({len(df_download):,} linhas), mas dentro do limite")
-                    
-                    # Mostrar progresso em relação ao limite
-                    if limite_atual > 0:
-                        percentual_limite = (len(df_download) / limite_atual) * 100
-                        st.progress(min(percentual_limite / 100, 1.0))
-                        st.caption(f"📊 Uso do limite: {percentual_limite:.1f}% de {limite_atual:,} linhas")
-                    else:
-                        st.caption(f"📊 {len(df_download):,} linhas (sem limite)")
-                    
-                    # Salvar temporariamente com verificação adicional
-                    try:
-                        df_download.to_excel(output_filename, index=False)
-                        file_size_mb = os.path.getsize(output_filename) / (1024 * 1024)
-                        st.info(f"📁 **Arquivo Excel criado:** {file_size_mb:.1f} MB")
-                    except Exception as e:
-                        st.error(f"❌ Erro ao criar arquivo Excel: {e}")
-                        st.stop()
-                    
-                    # Ler como bytes para download
-                    with open(output_filename, 'rb') as f:
-                        bytes_data = f.read()
-                    
-                    st.download_button(
-                        label="📥 Download Excel",
-                        data=bytes_data,
-                        file_name=output_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    
-                    # Remover arquivo temporário
-                    os.remove(output_filename)
+        exibir_minhas_exportacoes(usuario_exportacao)
 
 else:
     st.warning("⚠️ Nenhum dado encontrado para os filtros selecionados.")
@@ -804,7 +574,7 @@ st.markdown("---")
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    if 'Período' in df_total.columns:
+    if periodos_opcoes:
         st.info(f"📅 **Período Selecionado**: {periodo_selecionado}")
 
 with col2:
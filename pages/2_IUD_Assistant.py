@@ -23,6 +23,11 @@ st.set_page_config(
 # Verificar autenticação
 from auth_simple import (verificar_autenticacao, verificar_status_aprovado, exibir_header_usuario,
                          is_modo_cloud, get_modo_operacao)
+from dataset_ke5z import existe_parquet_ke5z
+from armazem_ke5z import carregar_waterfall, pasta_ke5z_padrao, versao_visao
+from filtros_ke5z import CascataFiltros
+from waterfall_ke5z import eixo_x, etapas_waterfall, matrizes_em_cache, ordenar_meses, variacoes_por_etapa, volume_mes
+from formatacao_ke5z import exibir_tabela_valores
 verificar_autenticacao()
 
 # Indicador de navegação no topo
@@ -71,8 +76,8 @@ st.sidebar.subheader("🗂️ Seleção de Dados")
 # Verificar quais arquivos estão disponíveis
 arquivos_status = {}
 for tipo, nome in [("completo", "KE5Z.parquet"), ("main", "KE5Z_main.parquet"), ("others", "KE5Z_others.parquet")]:
-    caminho = os.path.join("KE5Z", nome)
-    arquivos_status[tipo] = os.path.exists(caminho)
+    caminho = os.path.join(pasta_ke5z_padrao(), nome)
+    arquivos_status[tipo] = existe_parquet_ke5z(caminho)
 
 # Opções disponíveis baseadas nos arquivos existentes
 opcoes_dados = []
@@ -133,114 +138,28 @@ def encontrar_coluna_periodo(df):
             return col
     return None
 
-# Carregar dados com tratamento robusto
-@st.cache_data(show_spinner=True, max_entries=3, ttl=3600, persist="disk")
+# Carregar dados com tratamento robusto (armazem_ke5z: lidos uma vez por processo)
 def load_data(arquivo_tipo="completo"):
-    """Carrega os dados do arquivo parquet com tratamento de erro - WATERFALL OTIMIZADO"""
-    
-    # PRIORIDADE 1: Tentar arquivo waterfall otimizado (72% menor!)
-    arquivo_waterfall = os.path.join("_internal", "KE5Z", "KE5Z_waterfall.parquet")
-    if os.path.exists(arquivo_waterfall):
-        try:
-            df = pd.read_parquet(arquivo_waterfall)
-            # Aplicar filtro se necessário baseado no tipo solicitado
-            if arquivo_tipo == "main" and 'USI' in df.columns:
-                df = df[df['USI'] != 'Others'].copy()
-            elif arquivo_tipo == "others" and 'USI' in df.columns:
-                df = df[df['USI'] == 'Others'].copy()
-            # arquivo_tipo "completo" usa todos os dados do waterfall
-            
-            # Aplicar otimizações de memória (já otimizado mas pode melhorar mais)
-            try:
-                for col in df.columns:
-                    if df[col].dtype == 'object':
-                        unique_ratio = (df[col].nunique(dropna=True) / max(1, len(df)))
-                        if unique_ratio < 0.5:
-                            df[col] = df[col].astype('category')
-                for col in df.select_dtypes(include=['float64']).columns:
-                    df[col] = pd.to_numeric(df[col], downcast='float')
-                for col in df.select_dtypes(include=['int64']).columns:
-                    df[col] = pd.to_numeric(df[col], downcast='integer')
-            except Exception:
-                pass
-            
-            # Validar dados básicos
-            if df.empty:
-                st.error("❌ Arquivo waterfall está vazio")
-                return pd.DataFrame()
-                
-            # Incluir todos os dados válidos
-            df = df[df['USI'].notna()]
-            
-            st.sidebar.success("⚡ **WATERFALL OTIMIZADO**\nUsando arquivo 72% menor!")
-            return df
-            
-        except Exception as e:
-            st.sidebar.warning(f"⚠️ Erro no arquivo waterfall: {str(e)}")
-    
-    # FALLBACK: Usar arquivos originais se waterfall não estiver disponível
-    arquivos_disponiveis = {
-        "completo": "KE5Z.parquet",
-        "main": "KE5Z_main.parquet", 
-        "others": "KE5Z_others.parquet"
-    }
-    
-    nome_arquivo = arquivos_disponiveis.get(arquivo_tipo, "KE5Z.parquet")
-    arquivo_parquet = os.path.join("KE5Z", nome_arquivo)
-    
+    """Carrega as colunas do waterfall do armazém compartilhado - WATERFALL OTIMIZADO"""
     try:
-        if not os.path.exists(arquivo_parquet):
-            # Se arquivo específico não existe, tentar arquivo completo
-            if arquivo_tipo != "completo":
-                st.warning(f"⚠️ Arquivo {nome_arquivo} não encontrado, carregando dados completos...")
-                # CORREÇÃO: Evitar loop infinito - carregar diretamente o arquivo completo
-                arquivo_completo = os.path.join("KE5Z", "KE5Z.parquet")
-                if os.path.exists(arquivo_completo):
-                    df = pd.read_parquet(arquivo_completo)
-                    # Aplicar filtro baseado no tipo solicitado
-                    if 'USI' in df.columns:
-                        if arquivo_tipo == "main":
-                            df = df[df['USI'] != 'Others'].copy()
-                        elif arquivo_tipo == "others":
-                            df = df[df['USI'] == 'Others'].copy()
-                    return df
-                else:
-                    st.error(f"❌ Arquivo completo também não encontrado: {arquivo_completo}")
-                    return pd.DataFrame()
-            st.error(f"❌ Arquivo não encontrado: {arquivo_parquet}")
-            return pd.DataFrame()
-        
-        df = pd.read_parquet(arquivo_parquet)
-        # Compactar memória sem alterar dados
-        try:
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    unique_ratio = (df[col].nunique(dropna=True) / max(1, len(df)))
-                    if unique_ratio < 0.5:
-                        df[col] = df[col].astype('category')
-            for col in df.select_dtypes(include=['float64']).columns:
-                df[col] = pd.to_numeric(df[col], downcast='float')
-            for col in df.select_dtypes(include=['int64']).columns:
-                df[col] = pd.to_numeric(df[col], downcast='integer')
-        except Exception:
-            pass
-        
-        # Validar dados básicos
-        if df.empty:
-            st.error("❌ Arquivo parquet está vazio")
-            return pd.DataFrame()
-            
-        # Incluir todos os dados (incluindo Others)
-        df = df[df['USI'].notna()]
-        
-        return df
-        
+        df = carregar_waterfall(arquivo_tipo)
     except Exception as e:
         st.error(f"❌ Erro ao carregar dados: {str(e)}")
         if is_cloud:
             st.info("☁️ Problemas de carregamento são comuns no Streamlit Cloud com arquivos grandes")
         return pd.DataFrame()
 
+    # Validar dados básicos
+    if df.empty:
+        st.error("❌ Arquivo waterfall está vazio")
+        return pd.DataFrame()
+
+    # Incluir todos os dados válidos
+    df = df[df['USI'].notna()]
+
+    st.sidebar.success("⚡ **WATERFALL OTIMIZADO**\nUsando arquivo 72% menor!")
+    return df
+
 # Carregar dados
 with st.spinner("🔄 Carregando dados..."):
     df_total = load_data(opcao_selecionada)
@@ -265,30 +184,28 @@ if not is_cloud:
 # Aplicar filtros padrão do projeto
 st.sidebar.title("Filtros")
 
+# Filtros em cascata (filtros_ke5z): uma máscara única, DataFrame montado uma vez no final;
+# opções no cache do processo pela versão dos dados + filtros ativos
+cascata = CascataFiltros(df_total, (versao_visao("waterfall", opcao_selecionada), "USI não nula"))
+
 # Filtro 1: USINA (com tratamento de erro)
 try:
-    usina_opcoes = ["Todos"] + sorted(df_total['USI'].dropna().astype(str).unique().tolist()) if 'USI' in df_total.columns else ["Todos"]
+    usina_opcoes = cascata.opcoes('USI')
     default_usina = ["Veículos"] if "Veículos" in usina_opcoes else ["Todos"]
     usina_selecionada = st.sidebar.multiselect("Selecione a USINA:", usina_opcoes, default=default_usina)
 except Exception as e:
     st.sidebar.error(f"Erro nos filtros: {str(e)}")
     usina_selecionada = ["Todos"]
-
-# Filtrar o DataFrame com base na USI
-if "Todos" in usina_selecionada or not usina_selecionada:
-    df_filtrado = df_total.copy()
-else:
-    df_filtrado = df_total[df_total['USI'].astype(str).isin(usina_selecionada)]
+cascata.selecionar('USI', usina_selecionada)
 
 # Filtro 2: Período (com tratamento de erro e correção de encoding)
 try:
-    coluna_periodo = encontrar_coluna_periodo(df_filtrado)
+    coluna_periodo = encontrar_coluna_periodo(df_total)
     
     if coluna_periodo is not None:
-        periodo_opcoes = ["Todos"] + sorted(df_filtrado[coluna_periodo].dropna().astype(str).unique().tolist())
+        periodo_opcoes = cascata.opcoes(coluna_periodo)
         periodo_selecionado = st.sidebar.selectbox("Selecione o Período:", periodo_opcoes)
-        if periodo_selecionado != "Todos":
-            df_filtrado = df_filtrado[df_filtrado[coluna_periodo].astype(str) == str(periodo_selecionado)]
+        cascata.selecionar(coluna_periodo, periodo_selecionado)
     else:
         st.sidebar.warning("⚠️ Coluna 'Período' não encontrada nos dados")
         periodo_selecionado = "Todos"
@@ -298,38 +215,28 @@ except Exception as e:
 
 # Filtro 3: Centro cst (com tratamento de erro)
 try:
-    if 'Centro cst' in df_filtrado.columns:
-        centro_cst_opcoes = ["Todos"] + sorted(df_filtrado['Centro cst'].dropna().astype(str).unique().tolist())
+    if cascata.tem_coluna('Centro cst'):
+        centro_cst_opcoes = cascata.opcoes('Centro cst')
         centro_cst_selecionado = st.sidebar.selectbox("Selecione o Centro cst:", centro_cst_opcoes)
-        if centro_cst_selecionado != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['Centro cst'].astype(str) == str(centro_cst_selecionado)]
+        cascata.selecionar('Centro cst', centro_cst_selecionado)
 except Exception as e:
     st.sidebar.error(f"Erro no filtro Centro cst: {str(e)}")
 
 # Filtro 4: Conta contábil (com tratamento de erro)
 try:
-    if 'Nº conta' in df_filtrado.columns:
-        conta_contabil_opcoes = sorted(df_filtrado['Nº conta'].dropna().astype(str).unique().tolist())
+    if cascata.tem_coluna('Nº conta'):
+        conta_contabil_opcoes = cascata.opcoes('Nº conta', incluir_todos=False)
         # Limitar opções no cloud para evitar problemas
         if is_cloud and len(conta_contabil_opcoes) > 100:
             conta_contabil_opcoes = conta_contabil_opcoes[:100]
             st.sidebar.info("☁️ Limitando opções para melhor performance")
         
         conta_contabil_selecionadas = st.sidebar.multiselect("Selecione a Conta contábil:", conta_contabil_opcoes)
-        if conta_contabil_selecionadas:
-            df_filtrado = df_filtrado[df_filtrado['Nº conta'].astype(str).isin(conta_contabil_selecionadas)]
+        cascata.selecionar('Nº conta', conta_contabil_selecionadas)
 except Exception as e:
     st.sidebar.error(f"Erro no filtro Conta contábil: {str(e)}")
 
-# Cache para opções de filtros (otimização de performance)
-@st.cache_data(ttl=1800, max_entries=3)
-def get_filter_options_ia(df, column_name):
-    """Obtém opções de filtro com cache para melhor performance"""
-    if column_name in df.columns:
-        return ["Todos"] + sorted(df[column_name].dropna().astype(str).unique().tolist())
-    return ["Todos"]
-
-# Filtros principais (com cache otimizado)
+# Filtros principais
 filtros_principais = [
     ("Type 05", "Type 05", "multiselect"),
     ("Type 06", "Type 06", "multiselect"), 
@@ -341,8 +248,8 @@ filtros_principais = [
 
 for col_name, label, widget_type in filtros_principais:
     try:
-        if col_name in df_filtrado.columns:
-            opcoes = get_filter_options_ia(df_filtrado, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             
             # Limitar opções no cloud para evitar problemas
             if is_cloud and len(opcoes) > 51:  # 50 + "Todos"
@@ -351,8 +258,7 @@ for col_name, label, widget_type in filtros_principais:
             
             if widget_type == "multiselect":
                 selecionadas = st.sidebar.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-                if selecionadas and "Todos" not in selecionadas:
-                    df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+                cascata.selecionar(col_name, selecionadas)
     except Exception as e:
         st.sidebar.error(f"Erro no filtro {label}: {str(e)}")
 
@@ -367,8 +273,8 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
     
     for col_name, label, widget_type in filtros_avancados:
         try:
-            if col_name in df_filtrado.columns:
-                opcoes = get_filter_options_ia(df_filtrado, col_name)
+            if cascata.tem_coluna(col_name):
+                opcoes = cascata.opcoes(col_name)
                 # Limitar opções para melhor performance
                 if len(opcoes) > 51:  # 50 + "Todos"
                     opcoes = opcoes[:51]
@@ -376,11 +282,12 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
                 
                 if widget_type == "multiselect":
                     selecionadas = st.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-                    if selecionadas and "Todos" not in selecionadas:
-                        df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+                    cascata.selecionar(col_name, selecionadas)
         except Exception as e:
             st.error(f"Erro no filtro {label}: {str(e)}")
 
+df_filtrado = cascata.resultado()
+
 # Exibir informações dos filtros (com tratamento de erro)
 try:
     st.sidebar.markdown("---")
@@ -730,15 +637,25 @@ with tab2:
     # Meses disponíveis a partir de 'Período'
     coluna_periodo = encontrar_coluna_periodo(df_filtrado)
     if coluna_periodo is not None:
-        meses_disponiveis = sorted(df_filtrado[coluna_periodo].dropna().astype(str).unique().tolist())
+        # Ordem cronológica (a ponte encadeia os meses nessa ordem)
+        meses_disponiveis = ordenar_meses(df_filtrado[coluna_periodo].dropna().astype(str))
     else:
         st.error("❌ Coluna 'Período' não encontrada para análise waterfall")
         st.stop()
+    ponte = st.radio("Modo:", ["Dois meses", "Ponte mês a mês"], horizontal=True, key="modo_waterfall_iud",
+                     help="Ponte mês a mês: encadeia cada mês ao seguinte, com as categorias que explicam cada etapa") == "Ponte mês a mês"
     col_a, col_b, col_c = st.columns([1, 1, 1])
-    with col_a:
-        mes_inicial = st.selectbox("Mês inicial:", meses_disponiveis, index=0)
-    with col_b:
-        mes_final = st.selectbox("Mês final:", meses_disponiveis, index=len(meses_disponiveis) - 1)
+    if ponte:
+        with col_a:
+            mes_inicial, mes_final = st.select_slider("Meses da ponte:", options=meses_disponiveis,
+                                                      value=(meses_disponiveis[0], meses_disponiveis[-1]))
+        meses_ponte = meses_disponiveis[meses_disponiveis.index(mes_inicial):meses_disponiveis.index(mes_final) + 1]
+    else:
+        with col_a:
+            mes_inicial = st.selectbox("Mês inicial:", meses_disponiveis, index=0)
+        with col_b:
+            mes_final = st.selectbox("Mês final:", meses_disponiveis, index=len(meses_disponiveis) - 1)
+        meses_ponte = [mes_inicial, mes_final]
 
     # Dimensão de categoria
     dims_cat = [c for c in ['Type 05', 'Type 06', 'Type 07', 'Fornecedor', 'USI'] if c in df_filtrado.columns]
@@ -747,17 +664,16 @@ with tab2:
         st.stop()
     chosen_dim = st.selectbox("Dimensão da categoria:", dims_cat, index=0)
 
-    # Categorias disponíveis e multiselect com 'Todos' (normalização por strip)
-    def _norm_list(seq):
-        return sorted([str(x).strip() for x in seq if str(x).strip() != ""])
-    cats_all = _norm_list(df_filtrado[chosen_dim].dropna().unique().tolist())
-    vol_mf = (df_filtrado[df_filtrado[coluna_periodo].astype(str) == str(mes_final)]
-              .groupby(chosen_dim)['Valor'].sum().sort_values(ascending=False))
+    # Matriz categoria x mês (cache por filtros + dimensão): categorias (normalizadas por strip),
+    # volumes e variações saem dela
+    matriz, totais_mes = matrizes_em_cache(df_filtrado, cascata.versao_resultado(), dims_cat, chosen_dim,
+                                           coluna_periodo, 'Valor')
+    cats_all = matriz.index.tolist()
     # Slider com máximo e padrão iguais ao total de categorias
     total_cats = max(1, len(cats_all))
     with col_c:
         max_cats = st.slider(f"Top N categorias (Total: {total_cats}):", 1, total_cats, total_cats)
-    vol_index = _norm_list(list(vol_mf.index))
+    vol_index = sorted(volume_mes(matriz, str(mes_final)).index.tolist())
     default_cats = vol_index[:max_cats] if len(vol_index) else cats_all[:max_cats]
     # Filtrar defaults que não estejam em options
     cats_options = ['Todos'] + cats_all
@@ -774,44 +690,13 @@ with tab2:
         st.info("Selecione meses diferentes para comparar.")
         st.stop()
 
-    # Totais de mês (todas as categorias)
-    total_m1_all = float(df_filtrado[df_filtrado[coluna_periodo].astype(str) == str(mes_inicial)]['Valor'].sum())
-    total_m2_all = float(df_filtrado[df_filtrado[coluna_periodo].astype(str) == str(mes_final)]['Valor'].sum())
-    change_all = total_m2_all - total_m1_all
-
-    # Filtrar pelas categorias escolhidas
-    dff = df_filtrado[df_filtrado[chosen_dim].astype(str).isin(cats_sel)].copy()
-    g1 = (dff[dff[coluna_periodo].astype(str) == str(mes_inicial)]
-          .groupby(chosen_dim)['Valor'].sum())
-    g2 = (dff[dff[coluna_periodo].astype(str) == str(mes_final)]
-          .groupby(chosen_dim)['Valor'].sum())
-
-    labels_cats, values_cats = [], []
-    for cat in sorted(set(g1.index).union(set(g2.index))):
-        delta = float(g2.get(cat, 0.0)) - float(g1.get(cat, 0.0))
-        if abs(delta) > 1e-9:
-            labels_cats.append(str(cat))
-            values_cats.append(delta)
-
-    # Aplicar Top N por impacto absoluto
-    original_len = len(labels_cats)
-    if len(labels_cats) > max_cats:
-        idx = sorted(range(len(values_cats)), key=lambda i: abs(values_cats[i]), reverse=True)[:max_cats]
-        labels_cats = [labels_cats[i] for i in idx]
-        values_cats = [values_cats[i] for i in idx]
-    cropped = len(labels_cats) < original_len
-
-    # Remainder para fechar (com arredondamento)
-    remainder = round(change_all - sum(values_cats), 2)
-    all_selected = set(cats_sel) == set(cats_all)
-    show_outros = (abs(remainder) >= 0.01) and (not all_selected or cropped)
-    if show_outros:
-        labels_cats.append('Outros')
-        values_cats.append(remainder)
-
-    labels = [f"Mês {mes_inicial}"] + labels_cats + [f"Mês {mes_final}"]
-    values = [total_m1_all] + values_cats + [total_m2_all]
-    measures = ['absolute'] + ['relative'] * len(values_cats) + ['total']
+    # Totais dos meses (todas as categorias), variações das escolhidas com Top N por impacto
+    # absoluto (em cada etapa da ponte) e "Outros" para fechar (com arredondamento) quando há
+    # corte ou seleção parcial
+    barras = etapas_waterfall(matriz, totais_mes, meses_ponte, cats_sel, max_cats)
+    labels = eixo_x(barras, ponte)
+    values = barras['valor'].tolist()
+    measures = barras['medida'].tolist()
 
     # Gráfico principal com cores do tema
     fig = go.Figure(go.Waterfall(
@@ -830,13 +715,11 @@ with tab2:
     # Rótulos de dados: branco no dark, preto no light
     fig.update_traces(textfont=dict(color=text_color))
 
-    # Overlay "Outros" preto com base correta
-    if show_outros:
-        prev_sum = sum(v for lab, v in zip(labels_cats, values_cats) if lab != 'Outros')
-        cum_before = total_m1_all + prev_sum
-        base_val = cum_before if remainder >= 0 else cum_before + remainder
-        height = abs(remainder)
-        fig.add_trace(go.Bar(x=['Outros'], y=[height], base=[base_val], marker_color='#ff9800', opacity=1.0, hoverinfo='skip', showlegend=False))
+    # Overlay "Outros" com base correta (início da barra calculado no waterfall_ke5z)
+    barras_outros = barras[barras['outros']]
+    if len(barras_outros):
+        fig.add_trace(go.Bar(x=eixo_x(barras_outros, ponte), y=barras_outros['valor'].abs(), base=barras_outros['base'],
+                             marker_color='#ff9800', opacity=1.0, hoverinfo='skip', showlegend=False))
         fig.update_layout(barmode='overlay')
 
     # Apply theme-aware template and transparent backgrounds to inherit app colors
@@ -846,7 +729,8 @@ with tab2:
         fig.update_layout(template="plotly_white")
 
     fig.update_layout(
-        title={'text': f"Variação Financeira - Mês {mes_inicial} para Mês {mes_final}", 'x': 0.5},
+        title={'text': (f"Ponte Mês a Mês - Mês {mes_inicial} a Mês {mes_final}" if ponte
+                        else f"Variação Financeira - Mês {mes_inicial} para Mês {mes_final}"), 'x': 0.5},
         xaxis_title='Mês / Categoria',
         yaxis_title='Valor (R$)',
         height=560,
@@ -862,6 +746,11 @@ with tab2:
 
     st.plotly_chart(fig, use_container_width=True)
 
+    if ponte:
+        with st.expander("📋 Variação por categoria em cada etapa da ponte"):
+            exibir_tabela_valores(variacoes_por_etapa(matriz, meses_ponte, cats_sel), colorir=True,
+                                  use_container_width=True)
+
 # Sidebar com exemplos
 st.sidebar.title("🎯 IUD Assistant")
 st.sidebar.caption("Interactive User Dashboard")
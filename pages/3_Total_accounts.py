@@ -1,5 +1,4 @@
 ﻿import streamlit as st
-import pandas as pd
 import os
 import sys
 
@@ -8,6 +7,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from auth_simple import (verificar_autenticacao, exibir_header_usuario,
                   verificar_status_aprovado, is_modo_cloud, get_modo_operacao)
+from armazem_ke5z import carregar_cubo, carregar_waterfall, versao_visao
+from cubo_ke5z import total_registros
+from filtros_ke5z import CascataFiltros
+from formatacao_ke5z import exibir_tabela_valores
+from downloads_ke5z import oferecer_download
 
 # Configuração da página
 st.set_page_config(
@@ -65,88 +69,67 @@ st.sidebar.info("⚡ **DADOS WATERFALL OTIMIZADOS**\n"
                 "✅ Usando KE5Z_waterfall.parquet\n"
                 "📊 68% menor que arquivo original")
 
-@st.cache_data(ttl=3600, max_entries=3, persist="disk", show_spinner=True)
 def load_data_optimized(arquivo_tipo="completo"):
-    """Carrega dados INTEIRAMENTE do waterfall para máxima otimização de memória"""
-    
-    # USAR APENAS ARQUIVO WATERFALL OTIMIZADO (68% menor + Nº conta!)
-    arquivo_waterfall = os.path.join("_internal", "KE5Z", "KE5Z_waterfall.parquet")
-    if os.path.exists(arquivo_waterfall):
-        try:
-            df = pd.read_parquet(arquivo_waterfall)
-            # Aplicar filtro se necessário baseado no tipo solicitado
-            if arquivo_tipo == "main" and 'USI' in df.columns:
-                df = df[df['USI'] != 'Others'].copy()
-            elif arquivo_tipo == "others" and 'USI' in df.columns:
-                df = df[df['USI'] == 'Others'].copy()
-            # arquivo_tipo "completo" usa todos os dados do waterfall
-            
-            st.sidebar.success("⚡ **TOTAL ACCOUNTS OTIMIZADO**\nUsando APENAS waterfall (68% menor + Nº conta)!")
-            return df
-        except Exception as e:
-            st.sidebar.error(f"❌ Erro no arquivo waterfall: {str(e)}")
-            st.error("❌ **Total accounts requer arquivo waterfall otimizado**")
-            st.info("💡 Execute a extração de dados para gerar KE5Z_waterfall.parquet")
-            st.stop()
-    else:
-        st.error("❌ **Arquivo waterfall não encontrado**")
-        st.error("📁 Total accounts foi otimizado para usar APENAS KE5Z_waterfall.parquet")
+    """Carrega o cubo agregado (armazém compartilhado); sem cubo, as linhas do waterfall.
+
+    Devolve (df, versão da visão) - a versão é a chave das opções de filtro.
+    """
+    try:
+        df = carregar_cubo(arquivo_tipo)
+        st.sidebar.success("⚡ **TOTAL ACCOUNTS OTIMIZADO**\nUsando o cubo agregado (USI x Período x conta x Types)!")
+        return df, versao_visao("cubo", arquivo_tipo)
+    except FileNotFoundError:
+        pass
+    try:
+        df = carregar_waterfall(arquivo_tipo)
+    except Exception as e:
+        st.sidebar.error(f"❌ Erro no arquivo waterfall: {str(e)}")
+        st.error("❌ **Total accounts requer arquivo waterfall otimizado**")
         st.info("💡 **Solução**: Execute a extração de dados para gerar o arquivo waterfall")
         st.stop()
+
+    st.sidebar.success("⚡ **TOTAL ACCOUNTS OTIMIZADO**\nUsando APENAS waterfall (68% menor + Nº conta)!")
+    return df, versao_visao("waterfall", arquivo_tipo)
     
 # Função otimizada - usa APENAS waterfall para máxima performance
 
 # Carregar dados waterfall otimizados
 try:
-    df_principal = load_data_optimized("completo")  # Sempre usa dados completos do waterfall
+    df_principal, versao_principal = load_data_optimized("completo")  # Sempre usa dados completos do waterfall
     st.sidebar.success("✅ Dados waterfall carregados com sucesso")
     if not is_cloud:
-        st.sidebar.info(f"📊 {len(df_principal)} registros carregados")
+        st.sidebar.info(f"📊 {total_registros(df_principal):,} registros carregados")
 except Exception as e:
     st.error(f"❌ Erro ao carregar dados: {str(e)}")
     st.stop()
 
+# Filtros em cascata (filtros_ke5z): uma máscara única, DataFrame montado uma vez no final
+cascata = CascataFiltros(df_principal, versao_principal)
+
 # Filtros principais compactos
 with st.sidebar.expander("🔍 Filtros Principais", expanded=True):
     # Filtro 1: USINA
-    usina_opcoes = ["Todos"] + sorted(df_principal['USI'].dropna().astype(str).unique().tolist()) if 'USI' in df_principal.columns else ["Todos"]
+    usina_opcoes = cascata.opcoes('USI')
     default_usina = ["Veículos"] if "Veículos" in usina_opcoes else ["Todos"]
     usina_selecionada = st.multiselect("USINA:", usina_opcoes, default=default_usina)
-
-    # Filtrar o DataFrame com base na USI
-    if "Todos" in usina_selecionada or not usina_selecionada:
-        df_filtrado = df_principal.copy()
-    else:
-        df_filtrado = df_principal[df_principal['USI'].astype(str).isin(usina_selecionada)]
+    cascata.selecionar('USI', usina_selecionada)
 
     # Filtro 2: Período
-    periodo_opcoes = ["Todos"] + sorted(df_filtrado['Período'].dropna().astype(str).unique().tolist()) if 'Período' in df_filtrado.columns else ["Todos"]
+    periodo_opcoes = cascata.opcoes('Período')
     periodo_selecionado = st.selectbox("Período:", periodo_opcoes)
-    
-    if periodo_selecionado != "Todos":
-        df_filtrado = df_filtrado[df_filtrado['Período'].astype(str) == str(periodo_selecionado)]
+    cascata.selecionar('Período', periodo_selecionado)
 
     # Filtro 3: Centro cst
-    if 'Centro cst' in df_filtrado.columns:
-        centro_cst_opcoes = ["Todos"] + sorted(df_filtrado['Centro cst'].dropna().astype(str).unique().tolist())
+    if cascata.tem_coluna('Centro cst'):
+        centro_cst_opcoes = cascata.opcoes('Centro cst')
         centro_cst_selecionado = st.selectbox("Centro cst:", centro_cst_opcoes)
-        if centro_cst_selecionado != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['Centro cst'].astype(str) == str(centro_cst_selecionado)]
+        cascata.selecionar('Centro cst', centro_cst_selecionado)
 
     # Filtro 4: Conta contábil
-    if 'Nº conta' in df_filtrado.columns:
-        conta_contabil_opcoes = sorted(df_filtrado['Nº conta'].dropna().astype(str).unique().tolist())
+    if cascata.tem_coluna('Nº conta'):
+        conta_contabil_opcoes = cascata.opcoes('Nº conta', incluir_todos=False)
         conta_contabil_selecionadas = st.multiselect("Conta:", conta_contabil_opcoes)
-        if conta_contabil_selecionadas:
-            df_filtrado = df_filtrado[df_filtrado['Nº conta'].astype(str).isin(conta_contabil_selecionadas)]
-
-# Cache para opções de filtros (otimização de performance)
-@st.cache_data(ttl=1800, max_entries=3)
-def get_filter_options(df, column_name):
-    """Obtém opções de filtro com cache para melhor performance"""
-    if column_name in df.columns:
-        return ["Todos"] + sorted(df[column_name].dropna().astype(str).unique().tolist())
-    return ["Todos"]
+        cascata.selecionar('Nº conta', conta_contabil_selecionadas)
 
 # Filtros secundários compactos
 with st.sidebar.expander("🎯 Filtros Secundários", expanded=False):
@@ -160,11 +143,10 @@ with st.sidebar.expander("🎯 Filtros Secundários", expanded=False):
     ]
 
     for col_name, label in filtros_secundarios:
-        if col_name in df_filtrado.columns:
-            opcoes = get_filter_options(df_filtrado, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             selecionadas = st.multiselect(f"{label}:", opcoes, default=["Todos"])
-            if selecionadas and "Todos" not in selecionadas:
-                df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+            cascata.selecionar(col_name, selecionadas)
 
 # Filtros avançados compactos
 with st.sidebar.expander("🔧 Filtros Avançados", expanded=False):
@@ -176,15 +158,16 @@ with st.sidebar.expander("🔧 Filtros Avançados", expanded=False):
     ]
     
     for col_name, label in filtros_avancados:
-        if col_name in df_filtrado.columns:
-            opcoes = get_filter_options(df_filtrado, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             if len(opcoes) > 51:
                 opcoes = opcoes[:51]
                 st.caption(f"⚠️ {label}: Top 50")
             
             selecionadas = st.multiselect(f"{label}:", opcoes, default=["Todos"])
-            if selecionadas and "Todos" not in selecionadas:
-                df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+            cascata.selecionar(col_name, selecionadas)
+
+df_filtrado = cascata.resultado()
 
 ##################################################################################################
 
@@ -212,21 +195,21 @@ if 'USI' not in df_filtrado.columns:
     st.stop()
 
 # Criar uma tabela dinâmica (pivot table) para somar os valores por 'USI', incluindo campos desta coluna vazio ou NAN, a coluna por 'Período' e uma linha total
-tabela_somada = df_filtrado.pivot_table(index='USI', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total')
+tabela_somada = df_filtrado.pivot_table(index='USI', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total', observed=True)
 # Exibir a tabela somada na página com os numeros formatados como moeda brasileira
-tabela_somada = tabela_somada.style.format("R$ {:,.2f}", decimal=",",thousands=".")
-st.dataframe(tabela_somada)
+# (valores continuam numéricos; a moeda vai no column_config, formatada pelo navegador)
+exibir_tabela_valores(tabela_somada)
 
 
 ##################################################################################################
 # Título da nova página
 st.title("Total SAP KE5Z - Todas as contas")
 # Criar uma tabela dinâmica (pivot table) para somar os valores por 'Nº conta' incluindo a coluna por 'Período'
-tabela_somada = df_filtrado.pivot_table(index='Nº conta', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total')
+tabela_somada = df_filtrado.pivot_table(index='Nº conta', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total', observed=True)
 
 # Exibir a tabela somada na página com os numeros formatados como moeda brasileira
-tabela_somada = tabela_somada.style.format("R$ {:,.2f}", decimal=",",thousands=".")
-st.dataframe(tabela_somada)
+# (valores continuam numéricos; a moeda vai no column_config, formatada pelo navegador)
+exibir_tabela_valores(tabela_somada)
 
 # ============= GRÁFICOS MÊS A MÊS (MESMO PADRÃO DO DASH PRINCIPAL) =============
 st.markdown("---")
@@ -387,33 +370,18 @@ with col4:
 
 st.markdown("---")
 
-# Função para exportar uma única tabela para Excel
-def exportar_excel(df, nome_arquivo):
-    """Exporta DataFrame para Excel e retorna bytes para download"""
-    from io import BytesIO
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=True, sheet_name='Dados')
-    output.seek(0)
-    return output.getvalue()
-
 # Botão para download da tabela "Total SAP KE5Z - Todas as contas"
 if st.button("📥 Baixar Total SAP KE5Z - Todas as contas (Excel)", use_container_width=True):
     with st.spinner("Gerando arquivo..."):
         # Criar a tabela pivot novamente para exportação (sem formatação de estilo)
-        tabela_para_exportar = df_filtrado.pivot_table(index='Nº conta', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total')
-        excel_data = exportar_excel(tabela_para_exportar, 'KE5Z_total_contas.xlsx')
-        
-        # Forçar download usando JavaScript
-        import base64
-        b64 = base64.b64encode(excel_data).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="KE5Z_total_contas.xlsx">💾 Clique aqui para baixar</a>'
-        st.markdown(href, unsafe_allow_html=True)
-        st.success("✅ Arquivo gerado! Clique no link acima para baixar.")
+        tabela_para_exportar = df_filtrado.pivot_table(index='Nº conta', columns='Período', values='Valor', aggfunc='sum', fill_value=0, margins=True, margins_name='Total', observed=True)
+        if oferecer_download(tabela_para_exportar, 'KE5Z_total_contas.xlsx', "💾 Clique aqui para baixar",
+                             "arquivo_total_contas", nome_aba='Dados', indice=True):
+            st.success("✅ Arquivo gerado! Clique no botão acima para baixar.")
 
 # Resumo compacto
 with st.sidebar.expander("📊 Resumo", expanded=False):
-    st.write(f"**Registros:** {df_filtrado.shape[0]:,}")
+    st.write(f"**Registros:** {total_registros(df_filtrado):,}")
     st.write(f"**Total:** R$ {df_filtrado['Valor'].sum():,.0f}")
 
 
@@ -457,12 +425,9 @@ if colunas_necessarias.issubset(set(df_filtrado.columns)):
     # Download da tabela
     if st.button("📥 Baixar Soma por Types (Excel)", use_container_width=True):
         with st.spinner("Gerando arquivo..."):
-            excel_data = exportar_excel(tabela_types, 'KE5Z_soma_types.xlsx')
-            import base64
-            b64 = base64.b64encode(excel_data).decode()
-            href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="KE5Z_soma_types.xlsx">💾 Clique aqui para baixar</a>'
-            st.markdown(href, unsafe_allow_html=True)
-            st.success("✅ Arquivo gerado! Clique no link acima para baixar.")
+            if oferecer_download(tabela_types, 'KE5Z_soma_types.xlsx', "💾 Clique aqui para baixar",
+                                 "arquivo_soma_types", nome_aba='Dados', indice=True):
+                st.success("✅ Arquivo gerado! Clique no botão acima para baixar.")
 else:
     st.info("Colunas necessárias não disponíveis para esta tabela.")
 
@@ -1,5 +1,4 @@
 ﻿import streamlit as st
-import pandas as pd
 # Plotly com versão compatível
 import plotly.graph_objects as go
 PLOTLY_AVAILABLE = True
@@ -11,6 +10,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from auth_simple import (verificar_autenticacao, exibir_header_usuario, 
                          verificar_status_aprovado, is_modo_cloud, get_modo_operacao)
+from dataset_ke5z import existe_parquet_ke5z
+from armazem_ke5z import carregar_cubo, carregar_waterfall, pasta_ke5z_padrao, versao_visao
+from cubo_ke5z import total_registros
+from filtros_ke5z import CascataFiltros
+from waterfall_ke5z import eixo_x, etapas_waterfall, matrizes_em_cache, ordenar_meses, variacoes_por_etapa, volume_mes
+from formatacao_ke5z import exibir_tabela_valores
 
 st.set_page_config(page_title="Análise Waterfall - KE5Z", page_icon="🌊", layout="wide", initial_sidebar_state="expanded")
 verificar_autenticacao()
@@ -23,15 +28,8 @@ st.sidebar.markdown("---")
 st.title("🌊 Análise Waterfall - KE5Z")
 st.markdown("---")
 
-PT_MESES = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"]
-MES_POS = {m: i + 1 for i, m in enumerate(PT_MESES)}
-
-def sort_mes_unique(values):
-    vals = list(pd.Series(values).dropna().unique())
-    try:
-        return sorted(vals, key=lambda x: int(x))
-    except Exception:
-        return sorted(vals, key=lambda x: MES_POS.get(str(x).lower(), 99))
+MODO_DOIS_MESES = "Dois meses"
+MODO_PONTE = "Ponte mês a mês"
 
 # Usar modo selecionado no login (substitui detecção automática)
 is_cloud = is_modo_cloud()
@@ -52,8 +50,8 @@ st.sidebar.subheader("🗂️ Seleção de Dados")
 # Verificar quais arquivos estão disponíveis
 arquivos_status = {}
 for tipo, nome in [("completo", "KE5Z.parquet"), ("main", "KE5Z_main.parquet"), ("others", "KE5Z_others.parquet")]:
-    caminho = os.path.join("KE5Z", nome)
-    arquivos_status[tipo] = os.path.exists(caminho)
+    caminho = os.path.join(pasta_ke5z_padrao(), nome)
+    arquivos_status[tipo] = existe_parquet_ke5z(caminho)
 
 # Opções disponíveis baseadas nos arquivos existentes
 opcoes_dados = []
@@ -104,89 +102,69 @@ if is_cloud:
     st.sidebar.success("⚡ **Otimização Ativa**\n"
                       "Usando arquivos separados para melhor performance no Cloud!")
 
-@st.cache_data(ttl=3600, max_entries=3, persist="disk")
-def load_df(arquivo_tipo="completo") -> pd.DataFrame:
-    """Carrega dados DIRETAMENTE do waterfall para máxima otimização de memória"""
-    
-    # USAR APENAS ARQUIVO WATERFALL OTIMIZADO (72% menor!)
-    arquivo_waterfall = os.path.join("_internal", "KE5Z", "KE5Z_waterfall.parquet")
-    if os.path.exists(arquivo_waterfall):
-        try:
-            df = pd.read_parquet(arquivo_waterfall)
-            # Aplicar filtro se necessário baseado no tipo solicitado
-            if arquivo_tipo == "main" and 'USI' in df.columns:
-                df = df[df['USI'] != 'Others'].copy()
-            elif arquivo_tipo == "others" and 'USI' in df.columns:
-                df = df[df['USI'] == 'Others'].copy()
-            # arquivo_tipo "completo" usa todos os dados do waterfall
-            
-            st.sidebar.success("⚡ **WATERFALL ANALYSIS OTIMIZADO**\nUsando APENAS arquivo waterfall (72% menor)!")
-            return df
-        except Exception as e:
-            st.sidebar.error(f"❌ Erro no arquivo waterfall: {str(e)}")
-            st.error("❌ **Waterfall Analysis requer arquivo waterfall otimizado**")
-            st.info("💡 Execute a extração de dados para gerar KE5Z_waterfall.parquet")
-            st.stop()
-    else:
-        st.error("❌ **Arquivo waterfall não encontrado**")
-        st.error("📁 Waterfall Analysis foi otimizado para usar APENAS KE5Z_waterfall.parquet")
+def load_df(arquivo_tipo="completo") -> tuple:
+    """Carrega o cubo agregado (armazém compartilhado); sem cubo, as linhas do waterfall.
+
+    Devolve (df, versão da visão) - a versão é a chave das opções de filtro.
+    """
+    try:
+        df = carregar_cubo(arquivo_tipo)
+        st.sidebar.success("⚡ **WATERFALL ANALYSIS OTIMIZADO**\nUsando o cubo agregado (USI x Período x conta x Types)!")
+        return df, versao_visao("cubo", arquivo_tipo)
+    except FileNotFoundError:
+        pass
+    try:
+        df = carregar_waterfall(arquivo_tipo)
+    except Exception as e:
+        st.sidebar.error(f"❌ Erro no arquivo waterfall: {str(e)}")
+        st.error("❌ **Waterfall Analysis requer arquivo waterfall otimizado**")
         st.info("💡 **Solução**: Execute a extração de dados para gerar o arquivo waterfall")
         st.stop()
 
+    st.sidebar.success("⚡ **WATERFALL ANALYSIS OTIMIZADO**\nUsando APENAS arquivo waterfall (72% menor)!")
+    return df, versao_visao("waterfall", arquivo_tipo)
+
 
 # Carregar dados
-df_base = load_df(opcao_selecionada)
+df_base, versao_base = load_df(opcao_selecionada)
 if df_base.empty:
     st.stop()
 
 # Mostrar informações de carregamento
 st.sidebar.success("✅ Dados carregados com sucesso")
 if not is_cloud:
-    st.sidebar.info(f"📊 {len(df_base)} registros carregados")
+    st.sidebar.info(f"📊 {total_registros(df_base):,} registros carregados")
 
 # Aplicar filtros padrão do projeto
 st.sidebar.title("Filtros")
 
+# Filtros em cascata (filtros_ke5z): uma máscara única, DataFrame montado uma vez no final
+cascata = CascataFiltros(df_base, versao_base)
+
 # Filtro 1: USINA
-usina_opcoes = ["Todos"] + sorted(df_base['USI'].dropna().astype(str).unique().tolist()) if 'USI' in df_base.columns else ["Todos"]
+usina_opcoes = cascata.opcoes('USI')
 default_usina = ["Veículos"] if "Veículos" in usina_opcoes else ["Todos"]
 usina_selecionada = st.sidebar.multiselect("Selecione a USINA:", usina_opcoes, default=default_usina)
-
-# Filtrar o DataFrame com base na USI
-if "Todos" in usina_selecionada or not usina_selecionada:
-    df_filtrado = df_base.copy()
-else:
-    df_filtrado = df_base[df_base['USI'].astype(str).isin(usina_selecionada)]
+cascata.selecionar('USI', usina_selecionada)
 
 # Filtro 2: Período
-periodo_opcoes = ["Todos"] + sorted(df_filtrado['Período'].dropna().astype(str).unique().tolist()) if 'Período' in df_filtrado.columns else ["Todos"]
+periodo_opcoes = cascata.opcoes('Período')
 periodo_selecionado = st.sidebar.selectbox("Selecione o Período:", periodo_opcoes)
-if periodo_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['Período'].astype(str) == str(periodo_selecionado)]
+cascata.selecionar('Período', periodo_selecionado)
 
 # Filtro 3: Centro cst
-if 'Centro cst' in df_filtrado.columns:
-    centro_cst_opcoes = ["Todos"] + sorted(df_filtrado['Centro cst'].dropna().astype(str).unique().tolist())
+if cascata.tem_coluna('Centro cst'):
+    centro_cst_opcoes = cascata.opcoes('Centro cst')
     centro_cst_selecionado = st.sidebar.selectbox("Selecione o Centro cst:", centro_cst_opcoes)
-    if centro_cst_selecionado != "Todos":
-        df_filtrado = df_filtrado[df_filtrado['Centro cst'].astype(str) == str(centro_cst_selecionado)]
+    cascata.selecionar('Centro cst', centro_cst_selecionado)
 
 # Filtro 4: Conta contábil
-if 'Nº conta' in df_filtrado.columns:
-    conta_contabil_opcoes = sorted(df_filtrado['Nº conta'].dropna().astype(str).unique().tolist())
+if cascata.tem_coluna('Nº conta'):
+    conta_contabil_opcoes = cascata.opcoes('Nº conta', incluir_todos=False)
     conta_contabil_selecionadas = st.sidebar.multiselect("Selecione a Conta contábil:", conta_contabil_opcoes)
-    if conta_contabil_selecionadas:
-        df_filtrado = df_filtrado[df_filtrado['Nº conta'].astype(str).isin(conta_contabil_selecionadas)]
-
-# Cache para opções de filtros (otimização de performance)
-@st.cache_data(ttl=1800, max_entries=3)
-def get_filter_options(df, column_name):
-    """Obtém opções de filtro com cache para melhor performance"""
-    if column_name in df.columns:
-        return ["Todos"] + sorted(df[column_name].dropna().astype(str).unique().tolist())
-    return ["Todos"]
-
-# Filtros principais (com cache otimizado)
+    cascata.selecionar('Nº conta', conta_contabil_selecionadas)
+
+# Filtros principais
 filtros_principais = [
     ("Type 05", "Type 05", "multiselect"),
     ("Type 06", "Type 06", "multiselect"), 
@@ -197,12 +175,11 @@ filtros_principais = [
 ]
 
 for col_name, label, widget_type in filtros_principais:
-    if col_name in df_filtrado.columns:
-        opcoes = get_filter_options(df_filtrado, col_name)
+    if cascata.tem_coluna(col_name):
+        opcoes = cascata.opcoes(col_name)
         if widget_type == "multiselect":
             selecionadas = st.sidebar.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-            if selecionadas and "Todos" not in selecionadas:
-                df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+            cascata.selecionar(col_name, selecionadas)
 
 # Filtros avançados (expansível)
 with st.sidebar.expander("🔍 Filtros Avançados"):
@@ -214,8 +191,8 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
     ]
     
     for col_name, label, widget_type in filtros_avancados:
-        if col_name in df_filtrado.columns:
-            opcoes = get_filter_options(df_filtrado, col_name)
+        if cascata.tem_coluna(col_name):
+            opcoes = cascata.opcoes(col_name)
             # Limitar opções para melhor performance
             if len(opcoes) > 101:  # 100 + "Todos"
                 opcoes = opcoes[:101]
@@ -223,16 +200,17 @@ with st.sidebar.expander("🔍 Filtros Avançados"):
             
             if widget_type == "multiselect":
                 selecionadas = st.multiselect(f"Selecione o {label}:", opcoes, default=["Todos"])
-                if selecionadas and "Todos" not in selecionadas:
-                    df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(selecionadas)]
+                cascata.selecionar(col_name, selecionadas)
+
+df_filtrado = cascata.resultado()
 
 # Exibir informações dos filtros
-st.sidebar.write(f"Número de linhas: {df_filtrado.shape[0]}")
+st.sidebar.write(f"Número de linhas: {total_registros(df_filtrado)}")
 st.sidebar.write(f"Número de colunas: {df_filtrado.shape[1]}")
 st.sidebar.write(f"Soma do Valor total: R$ {df_filtrado['Valor'].sum():,.2f}")
 
 # --- Configurações do waterfall ---
-mes_unicos = sort_mes_unique(df_filtrado["Período"].astype(str)) if "Período" in df_filtrado.columns else sort_mes_unique(df_filtrado["mes"].astype(str))
+mes_unicos = ordenar_meses(df_filtrado["Período"].astype(str)) if "Período" in df_filtrado.columns else ordenar_meses(df_filtrado["mes"].astype(str))
 col_valor = next((c for c in ["valor", "Valor", "Total_Value"] if c in df_filtrado.columns), None)
 col_mes = "Período" if "Período" in df_filtrado.columns else ("mes" if "mes" in df_filtrado.columns else None)
 
@@ -243,18 +221,29 @@ if not dims_cat or not col_valor or not col_mes:
     st.stop()
 chosen_dim = st.selectbox("Dimensão da categoria:", dims_cat, index=0)
 
-col_a, col_b = st.columns(2)
-with col_a:
-    mes_inicial = st.selectbox("Mês inicial:", mes_unicos, index=0)
-with col_b:
-    mes_final = st.selectbox("Mês final:", mes_unicos, index=len(mes_unicos) - 1)
+# Matriz categoria x mês (cache por filtros + dimensão): categorias, volumes e variações saem dela
+matriz, totais_mes = matrizes_em_cache(df_filtrado, cascata.versao_resultado(), dims_cat, chosen_dim, col_mes, col_valor)
 
-# Normalizar categorias (strings limpas) e garantir defaults válidos
-cats_all = sorted([str(x).strip() for x in df_filtrado[chosen_dim].dropna().unique().tolist() if str(x).strip() != ""])
+modo = st.radio("Modo:", [MODO_DOIS_MESES, MODO_PONTE], horizontal=True,
+                help="Ponte mês a mês: encadeia cada mês ao seguinte, com as categorias que explicam cada etapa")
+ponte = modo == MODO_PONTE
+if ponte:
+    mes_inicial, mes_final = st.select_slider("Meses da ponte:", options=mes_unicos,
+                                              value=(mes_unicos[0], mes_unicos[-1]))
+    meses_ponte = mes_unicos[mes_unicos.index(mes_inicial):mes_unicos.index(mes_final) + 1]
+else:
+    col_a, col_b = st.columns(2)
+    with col_a:
+        mes_inicial = st.selectbox("Mês inicial:", mes_unicos, index=0)
+    with col_b:
+        mes_final = st.selectbox("Mês final:", mes_unicos, index=len(mes_unicos) - 1)
+    meses_ponte = [mes_inicial, mes_final]
+
+# Categorias (strings limpas, em ordem alfabética) e defaults válidos
+cats_all = matriz.index.tolist()
 total_cats = max(1, len(cats_all))
 max_cats = st.slider(f"Quantidade de categorias a exibir (Top N) (Total: {total_cats}):", 1, total_cats, total_cats)
-vol_mf = (df_filtrado[df_filtrado[col_mes].astype(str) == str(mes_final)].groupby(chosen_dim)[col_valor].sum().sort_values(ascending=False))
-vol_index = [str(c).strip() for c in list(vol_mf.index)]
+vol_index = volume_mes(matriz, str(mes_final)).index.tolist()
 default_cats = vol_index[:max_cats] if len(vol_index) else cats_all[:max_cats]
 
 cats_options = ["Todos"] + cats_all
@@ -274,42 +263,12 @@ if mes_inicial == mes_final:
     st.info("Selecione meses diferentes para comparar.")
     st.stop()
 
-# Totais de mês (todas as categorias do df_filtrado)
-total_m1_all = float(df_filtrado[df_filtrado[col_mes].astype(str) == str(mes_inicial)][col_valor].sum())
-total_m2_all = float(df_filtrado[df_filtrado[col_mes].astype(str) == str(mes_final)][col_valor].sum())
-change_all = total_m2_all - total_m1_all
-
-# Filtrar pelas selecionadas
-dff = df_filtrado[df_filtrado[chosen_dim].astype(str).isin(cats_sel)].copy()
-
-g1 = (dff[dff[col_mes].astype(str) == str(mes_inicial)].groupby(chosen_dim)[col_valor].sum())
-g2 = (dff[dff[col_mes].astype(str) == str(mes_final)].groupby(chosen_dim)[col_valor].sum())
-
-labels_cats, values_cats = [], []
-for cat in sorted(set(g1.index).union(set(g2.index))):
-    delta = float(g2.get(cat, 0.0)) - float(g1.get(cat, 0.0))
-    if abs(delta) > 1e-9:
-        labels_cats.append(str(cat))
-        values_cats.append(delta)
-
-original_len = len(labels_cats)
-if len(labels_cats) > max_cats:
-    idx = sorted(range(len(values_cats)), key=lambda i: abs(values_cats[i]), reverse=True)[:max_cats]
-    labels_cats = [labels_cats[i] for i in idx]
-    values_cats = [values_cats[i] for i in idx]
-cropped = len(labels_cats) < original_len
-
-remainder = round(change_all - sum(values_cats), 2)
-# Mostrar "Outros" quando há mais categorias do que as exibidas ou quando foi aplicado filtro Top N
-all_selected = len(cats_sel) >= len(cats_all)
-show_outros = (abs(remainder) >= 0.01) and (cropped or not all_selected or len(cats_sel) < len(cats_all))
-if show_outros:
-    labels_cats.append("Outros")
-    values_cats.append(remainder)
-
-labels = [f"Mês {mes_inicial}"] + labels_cats + [f"Mês {mes_final}"]
-values = [total_m1_all] + values_cats + [total_m2_all]
-measures = ["absolute"] + ["relative"] * len(values_cats) + ["total"]
+# Barras: totais dos meses (todas as categorias do df_filtrado), variações das selecionadas (Top N
+# por impacto absoluto, em cada etapa da ponte) e "Outros" quando há corte ou seleção parcial
+barras = etapas_waterfall(matriz, totais_mes, meses_ponte, cats_sel, max_cats)
+labels = eixo_x(barras, ponte)
+values = barras["valor"].tolist()
+measures = barras["medida"].tolist()
 
 # Tema do Streamlit para cores
 theme_base = st.get_option("theme.base") or "light"
@@ -334,13 +293,11 @@ fig = go.Figure(go.Waterfall(
 # Rótulos de dados: branco no dark, preto no light
 fig.update_traces(textfont=dict(color=text_color))
 
-# Overlay 'Outros' em preto
-if show_outros:
-    prev_sum = sum(v for lab, v in zip(labels_cats, values_cats) if lab != "Outros")
-    cum_before = total_m1_all + prev_sum
-    base_val = cum_before if remainder >= 0 else cum_before + remainder
-    height = abs(remainder)
-    fig.add_trace(go.Bar(x=['Outros'], y=[height], base=[base_val], marker_color='#ff9800', opacity=1.0, hoverinfo='skip', showlegend=False))
+# Overlay 'Outros' em destaque
+barras_outros = barras[barras["outros"]]
+if len(barras_outros):
+    fig.add_trace(go.Bar(x=eixo_x(barras_outros, ponte), y=barras_outros["valor"].abs(), base=barras_outros["base"],
+                         marker_color='#ff9800', opacity=1.0, hoverinfo='skip', showlegend=False))
     fig.update_layout(barmode='overlay')
 
 # Template e fundos transparentes para herdar cor do app
@@ -350,7 +307,8 @@ else:
     fig.update_layout(template="plotly_white")
 
 fig.update_layout(
-    title={"text": f"Variação Financeira - Mês {mes_inicial} para Mês {mes_final}", "x": 0.5},
+    title={"text": (f"Ponte Mês a Mês - Mês {mes_inicial} a Mês {mes_final}" if ponte
+                    else f"Variação Financeira - Mês {mes_inicial} para Mês {mes_final}"), "x": 0.5},
     xaxis_title="Mês / Categoria",
     yaxis_title="Valor (R$)",
     height=560,
@@ -366,5 +324,10 @@ fig.update_yaxes(tickformat=",.0f", tickprefix="R$ ")
 
 st.plotly_chart(fig, use_container_width=True)
 
+if ponte:
+    with st.expander("📋 Variação por categoria em cada etapa da ponte"):
+        exibir_tabela_valores(variacoes_por_etapa(matriz, meses_ponte, cats_sel), colorir=True,
+                              use_container_width=True)
+
 st.markdown("---")
 st.markdown("**📊 Dashboard KE5Z - Análise Waterfall** | Desenvolvido com Streamlit")
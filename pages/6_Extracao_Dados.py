@@ -1,7 +1,6 @@
 ﻿import streamlit as st
 import pandas as pd
 import os
-import subprocess
 import sys
 import time
 from datetime import datetime
@@ -14,6 +13,10 @@ from auth_simple import (
     verificar_autenticacao, exibir_header_usuario,
     verificar_status_aprovado, eh_administrador
 )
+from exportacao_usi import FORMATOS_EXPORTACAO, FORMATO_PADRAO
+from pipeline_ke5z import ParametrosExtracao, PipelineKE5Z, EVENTO_LOG
+
+EXTENSOES_EXPORTACAO = tuple(f".{formato}" for formato in FORMATOS_EXPORTACAO)
 
 # Configuração da página
 st.set_page_config(
@@ -171,7 +174,7 @@ with col2:
         # Desenvolvimento: arquivos ficam na pasta local
         excel_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arquivos")
     if verificar_arquivo_existe(excel_dir):
-        arquivos_excel = [f for f in os.listdir(excel_dir) if f.endswith('.xlsx')]
+        arquivos_excel = [f for f in os.listdir(excel_dir) if f.endswith(EXTENSOES_EXPORTACAO)]
         st.success(f"✅ {len(arquivos_excel)} arquivos encontrados")
         for arquivo in arquivos_excel[:5]:  # Mostrar apenas os primeiros 5
             caminho_arquivo = os.path.join(excel_dir, arquivo)
@@ -245,6 +248,13 @@ if "Todos" in selecionados:
 else:
     meses_filtro = selecionados
 
+formatos_saida = st.multiselect(
+    "💾 Formato dos Arquivos por USI",
+    options=list(FORMATOS_EXPORTACAO),
+    default=[FORMATO_PADRAO],
+    help="xlsx (Excel), csv (separador ';' e vírgula decimal) ou parquet. Os arquivos são gravados em paralelo."
+)
+
 st.markdown("---")
 
 col_a, col_b = st.columns([1, 1])
@@ -322,7 +332,7 @@ def verificar_arquivos_necessarios():
     
     base_extracoes = resolver_pasta_extracoes()
     arquivos_necessarios = [
-        (os.path.join(base_dir, "Extracao.py"), "Script principal"),
+        (os.path.join(base_dir, "pipeline_ke5z.py"), "Pipeline de extração"),
         (os.path.join(base_dir, base_extracoes, "KE5Z"), "Pasta com arquivos .txt KE5Z"),
         (os.path.join(base_dir, base_extracoes, "KSBB"), "Pasta com arquivos .txt KSBB"),
         (os.path.join(base_dir, "Dados SAPIENS.xlsx"), "Base de dados SAPIENS"),
@@ -350,230 +360,81 @@ def verificar_arquivos_necessarios():
     return todos_ok, resultados
 
 
-def executar_extracao(meses_filtro=None, progress_callback=None, logs_placeholder=None):
-    """Executa o script Extração.py com captura de logs em tempo real"""
+def executar_extracao(meses_filtro=None, progress_callback=None, logs_placeholder=None, formatos_saida=None):
+    """Executa o pipeline de extração numa thread, com progresso e logs em tempo real"""
+    import threading
+    import queue
+    import gc
+
     try:
-        # Obter diretório base (onde está o executável)
-        if hasattr(sys, '_MEIPASS'):
-            # Executando dentro do PyInstaller
-            base_dir = sys._MEIPASS
-        else:
-            # Executando normalmente - usar diretório do script atual
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-        adicionar_log("🚀 Iniciando execução do Extração.py...")
+        adicionar_log("🚀 Iniciando extração (pipeline KE5Z)...")
         if progress_callback:
-            progress_callback(10, "🚀 Iniciando execução...", "Preparando ambiente")
+            progress_callback(1, "🚀 Iniciando execução...", "Preparando parâmetros")
 
-        script_path = os.path.join(base_dir, "Extracao.py")
-        
-        # Passar meses selecionados via variável de ambiente (ex.: "9,10,11")
-        try:
-            if meses_filtro and isinstance(meses_filtro, (list, tuple)):
-                os.environ["MESES_FILTRO"] = ",".join(str(int(m)) for m in meses_filtro)
-        except Exception:
-            # Em caso de qualquer problema na serialização, ignorar silenciosamente
-            pass
-
-        # Executar de forma diferente dependendo do ambiente
-        if hasattr(sys, '_MEIPASS'):
-            # Executando dentro do PyInstaller - executar diretamente para evitar problemas de python.exe
-            adicionar_log("🐍 Executando script diretamente (PyInstaller)")
-            adicionar_log(f"📄 Script: {script_path}")
-            if progress_callback:
-                progress_callback(15, "⚙️ Iniciando execução direta...", "Executando script")
-
-            # Executar com captura de logs em tempo real usando threading
-            import threading
-            import queue
-            import time
-            from io import StringIO
-            
-            # Queue para capturar logs em tempo real
-            log_queue = queue.Queue()
-            
-            def capture_output():
-                """Captura stdout/stderr e envia para a queue"""
-                old_stdout = sys.stdout
-                old_stderr = sys.stderr
-                
-                class OutputCapture:
-                    def __init__(self, original, queue, prefix=""):
-                        self.original = original
-                        self.queue = queue
-                        self.prefix = prefix
-                        self.buffer = ""
-                    
-                    def write(self, text):
-                        self.buffer += text
-                        if '\n' in self.buffer:
-                            lines = self.buffer.split('\n')
-                            for line in lines[:-1]:
-                                if line.strip():
-                                    self.queue.put(f"{self.prefix}{line.strip()}")
-                            self.buffer = lines[-1]
-                        self.original.write(text)
-                    
-                    def flush(self):
-                        if self.buffer.strip():
-                            self.queue.put(f"{self.prefix}{self.buffer.strip()}")
-                            self.buffer = ""
-                        self.original.flush()
-                
-                sys.stdout = OutputCapture(old_stdout, log_queue, "")
-                sys.stderr = OutputCapture(old_stderr, log_queue, "ERR: ")
-                
-                try:
-                    # Executar o script diretamente
-                    with open(script_path, 'r', encoding='utf-8') as f:
-                        script_content = f.read()
-                    
-                    # Criar contexto de execução
-                    exec_context = {
-                        '__name__': '__main__',
-                        '__file__': script_path,
-                        '__builtins__': __builtins__,
-                    }
-                    
-                    # Executar o script
-                    exec(script_content, exec_context)
-                    
-                except Exception as e:
-                    log_queue.put(f"❌ Erro na execução: {str(e)}")
-                finally:
-                    # Restaurar stdout/stderr
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
-                    log_queue.put("__END__")  # Sinal de fim
-            
-            # Iniciar thread de execução
-            exec_thread = threading.Thread(target=capture_output)
-            exec_thread.daemon = True
-            exec_thread.start()
-            
-            # Processar logs em tempo real
-            linhas_lidas = 0
-            start_time = time.time()
-            
-            while exec_thread.is_alive() or not log_queue.empty():
-                try:
-                    # Tentar obter log com timeout
-                    log_line = log_queue.get(timeout=0.1)
-                    
-                    if log_line == "__END__":
-                        break
-                    
-                    if log_line.strip():
-                        adicionar_log(log_line.strip(), sem_timestamp=True)
-                        linhas_lidas += 1
-                        
-                        # Atualizar progresso
-                        if progress_callback:
-                            elapsed = time.time() - start_time
-                            # Simular progresso baseado no tempo e linhas
-                            progress = min(90, 20 + (elapsed * 2) + (linhas_lidas * 0.5))
-                            progress_callback(progress, "⚙️ Processando...", f"Linhas: {linhas_lidas}")
-                        
-                        # Atualizar logs na tela (se placeholder estiver disponível)
-                        if logs_placeholder is not None:
-                            ultimos = st.session_state.logs[-30:]
-                            with logs_placeholder.container():
-                                for log_line_display in ultimos:
-                                    st.write(log_line_display)
-                
-                except queue.Empty:
-                    # Timeout - continuar verificando
-                    time.sleep(0.1)
-                    continue
-                except Exception as e:
-                    adicionar_log(f"❌ Erro no processamento de logs: {str(e)}")
-                    break
-            
-            # Aguardar thread terminar
-            exec_thread.join(timeout=5)
-            
-            # Processar logs restantes
-            while not log_queue.empty():
-                try:
-                    log_line = log_queue.get_nowait()
-                    if log_line != "__END__" and log_line.strip():
-                        adicionar_log(log_line.strip(), sem_timestamp=True)
-                except queue.Empty:
-                    break
-            
-            return_code = 0  # Sucesso
-                
-        else:
-            # Executando normalmente - usar subprocess
-            python_path = sys.executable
-            adicionar_log(f"🐍 Usando Python: {python_path}")
-            adicionar_log(f"📄 Script: {script_path}")
-            if progress_callback:
-                progress_callback(15, "⚙️ Iniciando subprocess...", "Executando script")
-
-            # Preparar ambiente para subprocess
-            env = os.environ.copy()
+        parametros = ParametrosExtracao(
+            meses=list(meses_filtro) if meses_filtro else None,
+            formatos=list(formatos_saida) if formatos_saida else None,
+        )
+        adicionar_log(f"📄 Parâmetros: {parametros}")
+
+        # A thread do pipeline só coloca eventos na fila; a UI é atualizada aqui
+        fila_eventos = queue.Queue()
+        FIM = object()
+
+        def rodar_pipeline():
             try:
-                if meses_filtro and isinstance(meses_filtro, (list, tuple)):
-                    env["MESES_FILTRO"] = ",".join(str(int(m)) for m in meses_filtro)
-            except Exception:
-                pass
-
-            processo = subprocess.Popen(
-                [python_path, "-u", script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=base_dir,
-                encoding='cp1252',
-                errors='replace',
-                bufsize=1,
-                universal_newlines=True,
-                env=env,
-            )
-
-            # Leitura em tempo real do stdout
-            linhas_lidas = 0
-            for linha in iter(processo.stdout.readline, ''):
-                if linha == '' and processo.poll() is not None:
-                    break
-                texto = linha.strip()
-                if texto:
-                    adicionar_log(texto, sem_timestamp=True)
-                    linhas_lidas += 1
-                    if linhas_lidas % 5 == 0 and progress_callback:
-                        pct = min(75, 15 + linhas_lidas)
-                        progress_callback(pct, "⚙️ Processando...", f"Linhas: {linhas_lidas}")
-                    # Atualizar logs na tela (se placeholder estiver disponível)
-                    if logs_placeholder is not None:
-                        ultimos = st.session_state.logs[-30:]
-                        with logs_placeholder.container():
-                            for log_line in ultimos:
-                                st.write(log_line)
-
-            # Capturar stderr ao final
-            stderr_restante = processo.stderr.read() or ''
-            if stderr_restante:
-                for linha in stderr_restante.split('\n'):
-                    if linha.strip():
-                        adicionar_log(linha.strip(), sem_timestamp=True)
-
-            return_code = processo.wait()
-
-        adicionar_log(f"📊 Código de retorno: {return_code}", f"Status: {'Sucesso' if return_code == 0 else 'Erro'}")
-        if progress_callback:
-            progress_callback(85, "📊 Processamento concluído", "Verificando arquivos")
+                resultado = PipelineKE5Z(parametros, ao_progredir=fila_eventos.put).executar(capturar_saida=True)
+                fila_eventos.put((FIM, resultado, None))
+            except Exception as e:
+                fila_eventos.put((FIM, None, e))
 
-        arquivos_gerados = verificar_arquivos_gerados()
+        thread_pipeline = threading.Thread(target=rodar_pipeline, name="pipeline_ke5z", daemon=True)
+        thread_pipeline.start()
 
-        if return_code == 0 or (arquivos_gerados and len(arquivos_gerados) > 0):
-            adicionar_log("✅ Extração concluída com sucesso!")
-            if progress_callback:
-                progress_callback(100, "✅ Concluído", "")
-            return True, "Extração executada com sucesso!"
+        resultado, erro = None, None
+        while True:
+            try:
+                evento = fila_eventos.get(timeout=0.5)
+            except queue.Empty:
+                if not thread_pipeline.is_alive():
+                    erro = RuntimeError("pipeline encerrado sem resultado")
+                    break
+                continue
 
-        adicionar_log("❌ Extração finalizada sem sucesso")
-        return False, "Erro na execução"
+            if isinstance(evento, tuple) and evento[0] is FIM:
+                _, resultado, erro = evento
+                break
+
+            if evento.tipo == EVENTO_LOG:
+                adicionar_log(evento.mensagem.strip(), sem_timestamp=True)
+            else:
+                adicionar_log(f"[{evento.percentual:3.0f}%] {evento.mensagem}")
+                if progress_callback:
+                    progress_callback(min(evento.percentual, 99), "⚙️ Processando...", evento.mensagem)
+
+            # Atualizar logs na tela (se placeholder estiver disponível)
+            if logs_placeholder is not None:
+                ultimos = st.session_state.logs[-30:]
+                with logs_placeholder.container():
+                    for log_line in ultimos:
+                        st.write(log_line)
+
+        thread_pipeline.join(timeout=5)
+        # Liberar os DataFrames da extração antes de voltar ao dashboard
+        gc.collect()
+
+        if erro is not None:
+            adicionar_log(f"❌ Erro na extração: {erro}")
+            return False, f"Erro: {erro}"
+
+        for mensagem in resultado.get("erros", []):
+            adicionar_log(f"⚠️ {mensagem}")
+        tempos = ", ".join(f"{nome} {segundos:.1f}s" for nome, segundos in resultado["etapas"].items())
+        adicionar_log(f"⏱️ Tempo por etapa: {tempos}", f"Total: {resultado['segundos']:.1f}s")
+        if progress_callback:
+            progress_callback(100, "✅ Concluído", "")
+        adicionar_log("✅ Extração concluída com sucesso!")
+        return True, "Extração executada com sucesso!"
 
     except Exception as e:
         adicionar_log(f"❌ Erro: {str(e)}")
@@ -616,9 +477,10 @@ def verificar_arquivos_gerados():
     # Verificar arquivos Excel
     arquivos_path = os.path.join(base_dir, "arquivos")
     if os.path.exists(arquivos_path):
-        arquivos_excel = glob.glob(os.path.join(arquivos_path, "*.xlsx"))
+        arquivos_excel = [arquivo for extensao in EXTENSOES_EXPORTACAO
+                          for arquivo in glob.glob(os.path.join(arquivos_path, f"*{extensao}"))]
         adicionar_log(f"📁 Pasta arquivos encontrada", 
-                      f"Arquivos .xlsx: {len(arquivos_excel)}")
+                      f"Arquivos {'/'.join(EXTENSOES_EXPORTACAO)}: {len(arquivos_excel)}")
         
         for arquivo in arquivos_excel:
             tamanho = os.path.getsize(arquivo) / (1024 * 1024)
@@ -737,7 +599,8 @@ def aplicar_filtro_mes_excel(meses_filtro):
 if executar:
     st.session_state.logs.clear()
     atualizar_progresso(10, "Preparando...")
-    ok, msg = executar_extracao(meses_filtro=meses_filtro, progress_callback=atualizar_progresso, logs_placeholder=logs_placeholder)
+    ok, msg = executar_extracao(meses_filtro=meses_filtro, progress_callback=atualizar_progresso,
+                                logs_placeholder=logs_placeholder, formatos_saida=formatos_saida)
     atualizar_progresso(80, "Verificando arquivos...")
     verificar_arquivos_gerados()
     atualizar_progresso(100, "Concluído")
@@ -0,0 +1,989 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline da extração KE5Z, importável e parametrizado
+Etapas: ler (TXT KE5Z/KSBB + planilhas de referência) -> enriquecer (merges e regras)
+-> classificar (Types/USI sem classificação) -> gravar (dataset + arquivos por USI)
+
+Usado pelo Extracao.py (linha de comando) e pela página de extração, que roda o
+pipeline numa thread e acompanha os eventos de progresso.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from etl_ke5z import (ler_arquivo_ke5z, ler_arquivo_ksbb, precisa_ler_em_blocos,
+                      configuracao_paralelismo, processar_arquivos_paralelo,
+                      linhas_por_bloco_configuradas, imprimir_pico_memoria,
+                      EscritorBlocos, ler_blocos, ler_lotes, ler_selecao_em_blocos, contar_selecao,
+                      schema_comum)
+from etl_cache import CacheIncremental, incremental_habilitado, MODO_ARROW, MODO_PANDAS
+from etl_enriquecimento import (
+    aplicar_regras, imprimir_relatorio, REGRA_TEXTO_MATERIAL, REGRA_FORNECEDOR_PROVISAO
+)
+from etl_arrow import (modo_arrow_habilitado, como_texto, para_arrow,
+                       normalizar_texto_arrow, juntar)
+from cache_referencias import carregar_referencias, ABAS_SAPIENS, ABAS_FORNECEDORES
+from dataset_ke5z import (gravar_dataset, gravar_dataset_em_blocos, caminho_dataset, caminho_ipc,
+                          tamanho_dataset_mb, ler_visao, arrow_ipc_habilitado, COLUNAS_WATERFALL)
+from exportacao_usi import (planejar_exportacoes, grupos_exportacao, exportar_arquivos, exportar_em_blocos,
+                            formatos_configurados)
+
+# Colunas descartadas logo após a leitura dos TXT
+COLUNAS_PARA_REMOVER = [
+    'Unnamed: 0',
+    'Unnamed: 1',
+    'Unnamed: 4',
+    'Nº doc.',
+    'Elem.PEP',
+    'Obj.custo',
+    'TD',
+    'SocPar',
+    'EmpEm.',
+    'Empr',
+    'TMv',
+    'D/C',
+    'Imobil.',
+    # Colunas restauradas - removidas da lista de remoção:
+    # 'Descrição Material',  # RESTAURADA
+    # 'Cliente',            # RESTAURADA
+    # 'Cen.',              # RESTAURADA
+    # 'Cen.lucro',         # RESTAURADA
+    # 'Unnamed: 14',       # RESTAURADA
+    # 'Classe objs.',      # RESTAURADA
+    # 'Item',              # RESTAURADA
+    # 'D',                 # RESTAURADA
+]
+
+# Colunas garantidas como texto antes de gravar
+COLUNAS_TEXTO = ['Nº conta', 'Centro cst', 'Texto', 'Fornecedor', 'Fornec.', 'Material',
+                 'Descrição Material', 'Type 05', 'Type 06', 'Type 07', 'USI', 'Oficina',
+                 'Doc.compra', 'Usuário', 'Tipo', 'Cliente', 'Dt.lçto.', 'Imobilizado']
+
+# Layout dos arquivos por USI (pasta arquivos/)
+COLUNAS_EXCEL = ['Período', 'Nº conta', 'Centro cst', 'doc.ref', 'Dt.lçto.', 'Valor', 'Qtd.', 'Type 05',
+                 'Type 06', 'Type 07', 'USI', 'Oficina', 'Doc.compra', 'Texto', 'Fornecedor', 'Material',
+                 'Usuário', 'Fornec.', 'Tipo']
+RENOMEAR_EXCEL = {'Texto': 'Texto breve', 'Qtd.': 'QTD', 'Nº conta': 'Nºconta', 'Centro cst': 'Centrocst',
+                  'doc.ref': 'Nºdoc.ref.', 'Type 07': 'Account', 'Período': 'Mes'}
+NOMES_MESES = {1: 'janeiro', 2: 'fevereiro', 3: 'março', 4: 'abril', 5: 'maio', 6: 'junho', 7: 'julho',
+               8: 'agosto', 9: 'setembro', 10: 'outubro', 11: 'novembro', 12: 'dezembro'}
+USIS_VEICULOS = ['Veículos', 'TC Ext', 'LC']
+
+# Etapas na ordem de execução: (nome, descrição, % inicial, % final)
+ETAPAS = [
+    ('ler', 'Leitura dos arquivos', 0, 40),
+    ('enriquecer', 'Enriquecimento (KSBB, SAPIENS, fornecedores)', 40, 60),
+    ('classificar', 'Classificação (Types e USI)', 60, 65),
+    ('gravar', 'Gravação do dataset e dos arquivos por USI', 65, 100),
+]
+
+# Tipos de evento de progresso
+EVENTO_ETAPA = 'etapa'          # início de uma etapa
+EVENTO_PROGRESSO = 'progresso'  # avanço dentro da etapa (arquivo lido, arquivo gravado...)
+EVENTO_LOG = 'log'              # linha impressa durante a execução (com capturar_saida=True)
+EVENTO_CONCLUIDO = 'concluido'
+EVENTO_ERRO = 'erro'
+
+
+def _ligado(nome_variavel: str) -> bool:
+    return os.environ.get(nome_variavel, '0').strip().lower() in ('1', 'true', 'sim')
+
+
+def pasta_base_padrao() -> str:
+    """Pasta do projeto (_internal no executável PyInstaller): entradas e saídas ficam nela"""
+    return sys._MEIPASS if hasattr(sys, '_MEIPASS') else os.path.dirname(os.path.abspath(__file__))
+
+
+def meses_do_ambiente() -> Optional[List[int]]:
+    """Lê MESES_FILTRO (ex.: "9,10,11"), enviado antes pela página de extração"""
+    meses_env = os.environ.get('MESES_FILTRO', '').strip()
+    if not meses_env:
+        return None
+    try:
+        meses = sorted({int(x) for x in meses_env.split(',') if str(x).strip().isdigit()})
+        return meses or None
+    except Exception as e:
+        print(f"Aviso: não foi possível interpretar MESES_FILTRO='{meses_env}': {e}")
+        return None
+
+
+class ParametrosExtracao:
+    """Entradas, saídas e opções da extração.
+
+    Sem argumentos, usa as pastas padrão do projeto (Extracoes/KE5Z, Extracoes/KSBB,
+    KE5Z/, arquivos/, cache_etl/) e as opções das variáveis de ambiente ETL_*.
+    """
+
+    def __init__(self, pasta_base: Optional[str] = None,
+                 pasta_ke5z: Optional[str] = None,
+                 pasta_ksbb: Optional[str] = None,
+                 arquivo_sapiens: Optional[str] = None,
+                 arquivo_fornecedores: Optional[str] = None,
+                 pasta_saida_ke5z: Optional[str] = None,
+                 pasta_arquivos: Optional[str] = None,
+                 pasta_cache: Optional[str] = None,
+                 meses: Optional[List[int]] = None,
+                 formatos: Optional[List[str]] = None,
+                 saidas_legadas: Optional[bool] = None,
+                 modo_arrow: Optional[bool] = None,
+                 incremental: Optional[bool] = None,
+                 arrow_ipc: Optional[bool] = None):
+        base = pasta_base or pasta_base_padrao()
+        self.pasta_base = base
+        # Entradas
+        self.pasta_ke5z = pasta_ke5z or os.path.join(base, "Extracoes", "KE5Z")
+        self.pasta_ksbb = pasta_ksbb or os.path.join(base, "Extracoes", "KSBB")
+        self.arquivo_sapiens = arquivo_sapiens or os.path.join(base, "Dados SAPIENS.xlsx")
+        self.arquivo_fornecedores = arquivo_fornecedores or os.path.join(base, "Fornecedores.xlsx")
+        # Saídas
+        self.pasta_saida_ke5z = pasta_saida_ke5z or os.path.join(base, "KE5Z")
+        self.pasta_arquivos = pasta_arquivos or os.path.join(base, "arquivos")
+        # Cache incremental (parquet limpo por arquivo .txt + manifesto) e das planilhas de referência
+        self.pasta_cache = pasta_cache or os.path.join(base, "cache_etl")
+        # Opções (None = variável de ambiente correspondente)
+        self.meses = sorted({int(m) for m in meses}) if meses else None
+        self.formatos = list(formatos) if formatos else formatos_configurados()
+        self.saidas_legadas = _ligado('ETL_SAIDAS_LEGADAS') if saidas_legadas is None else saidas_legadas
+        self.modo_arrow = modo_arrow_habilitado() if modo_arrow is None else modo_arrow
+        self.incremental = incremental_habilitado() if incremental is None else incremental
+        self.arrow_ipc = arrow_ipc_habilitado() if arrow_ipc is None else arrow_ipc
+
+    @property
+    def pasta_cache_referencias(self) -> str:
+        return os.path.join(self.pasta_cache, "referencias")
+
+    @classmethod
+    def do_ambiente(cls, **kwargs) -> 'ParametrosExtracao':
+        """Parâmetros da linha de comando: meses de MESES_FILTRO, demais opções de ETL_*"""
+        kwargs.setdefault('meses', meses_do_ambiente())
+        return cls(**kwargs)
+
+    def __repr__(self):
+        return (f"ParametrosExtracao(pasta_ke5z={self.pasta_ke5z!r}, meses={self.meses}, "
+                f"formatos={self.formatos}, modo_arrow={self.modo_arrow}, incremental={self.incremental}, "
+                f"arrow_ipc={self.arrow_ipc})")
+
+
+class EventoProgresso:
+    """Evento enviado a `ao_progredir` durante a execução do pipeline"""
+
+    def __init__(self, tipo: str, etapa: str, percentual: float, mensagem: str,
+                 dados: Optional[Dict[str, Any]] = None):
+        self.tipo = tipo
+        self.etapa = etapa
+        self.percentual = percentual
+        self.mensagem = mensagem
+        self.dados = dados or {}
+
+    def __repr__(self):
+        return f"EventoProgresso({self.tipo}, {self.etapa}, {self.percentual:.0f}%, {self.mensagem!r})"
+
+
+class _SaidaDaThread:
+    """Repassa ao callback as linhas impressas pela thread do pipeline.
+
+    Só a thread que está executando o pipeline é capturada; o restante do
+    processo (ex.: o servidor do Streamlit) continua escrevendo normalmente.
+    """
+
+    def __init__(self, original, ao_imprimir: Callable[[str], None]):
+        self._original = original
+        self._ao_imprimir = ao_imprimir
+        self._thread = threading.get_ident()
+        self._buffer = ""
+
+    def write(self, texto):
+        if threading.get_ident() == self._thread:
+            self._buffer += texto
+            *linhas, self._buffer = self._buffer.split('\n')
+            for linha in linhas:
+                if linha.strip():
+                    self._ao_imprimir(linha.rstrip())
+        try:
+            return self._original.write(texto)
+        except UnicodeEncodeError:
+            # Console do Windows (cp1252) sem emojis: a linha já foi para o callback
+            return len(texto)
+
+    def flush(self):
+        if self._buffer.strip() and threading.get_ident() == self._thread:
+            self._ao_imprimir(self._buffer.rstrip())
+            self._buffer = ""
+        self._original.flush()
+
+    def __getattr__(self, nome):
+        return getattr(self._original, nome)
+
+
+class PipelineKE5Z:
+    """Extração KE5Z em etapas explícitas.
+
+    pipeline = PipelineKE5Z(ParametrosExtracao(meses=[9, 10]), ao_progredir=print)
+    resultado = pipeline.executar()
+
+    As etapas também podem ser chamadas uma a uma (ler, enriquecer, classificar,
+    gravar); cada uma trabalha sobre `self.df_total` ou, na extração em blocos, sobre
+    as partes parquet de `self.fontes` (lidas e gravadas um bloco por vez).
+    """
+
+    def __init__(self, parametros: Optional[ParametrosExtracao] = None,
+                 ao_progredir: Optional[Callable[[EventoProgresso], None]] = None):
+        self.parametros = parametros or ParametrosExtracao()
+        self.ao_progredir = ao_progredir
+        self.df_total: Optional[pd.DataFrame] = None
+        self.df_ksbb: Optional[pd.DataFrame] = None
+        self.fontes: Optional[List[str]] = None
+        self.usis_por_registros: Dict[Any, int] = {}
+        self._temporarios: List[str] = []
+        self.referencias: Dict[str, pd.DataFrame] = {}
+        self.relatorio_enriquecimento: List[Dict[str, Any]] = []
+        self.resultado: Dict[str, Any] = {"etapas": {}, "arquivos": [], "erros": []}
+        self._etapa_atual = ETAPAS[0]
+
+    # ------------------------------------------------------------------ progresso
+    def _emitir(self, tipo: str, fracao_etapa: float, mensagem: str, **dados):
+        """Envia um evento; fracao_etapa (0-1) vira percentual dentro da faixa da etapa atual"""
+        if self.ao_progredir is None:
+            return
+        nome, _, inicio, fim = self._etapa_atual
+        percentual = inicio + (fim - inicio) * min(max(fracao_etapa, 0.0), 1.0)
+        try:
+            self.ao_progredir(EventoProgresso(tipo, nome, percentual, mensagem, dados))
+        except Exception as e:
+            # Um callback com erro não pode interromper a extração
+            sys.__stdout__.write(f"Aviso: erro no callback de progresso: {e}\n")
+
+    def _imprimir_capturado(self, linha: str):
+        self._emitir(EVENTO_LOG, 0.0, linha)
+
+    # ------------------------------------------------------------------ execução completa
+    def executar(self, capturar_saida: bool = False) -> Dict[str, Any]:
+        """Executa todas as etapas e devolve o resumo (registros, arquivos, tempo por etapa).
+
+        capturar_saida=True também envia como EVENTO_LOG cada linha impressa pela
+        thread atual (inclusive pelos módulos auxiliares).
+        """
+        saida_original = sys.stdout
+        if capturar_saida:
+            sys.stdout = _SaidaDaThread(saida_original, self._imprimir_capturado)
+        inicio_total = time.perf_counter()
+        try:
+            for nome, *_ in ETAPAS:
+                getattr(self, nome)()
+            self.resultado["segundos"] = time.perf_counter() - inicio_total
+            self._etapa_atual = ETAPAS[-1]
+            self._emitir(EVENTO_CONCLUIDO, 1.0, "Extração concluída", **self.resultado)
+            return self.resultado
+        except Exception as e:
+            self._emitir(EVENTO_ERRO, 0.0, f"Erro na etapa '{self._etapa_atual[0]}': {e}")
+            raise
+        finally:
+            self._limpar_temporarios()
+            if capturar_saida:
+                sys.stdout.flush()
+                sys.stdout = saida_original
+
+    def _iniciar_etapa(self, nome: str) -> float:
+        self._etapa_atual = next(e for e in ETAPAS if e[0] == nome)
+        print(f"\n=== {self._etapa_atual[1].upper()} ===")
+        self._emitir(EVENTO_ETAPA, 0.0, self._etapa_atual[1])
+        return time.perf_counter()
+
+    def _finalizar_etapa(self, nome: str, inicio: float):
+        segundos = time.perf_counter() - inicio
+        self.resultado["etapas"][nome] = segundos
+        self._emitir(EVENTO_PROGRESSO, 1.0, f"{self._etapa_atual[1]} concluída em {segundos:.1f}s")
+
+    # ------------------------------------------------------------------ etapa 1: ler
+    def ler(self):
+        """TXT KE5Z (cache incremental, processos em paralelo), TXT KSBB e planilhas de referência.
+
+        Se algum arquivo precisa de leitura em blocos (ETL_LINHAS_POR_BLOCO ou estimativa acima
+        do limite de memória), a extração inteira segue em blocos: `self.fontes` guarda os
+        parquets/pastas de partes de cada arquivo e `self.df_total` fica vazio.
+        """
+        inicio = self._iniciar_etapa('ler')
+        p = self.parametros
+        modo_arrow = p.modo_arrow
+
+        # Verificar se a pasta local existe
+        pasta = p.pasta_ke5z
+        if not os.path.exists(pasta):
+            print(f"ERRO: Pasta local {pasta} não encontrada!")
+            print(f"Pasta procurada: {os.path.abspath(pasta)}")
+            print("Criando pasta local...")
+            os.makedirs(pasta, exist_ok=True)
+            print(f"Pasta local criada: {os.path.abspath(pasta)}")
+            print("Coloque os arquivos .txt na pasta Extracoes/KE5Z/ do projeto")
+            raise FileNotFoundError(f"Pasta de entrada KE5Z não encontrada: {pasta}")
+
+        print(f"Pasta encontrada: {pasta}")
+
+        # Cache incremental: só arquivos novos ou alterados são lidos novamente
+        # Um parquet por modo: os tipos texto do modo Arrow não vazam para o modo pandas (e vice-versa)
+        cache_etl = CacheIncremental(p.pasta_cache, habilitado=p.incremental,
+                                     modo=MODO_ARROW if modo_arrow else MODO_PANDAS)
+        if cache_etl.habilitado:
+            print(f"Modo incremental ativo (cache: {p.pasta_cache})")
+        else:
+            print("Modo incremental desativado (ETL_INCREMENTAL=0) - reprocessando todos os arquivos")
+
+        # Modo Arrow (ETL_MODO_ARROW=1): texto como string[pyarrow] e joins pelo Arrow
+        if modo_arrow:
+            print("Modo Arrow ativo: colunas texto como string[pyarrow], nulos preservados")
+
+        arquivos_txt = [f for f in os.listdir(pasta) if f.endswith('.txt')]
+        print(f"Arquivos .txt encontrados: {len(arquivos_txt)}")
+        total_arquivos = max(1, len(arquivos_txt))
+
+        # Arquivos maiores que o limite de memória (ou ETL_LINHAS_POR_BLOCO > 0) são lidos em blocos
+        workers, limite_memoria_mb = configuracao_paralelismo(total_arquivos)
+        linhas_por_bloco = linhas_por_bloco_configuradas()
+        em_blocos = any(precisa_ler_em_blocos(os.path.join(pasta, arquivo), linhas_por_bloco, limite_memoria_mb)
+                        for arquivo in arquivos_txt)
+        if em_blocos:
+            print("Extração em blocos: nenhum arquivo é carregado inteiro na memória")
+            os.makedirs(p.pasta_cache, exist_ok=True)
+            pasta_blocos = self._pasta_temporaria('ke5z_blocos_')
+
+        # 1) Reaproveitar do cache os arquivos sem alteração; o resto vai para a leitura
+        frames_por_arquivo = {}
+        pendentes = []
+        for i, arquivo in enumerate(arquivos_txt, 1):
+            caminho_arquivo = os.path.join(pasta, arquivo)
+            print(f"\n[{i}/{len(arquivos_txt)}] Verificando: {arquivo}")
+            print(f"Caminho: {caminho_arquivo}")
+
+            # Em blocos, o cache entra como fonte (caminho), sem ser carregado
+            anterior = (cache_etl.reaproveitar if em_blocos else cache_etl.buscar)('KE5Z', caminho_arquivo)
+            if anterior is not None:
+                frames_por_arquivo[arquivo] = anterior
+            else:
+                pendentes.append(caminho_arquivo)
+        if frames_por_arquivo:
+            self._emitir(EVENTO_PROGRESSO, 0.8 * len(frames_por_arquivo) / total_arquivos,
+                         f"{len(frames_por_arquivo)} arquivo(s) KE5Z reaproveitados do cache")
+
+        # 2) Ler os arquivos novos/alterados - um processo por arquivo (ETL_WORKERS, ETL_LIMITE_MEMORIA_MB)
+        pico_memoria_por_arquivo = {}
+        if pendentes:
+            workers = min(workers, len(pendentes))
+            print(f"\nArquivos para processar: {len(pendentes)} (processos: {workers})")
+            if linhas_por_bloco:
+                print(f"Leitura em blocos de {linhas_por_bloco:,} linhas (ETL_LINHAS_POR_BLOCO)")
+            leitor = partial(ler_arquivo_ke5z, modo_arrow=modo_arrow, linhas_por_bloco=linhas_por_bloco,
+                             limite_memoria_mb=limite_memoria_mb,
+                             pasta_blocos=pasta_blocos if em_blocos else None)
+            for caminho_arquivo, resultado in processar_arquivos_paralelo(
+                pendentes, leitor, workers, limite_memoria_mb
+            ):
+                arquivo = os.path.basename(caminho_arquivo)
+                if isinstance(resultado, Exception):
+                    print(f"Erro ao processar {arquivo}: {str(resultado)}")
+                    self.resultado["erros"].append(f"{arquivo}: {resultado}")
+                    continue
+                if isinstance(resultado, dict):
+                    # Lido em blocos: partes parquet em disco, movidas para o cache
+                    pico_memoria_por_arquivo[arquivo] = resultado['pico_memoria_mb']
+                    registros = resultado['registros']
+                    frames_por_arquivo[arquivo] = cache_etl.gravar_partes(
+                        'KE5Z', caminho_arquivo, resultado['caminho'], registros)
+                else:
+                    pico_memoria_por_arquivo[arquivo] = resultado.attrs.pop('pico_memoria_mb', 0.0)
+                    registros = len(resultado)
+                    cache_etl.gravar('KE5Z', caminho_arquivo, resultado)
+                    if em_blocos:
+                        # Arquivo pequeno numa extração em blocos: vira fonte em disco como os demais
+                        frames_por_arquivo[arquivo] = (cache_etl.localizar('KE5Z', caminho_arquivo)
+                                                       or self._gravar_partes(resultado, pasta_blocos, arquivo))
+                        del resultado
+                    else:
+                        frames_por_arquivo[arquivo] = resultado
+                self._emitir(EVENTO_PROGRESSO, 0.8 * len(frames_por_arquivo) / total_arquivos,
+                             f"KE5Z lido: {arquivo}", arquivo=arquivo, registros=int(registros))
+            imprimir_pico_memoria(pico_memoria_por_arquivo)
+
+        # Esquecer arquivos que foram removidos da pasta
+        cache_etl.limpar_ausentes('KE5Z', arquivos_txt)
+
+        if em_blocos:
+            # 3) Fontes na ordem original dos arquivos; as etapas seguintes leem bloco a bloco
+            self.fontes = [frames_por_arquivo[arquivo] for arquivo in arquivos_txt if arquivo in frames_por_arquivo]
+            self.df_total = None
+            if not self.fontes:
+                raise ValueError("Nenhum arquivo KE5Z lido para a extração em blocos")
+            print(f"{len(self.fontes)} arquivo(s) KE5Z prontos para a extração em blocos")
+        else:
+            self.fontes = None
+            self.df_total = self._concatenar(arquivos_txt, frames_por_arquivo)
+            self.resultado["registros_lidos"] = int(len(self.df_total))
+
+        # KSBB: descrição dos materiais (pasta opcional)
+        self.df_ksbb = self._ler_ksbb(cache_etl)
+        self._emitir(EVENTO_PROGRESSO, 0.9, "KSBB lido", registros=int(len(self.df_ksbb)))
+
+        # Registrar o estado dos arquivos de entrada para a próxima execução
+        cache_etl.salvar_manifesto()
+        print(cache_etl.resumo())
+
+        # Planilhas de referência (abas convertidas para parquet no cache)
+        abas_sapiens = carregar_referencias(p.arquivo_sapiens, ABAS_SAPIENS, p.pasta_cache_referencias)
+        abas_fornecedores = carregar_referencias(p.arquivo_fornecedores, ABAS_FORNECEDORES,
+                                                 p.pasta_cache_referencias)
+        self.referencias = {
+            'Conta contabil': abas_sapiens['Conta contabil'],
+            'CC': abas_sapiens['CC'],
+            'Hist_prov': abas_sapiens['Hist_prov'],
+            'Fornecedores': abas_fornecedores[0],
+        }
+        self._finalizar_etapa('ler', inicio)
+
+    def _concatenar(self, arquivos_txt: List[str], frames_por_arquivo: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """Extração em memória: DataFrames dos arquivos na ordem original, prontos para o enriquecimento"""
+        dataframes = []
+        for arquivo in arquivos_txt:
+            if arquivo not in frames_por_arquivo:
+                continue
+            df = frames_por_arquivo.pop(arquivo)
+            if self.parametros.modo_arrow:
+                df = para_arrow(df)
+            dataframes.append(df)
+            print(f"{arquivo} processado com sucesso!")
+
+            # Imprimir o valor total da coluna 'Em MCont.'
+            total_em_mcont = df['Em MCont.'].sum()
+            print(f"Total Em MCont. em {arquivo}: {total_em_mcont:,.2f}")
+
+        # Concatenar todos os DataFrames em um único
+        if dataframes:
+            df_total = pd.concat(dataframes, ignore_index=True)
+        else:
+            print("AVISO: Nenhum arquivo .txt encontrado em KE5Z.")
+            df_total = pd.DataFrame()
+        del dataframes
+
+        df_total = self._preparar_leitura(df_total)
+        print(df_total.columns)
+        print(len(df_total))
+        print(df_total.head(10))  # Exibir as primeiras linhas do DataFrame total
+        return df_total
+
+    def _preparar_leitura(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Colunas descartadas, Cliente como texto, 'Em MCont.' -> 'Valor' e filtro de Nº conta
+        (DataFrame inteiro ou um bloco)"""
+        # Remover colunas desnecessárias
+        df = df.drop(columns=COLUNAS_PARA_REMOVER, errors='ignore')
+
+        # mudar tipo da coluna 'Cliente' para string
+        df['Cliente'] = como_texto(df['Cliente'], self.parametros.modo_arrow)  # Cliente restaurada
+
+        # Modificar o nome da coluna 'Em MCont.' para 'Valor'
+        df = df.rename(columns={'Em MCont.': 'Valor'})
+
+        # filtrar a coluna Nº conta não vazias e diferentes de 0
+        return df[df['Nº conta'].notna() & (df['Nº conta'] != 0)]
+
+    def _pasta_temporaria(self, prefixo: str) -> str:
+        """Pasta de trabalho da extração em blocos (no disco do cache, apagada no final)"""
+        pasta = tempfile.mkdtemp(prefix=prefixo, dir=self.parametros.pasta_cache)
+        self._temporarios.append(pasta)
+        return pasta
+
+    def _limpar_temporarios(self):
+        for pasta in self._temporarios:
+            shutil.rmtree(pasta, ignore_errors=True)
+        self._temporarios = []
+
+    @staticmethod
+    def _gravar_partes(df: pd.DataFrame, pasta: str, nome: str) -> str:
+        escritor = EscritorBlocos(os.path.join(pasta, nome))
+        try:
+            escritor.escrever(df)
+        finally:
+            escritor.fechar()
+        return escritor.pasta
+
+    def _ler_ksbb(self, cache_etl: CacheIncremental) -> pd.DataFrame:
+        pasta_ksbb = self.parametros.pasta_ksbb
+
+        # Verificar se a pasta local existe
+        if not os.path.exists(pasta_ksbb):
+            print(f"AVISO: Pasta local {pasta_ksbb} não encontrada!")
+            print(f"Pasta procurada: {os.path.abspath(pasta_ksbb)}")
+            print("Criando pasta local...")
+            os.makedirs(pasta_ksbb, exist_ok=True)
+            print(f"Pasta local criada: {os.path.abspath(pasta_ksbb)}")
+            print("Coloque os arquivos .txt na pasta Extracoes/KSBB/ do projeto")
+            # Não interromper a extração, apenas pular a parte do KSBB
+            pasta_ksbb = None
+
+        print(f"Pasta KSBB encontrada: {pasta_ksbb}")
+        dataframes_ksbb = []
+
+        # Iterar sobre todos os arquivos na pasta (apenas se disponível)
+        if pasta_ksbb:
+            arquivos_ksbb = []
+            for arquivo in os.listdir(pasta_ksbb):
+                caminho_arquivo = os.path.join(pasta_ksbb, arquivo)
+
+                # Verificar se é um arquivo e tem a extensão desejada (.txt)
+                if os.path.isfile(caminho_arquivo) and arquivo.endswith('.txt'):
+                    print(f"Lendo: {arquivo}")
+                    arquivos_ksbb.append(arquivo)
+
+                    # Ler o arquivo (ou reaproveitar do cache) e adicionar à lista
+                    df_ksbb = cache_etl.obter('KSBB', caminho_arquivo, ler_arquivo_ksbb)
+                    dataframes_ksbb.append(df_ksbb)
+
+            cache_etl.limpar_ausentes('KSBB', arquivos_ksbb)
+        else:
+            print("Pulando processamento KSBB (pasta não disponível).")
+
+        # Concatenar todos os DataFrames em um único e ignorar caso tenha apenas 1
+        if len(dataframes_ksbb) > 1:
+            df_ksbb = pd.concat(dataframes_ksbb, ignore_index=True)
+        elif len(dataframes_ksbb) == 1:
+            df_ksbb = dataframes_ksbb[0]
+        else:
+            df_ksbb = pd.DataFrame()
+
+        # remover as linhas duplicadas pela coluna Material
+        if df_ksbb.empty:
+            return df_ksbb
+        return df_ksbb.drop_duplicates(subset=['Material'])
+
+    # ------------------------------------------------------------------ etapa 2: enriquecer
+    def enriquecer(self):
+        """Descrição do material (KSBB), Types (SAPIENS), Oficina/USI (CC), fornecedores e provisões"""
+        inicio = self._iniciar_etapa('enriquecer')
+        referencias = self._preparar_referencias()
+        self.df_ksbb = None
+        self.referencias = {}
+        self.relatorio_enriquecimento = []
+
+        if self.fontes is None:
+            self.df_total = self._enriquecer_bloco(self.df_total, referencias)
+        else:
+            self._enriquecer_fontes(referencias)
+        imprimir_relatorio(self.relatorio_enriquecimento)
+        self._finalizar_etapa('enriquecer', inicio)
+
+    def _preparar_referencias(self) -> Dict[str, pd.DataFrame]:
+        """Tabelas de referência com as chaves renomeadas e convertidas, uma vez por extração"""
+        modo_arrow = self.parametros.modo_arrow
+
+        # Dados SAPIENS.xlsx, aba Conta contabil: mudar o nome da coluna 'CONTA SAPIENS' para Nº conta
+        df_sapiens = self.referencias['Conta contabil'].rename(columns={'CONTA SAPIENS': 'Nº conta'})
+        print(df_sapiens.head())
+        # mudar o tipo da coluna Nº conta para string
+        df_sapiens['Nº conta'] = como_texto(df_sapiens['Nº conta'], modo_arrow)
+
+        # Aba CC: mudar o nome da coluna CC SAPiens para Centro cst
+        df_CC = self.referencias['CC'].rename(columns={'CC SAPiens': 'Centro cst'})
+
+        # Fornecedores.xlsx: remover linhas duplicadas pela coluna Fornecedor
+        df_fornecedores = self.referencias['Fornecedores'].drop_duplicates(subset=['Fornecedor'])
+        # mudar o nome da coluna Fornecedor para Fornec.
+        df_fornecedores = df_fornecedores.rename(columns={'Fornecedor': 'Fornec.'})
+        # mudar a coluna fornec. para string
+        df_fornecedores['Fornec.'] = como_texto(df_fornecedores['Fornec.'], modo_arrow)
+
+        # Provisões (Dados SAPIENS.xlsx, aba Hist_prov): só as colunas 'Nome do fornecedor', '20carac'
+        df_hist_prov = self.referencias['Hist_prov'][['Nome do fornecedor', '20carac']].copy()
+        # Remover os espaços da coluna '20carac'
+        df_hist_prov['20carac'] = df_hist_prov['20carac'].str.strip()
+        # remover linhas duplicadas pela coluna '20carac'
+        df_hist_prov = df_hist_prov.drop_duplicates(subset=['20carac'])
+
+        return {'KSBB': self.df_ksbb, 'Conta contabil': df_sapiens, 'CC': df_CC,
+                'Fornecedores': df_fornecedores, 'Hist_prov': df_hist_prov}
+
+    def _enriquecer_bloco(self, df_total: pd.DataFrame, referencias: Dict[str, pd.DataFrame],
+                          verboso: bool = True) -> pd.DataFrame:
+        """Merges e regras sobre o DataFrame inteiro ou um bloco (verboso=False: sem amostras nem eventos)"""
+        modo_arrow = self.parametros.modo_arrow
+        df_ksbb = referencias['KSBB']
+
+        # merge o df_total com df_ksbb pela coluna Material trazendo a coluna de texto breve material
+        if not df_total.empty and not df_ksbb.empty and 'Material' in df_total.columns:
+            df_total = juntar(df_total, df_ksbb, 'Material', ['Texto breve material'], modo_arrow)
+
+        # renomear a coluna Texto breve material para Descrição Material
+        df_total = df_total.rename(columns={'Texto breve material': 'Descrição Material'})
+
+        # exibir as 10 primeiras linhas do df_total e as colunas de Material, Descrição Material
+        if verboso and 'Material' in df_total.columns and 'Descrição Material' in df_total.columns:
+            print(df_total[['Material', 'Descrição Material']].head(10))
+
+        # se a descrição do material nao for nula substituir o valor da coluna Texto pelo valor da Descrição Material
+        aplicar_regras(df_total, [REGRA_TEXTO_MATERIAL], self.relatorio_enriquecimento, verboso)
+
+        # imprimir os valores totais somarizado por periodo
+        if verboso:
+            print(df_total.groupby('Período')['Valor'].sum())
+        # mudar o tipo de coluna nº conta para string
+        df_total['Nº conta'] = como_texto(df_total['Nº conta'], modo_arrow)
+
+        # Merge do df_total pela coluna Nº conta com o df_sapiens
+        df_total = juntar(df_total, referencias['Conta contabil'], 'Nº conta',
+                          ['Type 07', 'Type 06', 'Type 05'], modo_arrow)
+        if verboso:
+            self._emitir(EVENTO_PROGRESSO, 0.3, "Contas SAPIENS aplicadas")
+
+        # Merge o df_total com o df_CC pela coluna Centro cst e trazer as colunas Oficina e USI
+        df_total = juntar(df_total, referencias['CC'], 'Centro cst', ['Oficina', 'USI'], modo_arrow)
+        # Substituir na coluna 'USI' os valores NaN por 'Others'
+        df_total['USI'] = df_total['USI'].fillna('Others')
+        # Exibir as 10 primeiras linhas do df_total e as colunas de Nº conta, Type 07, Type 06, Type 05, Centro cst, Oficina e USI
+        if verboso:
+            print(
+                df_total[
+                    [
+                        'Nº conta', 'Type 07', 'Type 06', 'Type 05',
+                        'Centro cst', 'Oficina', 'USI'
+                    ]
+                ].head(10)
+            )
+            self._emitir(EVENTO_PROGRESSO, 0.5, "Centros de custo aplicados")
+
+        df_total = self._normalizar_tipos(df_total, verboso)
+
+        # merge o df_total com df_fornecedores pela coluna Fornec. retornando a coluna Fornecedor
+        df_total = juntar(df_total, referencias['Fornecedores'], 'Fornec.', ['Nome do fornecedor'], modo_arrow)
+        # mudar o nome da coluna Nome do fornecedor para Fornecedor
+        df_total.rename(columns={'Nome do fornecedor': 'Fornecedor'}, inplace=True)
+        if verboso:
+            self._emitir(EVENTO_PROGRESSO, 0.8, "Fornecedores aplicados")
+
+        # criar uma coluna no df_total chamada '20carac' (primeiros 20 caracteres do Texto)
+        df_total['20carac'] = como_texto(df_total['Texto'], modo_arrow).str[:20]
+        # Remover os espaços da coluna '20carac'
+        df_total['20carac'] = df_total['20carac'].str.strip()
+
+        # merge o df_total com df_hist_prov pela coluna 20carac retornando a coluna 'Nome do fornecedor'
+        df_total = juntar(df_total, referencias['Hist_prov'], '20carac', ['Nome do fornecedor'], modo_arrow)
+
+        # Se a coluna 'Nome do fornecedor' não for nula, substituir o valor da coluna Fornecedor pelo valor da coluna 'Nome do fornecedor'
+        aplicar_regras(df_total, [REGRA_FORNECEDOR_PROVISAO], self.relatorio_enriquecimento, verboso)
+        return df_total
+
+    def _enriquecer_fontes(self, referencias: Dict[str, pd.DataFrame]):
+        """Extração em blocos: cada bloco das fontes é preparado, enriquecido, classificado e
+        gravado nas partes enriquecidas, que passam a ser a única fonte das etapas seguintes"""
+        modo_arrow = self.parametros.modo_arrow
+        # Tipos comuns a todos os arquivos, como no pd.concat da extração em memória
+        schema = schema_comum(self.fontes)
+        escritor = EscritorBlocos(os.path.join(self._pasta_temporaria('ke5z_enriquecido_'), 'KE5Z'))
+        lidos = 0
+        usis: Dict[Any, int] = {}
+        try:
+            for i, fonte in enumerate(self.fontes, 1):
+                for bloco in ler_blocos(fonte, modo_arrow, linhas_por_bloco_configuradas(), schema):
+                    if modo_arrow:
+                        bloco = para_arrow(bloco)
+                    bloco = self._preparar_leitura(bloco)
+                    lidos += len(bloco)
+                    bloco = self._enriquecer_bloco(bloco, referencias, verboso=False)
+                    self._classificar_bloco(bloco)
+                    for usi, quantidade in bloco['USI'].value_counts(sort=False).items():
+                        usis[usi] = usis.get(usi, 0) + int(quantidade)
+                    escritor.escrever(bloco)
+                    del bloco
+                print(f"Enriquecido: {os.path.basename(fonte)} ({escritor.registros:,} registros até aqui)")
+                self._emitir(EVENTO_PROGRESSO, i / len(self.fontes),
+                             f"Fonte {i}/{len(self.fontes)} enriquecida", registros=escritor.registros)
+        finally:
+            escritor.fechar()
+
+        self.fontes = [escritor.pasta]
+        self.usis_por_registros = usis
+        self.resultado["registros_lidos"] = int(lidos)
+        print(f"{lidos:,} registros lidos, {escritor.registros:,} enriquecidos em {escritor.partes} parte(s)")
+
+    def _normalizar_tipos(self, df_total: pd.DataFrame, verboso: bool = True) -> pd.DataFrame:
+        """Limpar e converter tipos de dados antes de salvar parquet"""
+        modo_arrow = self.parametros.modo_arrow
+        if verboso:
+            print("Limpando e convertendo tipos de dados...")
+
+        # Converter coluna Ano e Período para numérico
+        for col in ['Ano', 'Período']:
+            if col in df_total.columns:
+                df_total[col] = pd.to_numeric(df_total[col], errors='coerce')
+
+        # Converter colunas numéricas que podem estar como string
+        numeric_columns = ['Valor', 'Qtd.', 'doc.ref', 'Item']
+        for col in numeric_columns:
+            if col in df_total.columns:
+                df_total[col] = pd.to_numeric(df_total[col], errors='coerce')
+
+        # Garantir que colunas de texto sejam strings
+        if modo_arrow:
+            # string[pyarrow] direto: nulos continuam nulos, sem cópias object do DataFrame inteiro
+            df_total = normalizar_texto_arrow(df_total, COLUNAS_TEXTO)
+        else:
+            for col in COLUNAS_TEXTO:
+                if col in df_total.columns:
+                    df_total[col] = df_total[col].astype(str)
+
+            # Garantir que TODAS as colunas object sejam strings (fallback)
+            for col in df_total.columns:
+                if df_total[col].dtype == 'object':
+                    df_total[col] = df_total[col].astype(str)
+
+            # Substituir valores NaN por None para compatibilidade com PyArrow
+            df_total = df_total.where(pd.notnull(df_total), None)
+
+        # Converter coluna Dt.lçto. para formato DD/MM/AAAA
+        if 'Dt.lçto.' in df_total.columns:
+            if verboso:
+                print("Convertendo coluna Dt.lçto. para formato DD/MM/AAAA...")
+            df_total['Dt.lçto.'] = como_texto(df_total['Dt.lçto.'], modo_arrow)
+            df_total['Dt.lçto.'] = df_total['Dt.lçto.'].str.replace('.', '/', regex=False)
+            if verboso:
+                print(f"Coluna Dt.lçto. convertida: {df_total['Dt.lçto.'].head(3).tolist()}")
+
+        if verboso:
+            print("Tipos de dados após limpeza:")
+            print(df_total.dtypes)
+        return df_total
+
+    # ------------------------------------------------------------------ etapa 3: classificar
+    def classificar(self):
+        """Lançamentos sem Type 05/06/07 ficam como 'Others' (USI já vem como 'Others' do merge de CC).
+
+        Na extração em blocos a classificação já foi feita bloco a bloco no enriquecimento;
+        aqui só as contagens são registradas.
+        """
+        inicio = self._iniciar_etapa('classificar')
+        if self.fontes is None:
+            df_total = self.df_total
+            self._classificar_bloco(df_total)
+            registros = int(len(df_total))
+            registros_others = int((df_total['USI'] == 'Others').sum())
+        else:
+            registros = sum(self.usis_por_registros.values())
+            registros_others = self.usis_por_registros.get('Others', 0)
+
+        self.resultado["registros"] = registros
+        self.resultado["registros_others"] = registros_others
+        print(f"Registros classificados: {registros:,} ({registros_others:,} com USI Others)")
+        self._finalizar_etapa('classificar', inicio)
+
+    @staticmethod
+    def _classificar_bloco(df_total: pd.DataFrame):
+        # Colocar as colunas Type 07, Type 06, Type 05 que forem vazias ou nulas como Others
+        df_total['Type 07'] = df_total['Type 07'].fillna('Others')
+        df_total['Type 06'] = df_total['Type 06'].fillna('Others')
+        df_total['Type 05'] = df_total['Type 05'].fillna('Others')
+
+    # ------------------------------------------------------------------ etapa 4: gravar
+    def gravar(self):
+        """Dataset particionado (KE5Z/), amostra KE5Z.xlsx e arquivos por USI (arquivos/)"""
+        inicio = self._iniciar_etapa('gravar')
+        p = self.parametros
+        df_total = self.df_total
+
+        # gerar o dataset parquet do df_total atualizado
+        pasta_parquet = p.pasta_saida_ke5z
+        os.makedirs(pasta_parquet, exist_ok=True)
+        print(f"Pasta parquet criada: {pasta_parquet}")
+
+        # Dataset único particionado por grupo de USI (main/others) e Período: substitui os arquivos
+        # KE5Z, KE5Z_main, KE5Z_others e KE5Z_waterfall (as páginas leem as visões via dataset_ke5z)
+        print("\n=== GRAVANDO DATASET PARTICIONADO (USI x PERÍODO) ===")
+        if self.fontes is None:
+            esquema_dataset = gravar_dataset(df_total, pasta_parquet, arrow_ipc=p.arrow_ipc)
+        else:
+            # Extração em blocos: cada bloco enriquecido vira row groups do dataset
+            esquema_dataset = gravar_dataset_em_blocos(self._blocos(), pasta_parquet, arrow_ipc=p.arrow_ipc)
+        print(f"Dataset salvo: {caminho_dataset(pasta_parquet)}")
+        if esquema_dataset.get("ipc"):
+            print(f"Cópia Arrow IPC (memory map): {caminho_ipc(pasta_parquet, esquema_dataset['ipc'])}")
+        print(f"Total de registros: {esquema_dataset['registros']:,}")
+        print(f"Registros principais (sem Others): {esquema_dataset['registros_por_grupo']['main']:,}")
+        print(f"Registros Others: {esquema_dataset['registros_por_grupo']['others']:,}")
+        print(f"Tamanho em disco: {tamanho_dataset_mb(pasta_parquet):.1f} MB")
+        self.resultado["arquivos"].append(caminho_dataset(pasta_parquet))
+        self._emitir(EVENTO_PROGRESSO, 0.25, "Dataset gravado", registros=esquema_dataset['registros'])
+
+        # Arquivos antigos só sob demanda (ETL_SAIDAS_LEGADAS=1), para instalações que ainda os usam
+        if p.saidas_legadas:
+            print("Gravando também os arquivos parquet antigos (ETL_SAIDAS_LEGADAS=1)...")
+            if self.fontes is None:
+                eh_others = df_total['USI'] == 'Others'
+                df_total[~eh_others].to_parquet(os.path.join(pasta_parquet, 'KE5Z_main.parquet'), index=False)
+                if eh_others.any():
+                    df_total[eh_others].to_parquet(os.path.join(pasta_parquet, 'KE5Z_others.parquet'), index=False)
+                df_total.to_parquet(os.path.join(pasta_parquet, 'KE5Z.parquet'), index=False)
+                ler_visao(pasta_parquet, 'waterfall').to_parquet(
+                    os.path.join(pasta_parquet, 'KE5Z_waterfall.parquet'), index=False
+                )
+            else:
+                self._gravar_legados_em_blocos(pasta_parquet)
+
+        # gerar um arquivo Excel do df_total atualizado com 10k linhas
+        caminho_saida_excel = os.path.join(pasta_parquet, 'KE5Z.xlsx')
+        amostra = df_total.head(10000) if self.fontes is None else self._amostra(10000)
+        amostra.to_excel(caminho_saida_excel, index=False)
+        del amostra
+        print(f"Arquivo Excel salvo: {caminho_saida_excel}")
+        self.resultado["arquivos"].append(caminho_saida_excel)
+        self._emitir(EVENTO_PROGRESSO, 0.35, "Amostra KE5Z.xlsx gravada")
+
+        if self.fontes is None:
+            df_total_excel = self._preparar_excel(df_total)
+            self.df_total = None
+            self._exportar_por_usi(df_total_excel)
+        else:
+            self._exportar_por_usi_em_blocos()
+            self._limpar_temporarios()
+            self.fontes = None
+        self._finalizar_etapa('gravar', inicio)
+
+    def _blocos(self) -> Iterator[pd.DataFrame]:
+        """Blocos enriquecidos da extração em blocos, na ordem dos arquivos"""
+        for fonte in self.fontes:
+            yield from ler_blocos(fonte, self.parametros.modo_arrow, linhas_por_bloco_configuradas())
+
+    def _amostra(self, linhas: int) -> pd.DataFrame:
+        partes, total = [], 0
+        for bloco in self._blocos():
+            partes.append(bloco.head(linhas - total))
+            total += len(partes[-1])
+            if total >= linhas:
+                break
+        return pd.concat(partes, ignore_index=True)
+
+    def _gravar_legados_em_blocos(self, pasta_parquet: str):
+        """KE5Z, KE5Z_main, KE5Z_others e KE5Z_waterfall.parquet gravados bloco a bloco"""
+        schema = schema_comum(self.fontes)
+        colunas_waterfall = [c for c in COLUNAS_WATERFALL if c in schema.names]
+        escritores: Dict[str, pq.ParquetWriter] = {}
+        try:
+            for fonte in self.fontes:
+                for tabela in ler_lotes(fonte, linhas_por_bloco_configuradas(), schema):
+                    eh_others = pc.fill_null(pc.equal(tabela.column('USI'), 'Others'), False)
+                    waterfall = tabela.select(colunas_waterfall)
+                    saidas = {
+                        'KE5Z.parquet': tabela,
+                        'KE5Z_main.parquet': tabela.filter(pc.invert(eh_others)),
+                        'KE5Z_others.parquet': tabela.filter(eh_others),
+                        'KE5Z_waterfall.parquet': waterfall.filter(
+                            pc.and_(pc.is_valid(waterfall.column('Período')), pc.is_valid(waterfall.column('Valor')))),
+                    }
+                    for nome, parte in saidas.items():
+                        if nome not in escritores:
+                            # KE5Z_others.parquet só existe quando há Others (como na extração em memória)
+                            if nome == 'KE5Z_others.parquet' and len(parte) == 0:
+                                continue
+                            escritores[nome] = pq.ParquetWriter(os.path.join(pasta_parquet, nome), parte.schema)
+                        escritores[nome].write_table(parte)
+        finally:
+            for escritor in escritores.values():
+                escritor.close()
+
+    def _preparar_excel(self, df_total: pd.DataFrame, verboso: bool = True) -> pd.DataFrame:
+        """Layout dos arquivos por USI (colunas renomeadas, Mes + nome do mês) e filtro de meses"""
+        # organizar a ordem das colunas e mudar os nomes (Nºconta, Centrocst, Nºdoc.ref., QTD, Texto breve, Account, Mes)
+        df_total = df_total[COLUNAS_EXCEL].rename(columns=RENOMEAR_EXCEL)
+
+        # Criar uma coluna com os meses minúsculos baseados na coluna 'Mes' (1 = janeiro, 2 = fevereiro...)
+        df_total['Período'] = df_total['Mes'].apply(lambda x: NOMES_MESES.get(x, 'dezembro'))
+
+        # Trazer coluna 'Mes' para a primeira posição e a coluna 'Período' para a segunda posição do DataFrame
+        colunas = ['Mes', 'Período'] + [col for col in df_total.columns if col != 'Mes' and col != 'Período']
+        df_total = df_total[colunas]
+
+        # Filtro de meses (parâmetro meses / MESES_FILTRO)
+        meses_filtrados = self.parametros.meses
+        if meses_filtrados and 'Mes' in df_total.columns:
+            df_total_excel = df_total[df_total['Mes'].isin(meses_filtrados)].copy()
+            if verboso:
+                print(f"Aplicando filtro de meses: {meses_filtrados}")
+                print(f"Filtro aplicado: {len(df_total_excel):,} linhas após filtrar meses {meses_filtrados}")
+        else:
+            df_total_excel = df_total.copy()
+            if verboso:
+                print(f"Sem filtro aplicado: {len(df_total_excel):,} linhas totais")
+        return df_total_excel
+
+    def _exportar_por_usi(self, df_total_excel: pd.DataFrame):
+        p = self.parametros
+        # Criar pasta 'arquivos' local para salvar os arquivos por USI
+        os.makedirs(p.pasta_arquivos, exist_ok=True)
+        print(f"Pasta de arquivos criada: {p.pasta_arquivos}")
+        print(f"Arquivo Excel completo NÃO salvo (dados muito grandes: {len(df_total_excel):,} linhas > limite Excel 1.048.576)")
+
+        # Verificar quais USIs existem nos dados
+        usis_disponiveis = df_total_excel['USI'].unique() if 'USI' in df_total_excel.columns else []
+        print(f"USIs disponíveis nos dados: {list(usis_disponiveis)}")
+
+        # Arquivos por USI: 'Veículos', 'TC Ext' e 'LC' juntos, PWT e um arquivo por USI restante.
+        # Gravados em paralelo (ETL_WORKERS) nos formatos pedidos (xlsx, csv ou parquet)
+        tarefas = planejar_exportacoes(df_total_excel, USIS_VEICULOS)
+        total = max(1, len(tarefas) * len(p.formatos))
+        concluidos = []
+
+        def ao_concluir(resumo: Dict[str, Any]):
+            concluidos.append(resumo)
+            self._emitir(EVENTO_PROGRESSO, 0.4 + 0.6 * len(concluidos) / total,
+                         f"Arquivo {os.path.basename(resumo['caminho'])} gravado", **resumo)
+
+        self._registrar_exportacoes(exportar_arquivos(tarefas, p.pasta_arquivos, p.formatos, ao_concluir))
+
+    def _exportar_por_usi_em_blocos(self):
+        """Arquivos por USI da extração em blocos: cada arquivo é gravado numa passada pelas
+        partes enriquecidas, lidas só com as colunas do layout, as USIs do grupo e os meses pedidos"""
+        p = self.parametros
+        os.makedirs(p.pasta_arquivos, exist_ok=True)
+        print(f"Pasta de arquivos criada: {p.pasta_arquivos}")
+
+        usis_disponiveis = list(self.usis_por_registros)
+        print(f"USIs disponíveis nos dados: {usis_disponiveis}")
+        filtro_meses = {'Período': p.meses} if p.meses else {}
+        grupos = []
+        for rotulo, nome, usis in grupos_exportacao(usis_disponiveis, USIS_VEICULOS):
+            filtros = {'USI': usis, **filtro_meses}
+            linhas = contar_selecao(self.fontes[0], filtros)
+            if linhas > 0:
+                grupos.append((rotulo, nome, filtros, linhas))
+        print(f"Arquivos por USI: {sum(g[3] for g in grupos):,} linhas em {len(grupos)} arquivo(s)"
+              + (f" (meses {p.meses})" if p.meses else ""))
+        total = max(1, len(grupos) * len(p.formatos))
+        concluidos = []
+
+        def ao_concluir(resumo: Dict[str, Any]):
+            concluidos.append(resumo)
+            self._emitir(EVENTO_PROGRESSO, 0.4 + 0.6 * len(concluidos) / total,
+                         f"Arquivo {os.path.basename(resumo['caminho'])} gravado", **resumo)
+
+        for rotulo, nome, filtros, linhas in grupos:
+            blocos = (self._preparar_excel(bloco, verboso=False) for bloco in ler_selecao_em_blocos(
+                self.fontes[0], p.modo_arrow, COLUNAS_EXCEL, filtros, linhas_por_bloco_configuradas()))
+            self._registrar_exportacoes(exportar_em_blocos(rotulo, nome, blocos, p.pasta_arquivos, p.formatos,
+                                                           total=linhas, ao_concluir=ao_concluir))
+
+    def _registrar_exportacoes(self, resultados: List[Dict[str, Any]]):
+        erros = [r for r in resultados if 'erro' in r]
+        if erros:
+            print(f"⚠️  {len(erros)} arquivo(s) não foram salvos: {[os.path.basename(r['caminho']) for r in erros]}")
+            self.resultado["erros"].extend(f"{os.path.basename(r['caminho'])}: {r['erro']}" for r in erros)
+        self.resultado["arquivos"].extend(r['caminho'] for r in resultados if 'erro' not in r)
+
+
+def executar_extracao(parametros: Optional[ParametrosExtracao] = None,
+                      ao_progredir: Optional[Callable[[EventoProgresso], None]] = None,
+                      capturar_saida: bool = False) -> Dict[str, Any]:
+    """Atalho: PipelineKE5Z(parametros, ao_progredir).executar(capturar_saida)"""
+    return PipelineKE5Z(parametros, ao_progredir).executar(capturar_saida=capturar_saida)
@@ -43,6 +43,8 @@ def main() -> None:
         # Evitar abertura do navegador externo pelo Streamlit
         os.environ.setdefault("BROWSER", "none")
         os.environ.setdefault("STREAMLIT_BROWSER_GATHERUSAGESTATS", "false")
+        # Extração grava a cópia Arrow IPC; as páginas abrem com memory map (notebooks com pouca RAM)
+        os.environ.setdefault("ETL_ARROW_IPC", "1")
 
         cmd = [
             sys.executable,
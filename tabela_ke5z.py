@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tabela paginada dos grids "Tabela Filtrada" (app.py) e "Dados Completos" (Dash Mês)
+Só a página pedida (~100 linhas) é enviada ao navegador, mas dá para navegar por todos os
+registros filtrados. Busca e ordenação rodam sobre o DataFrame em memória (códigos das
+colunas, os mesmos índices dos filtros) e as posições resultantes ficam memoizadas no GRAFO
+pela impressão digital dos filtros: trocar de página é só um iloc.
+"""
+
+import math
+from typing import Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from calculos_ke5z import GRAFO
+from filtros_ke5z import indice_coluna
+
+TAMANHOS_PAGINA = [50, 100, 250, 500]
+SEM_ORDENACAO = "(ordem original)"
+
+
+def ordem_linhas(df: pd.DataFrame, coluna: str, crescente: bool = True) -> np.ndarray:
+    """Posições das linhas ordenadas pela coluna (ordenação estável, nulos no fim)"""
+    serie = df[coluna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Ordem alfabética das categorias (a ordem interna da category pode ser outra)
+        rotulos = serie.cat.categories.astype(str)
+        ranking = np.full(len(rotulos) + 1, np.nan)
+        ranking[np.argsort(rotulos, kind='stable')] = np.arange(len(rotulos))
+        chave = pd.Series(ranking[serie.cat.codes.to_numpy()])
+    else:
+        chave = pd.Series(serie.to_numpy())
+    try:
+        ordenada = chave.sort_values(ascending=crescente, kind='stable', na_position='last')
+    except TypeError:
+        # Tipos misturados na coluna: ordena pelo texto
+        ordenada = chave.astype(str).sort_values(ascending=crescente, kind='stable')
+    return ordenada.index.to_numpy()
+
+
+def linhas_com_texto(df: pd.DataFrame, texto: str, versao: Optional[Hashable] = None,
+                     colunas: Optional[List[str]] = None) -> np.ndarray:
+    """Máscara das linhas em que alguma coluna contém o texto (sem diferenciar maiúsculas)"""
+    mascara = np.zeros(len(df), dtype=bool)
+    for coluna in colunas or list(df.columns):
+        mascara |= indice_coluna(df, coluna, versao).com_texto(texto)
+    return mascara
+
+
+def posicoes_visiveis(df: pd.DataFrame, versao: Optional[Hashable], busca: str = "",
+                      ordenar_por: Optional[str] = None, crescente: bool = True) -> Optional[np.ndarray]:
+    """Posições (busca + ordenação) a paginar; None = todas as linhas na ordem original"""
+    busca = busca.strip()
+    if not busca and not ordenar_por:
+        return None
+
+    def calcular():
+        posicoes = ordem_linhas(df, ordenar_por, crescente) if ordenar_por else np.arange(len(df))
+        if busca:
+            posicoes = posicoes[linhas_com_texto(df, busca, versao)[posicoes]]
+        return posicoes.astype(np.int32) if len(df) < 2 ** 31 else posicoes
+
+    entradas = None if versao is None else (versao, busca.lower(), ordenar_por, crescente)
+    return GRAFO.no("tabela_posicoes", entradas, calcular)
+
+
+def fatia_pagina(df: pd.DataFrame, posicoes: Optional[np.ndarray], pagina: int, tamanho: int) -> pd.DataFrame:
+    """Linhas da página (1 = primeira)"""
+    inicio = (pagina - 1) * tamanho
+    if posicoes is None:
+        return df.iloc[inicio:inicio + tamanho]
+    return df.iloc[posicoes[inicio:inicio + tamanho]]
+
+
+def exibir_tabela_paginada(df: pd.DataFrame, versao: Optional[Hashable], chave: str,
+                           tamanho_padrao: int = 100):
+    """Busca, ordenação e página atual; só a fatia da página vai para o st.dataframe"""
+    col_busca, col_ordem, col_sentido, col_tamanho = st.columns([3, 2, 1, 1])
+    with col_busca:
+        busca = st.text_input("🔎 Buscar em todas as colunas:", key=f"{chave}_busca")
+    with col_ordem:
+        ordenar_por = st.selectbox("Ordenar por:", [SEM_ORDENACAO] + list(df.columns), key=f"{chave}_ordem")
+    with col_sentido:
+        sentido = st.selectbox("Sentido:", ["Crescente", "Decrescente"], key=f"{chave}_sentido")
+    with col_tamanho:
+        tamanho = st.selectbox("Linhas por página:", TAMANHOS_PAGINA,
+                               index=TAMANHOS_PAGINA.index(tamanho_padrao), key=f"{chave}_tamanho")
+
+    ordenar_por = None if ordenar_por == SEM_ORDENACAO else ordenar_por
+    posicoes = posicoes_visiveis(df, versao, busca, ordenar_por, sentido == "Crescente")
+    total = len(df) if posicoes is None else len(posicoes)
+    paginas = max(1, math.ceil(total / tamanho))
+
+    # Nova busca/ordenação/filtro volta para a primeira página; nunca passa da última
+    chave_pagina = f"{chave}_pagina"
+    assinatura = (versao, busca, ordenar_por, sentido, tamanho, total)
+    if st.session_state.get(f"{chave}_assinatura") != assinatura:
+        st.session_state[f"{chave}_assinatura"] = assinatura
+        st.session_state[chave_pagina] = 1
+    st.session_state[chave_pagina] = min(st.session_state.get(chave_pagina, 1), paginas)
+    pagina = st.number_input(f"Página (de {paginas:,}):", min_value=1, max_value=paginas,
+                             step=1, key=chave_pagina)
+
+    st.dataframe(fatia_pagina(df, posicoes, pagina, tamanho), use_container_width=True)
+    inicio = (pagina - 1) * tamanho
+    if total:
+        st.caption(f"📊 Linhas {inicio + 1:,}–{min(inicio + tamanho, total):,} de {total:,} registros")
+    else:
+        st.caption("📊 Nenhum registro encontrado")
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Os módulos do projeto ficam na raiz (importados como no app.py e no Extracao.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Conversão de números no formato SAP/brasileiro (numeros_br.converter_numero_br)"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from numeros_br import converter_numero_br
+
+
+def _referencia(textos):
+    """Conversão antiga, por valor: remove '.', troca ',' por '.' e float()"""
+    return np.array([float(t.replace('.', '').replace(',', '.')) for t in textos])
+
+
+def test_milhares_e_decimais():
+    assert converter_numero_br(["1.234,56"]).tolist() == [1234.56]
+    assert converter_numero_br(["1.234.567,89"]).tolist() == [1234567.89]
+
+
+def test_sinal_na_frente_e_no_fim():
+    assert converter_numero_br(["-82,02", "82,02-", "+5"]).tolist() == [-82.02, -82.02, 5.0]
+
+
+def test_vazio_e_nulo_viram_nan_ou_valor_padrao():
+    assert np.isnan(converter_numero_br(["", None, "  "])).all()
+    assert converter_numero_br(["", "1,5"], valor_padrao=0.0).tolist() == [0.0, 1.5]
+
+
+def test_linha_fora_do_padrao_usa_a_conversao_antiga():
+    # "1e3" e dígitos demais não passam no caminho por bytes; o to_numeric resolve
+    resultado = converter_numero_br(["1e3", "12345678901234567890", "1,2,3", "abc", "8-2"])
+    assert resultado[0] == 1000.0
+    assert resultado[1] == 12345678901234567890.0
+    assert np.isnan(resultado[2:]).all()
+
+
+def test_igual_a_conversao_por_valor_numa_amostra():
+    gerador = np.random.default_rng(7)
+    valores = np.round(gerador.uniform(-1e9, 1e9, 2000), 2)
+    textos = [f"{v:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.') for v in valores]
+    textos += ["0,00", "0,1", "7", "1.000", "-0,01"]
+    np.testing.assert_array_equal(converter_numero_br(textos), _referencia(textos))
+
+
+def test_tipos_de_entrada_e_indice():
+    serie = pd.Series(["1.234,56", "82,02-"], index=[10, 20], name="Valor")
+    resultado = converter_numero_br(serie)
+    assert resultado.index.tolist() == [10, 20] and resultado.name == "Valor"
+    assert resultado.tolist() == [1234.56, -82.02]
+    assert converter_numero_br(serie.astype("string[pyarrow]")).tolist() == [1234.56, -82.02]
+    arrow = pa.chunked_array([["1,5"], [b"2,5".decode(), None]])
+    np.testing.assert_array_equal(converter_numero_br(arrow), [1.5, 2.5, np.nan])
+    assert converter_numero_br([b"3,25", b"10-"]).tolist() == [3.25, -10.0]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Ordem dos meses usada nos seletores e na ponte mês a mês do waterfall"""
+
+import pandas as pd
+
+from waterfall_ke5z import ordenar_meses
+
+
+def test_periodos_float_em_texto_saem_em_ordem_cronologica():
+    # Páginas fazem astype(str) de um Período float: "7.0", "10.0"
+    assert ordenar_meses(["10.0", "7.0", "8.0", "9.0"]) == ["7.0", "8.0", "9.0", "10.0"]
+    assert ordenar_meses(["8.0", "7.0", "10.0", "9.0"]) == ["7.0", "8.0", "9.0", "10.0"]
+
+
+def test_periodos_numericos_ordenam_por_valor_e_sem_nulos():
+    assert ordenar_meses(["12", "2", "2"]) == ["2", "12"]
+    assert ordenar_meses(pd.Series([10.0, None, 7.0])) == [7.0, 10.0]
+
+
+def test_nomes_dos_meses_em_portugues():
+    assert ordenar_meses(["Março", "janeiro", "dezembro"]) == ["janeiro", "Março", "dezembro"]
+
+
+def test_vazio():
+    assert ordenar_meses([]) == []
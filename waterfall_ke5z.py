@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Cálculo dos gráficos waterfall (Waterfall Analysis e aba Waterfall do IUD Assistant)
+Um único groupby (categoria, mês) vira a matriz categoria x mês; variações, Top N por
+impacto absoluto e o resto "Outros" saem de operações sobre as colunas dessa matriz, em
+vez de um filtro astype(str) == mês por mês e laços Python sobre as categorias.
+
+Mesmas regras das páginas: categorias em texto sem espaços nas pontas, variações menores
+que TOLERANCIA_DELTA são omitidas, Top N pelo maior |variação| (empates na ordem alfabética)
+e "Outros" só aparece se houver corte ou seleção parcial e o resto for de ao menos 1 centavo.
+A sequência de meses pode ter mais de dois meses (ponte mês a mês).
+
+Com a versão dos dados filtrados (CascataFiltros.versao_resultado), matrizes_em_cache guarda
+no GRAFO o cubo (todas as dimensões x mês) e a matriz de cada dimensão: trocar o Top N, as
+categorias, os meses ou a dimensão não volta às linhas originais.
+"""
+
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calculos_ke5z import GRAFO
+
+ROTULO_OUTROS = "Outros"
+ROTULO_TOTAL = "Total"
+TOLERANCIA_DELTA = 1e-9
+MINIMO_OUTROS = 0.01
+MESES_PT = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho", "agosto",
+            "setembro", "outubro", "novembro", "dezembro"]
+POSICAO_MES = {mes: i + 1 for i, mes in enumerate(MESES_PT)}
+
+
+def ordenar_meses(valores) -> List:
+    """Valores únicos não nulos em ordem cronológica (números ou nomes dos meses em português)"""
+    unicos = list(pd.Series(valores).dropna().unique())
+    # Períodos em texto vindos de colunas float ("7.0", "10.0") também são números
+    numeros = pd.to_numeric(pd.Series(unicos, dtype=object), errors='coerce').tolist()
+    if unicos and not any(pd.isna(numeros)):
+        return [valor for _, valor in sorted(zip(numeros, unicos), key=lambda par: par[0])]
+    return sorted(unicos, key=lambda x: POSICAO_MES.get(str(x).strip().lower(), 99))
+
+
+def cubo_waterfall(df: pd.DataFrame, dimensoes: Sequence[str], col_mes: str = 'Período',
+                   col_valor: str = 'Valor') -> pd.DataFrame:
+    """Soma do valor por (todas as dimensões, mês): a matriz de qualquer dimensão sai daqui"""
+    return (df.groupby(list(dimensoes) + [col_mes], observed=True, dropna=False)[col_valor]
+            .sum().reset_index())
+
+
+def matriz_mes_categoria(df: pd.DataFrame, dimensao: str, col_mes: str = 'Período',
+                         col_valor: str = 'Valor') -> Tuple[pd.DataFrame, pd.Series]:
+    """(matriz, totais): soma do valor por categoria x mês e o total de cada mês.
+
+    Meses e categorias viram texto; NaN na matriz = categoria sem lançamentos no mês.
+    Os totais incluem as linhas sem categoria (nulas ou vazias), que ficam fora da matriz.
+    """
+    soma = df.groupby([dimensao, col_mes], observed=True, dropna=False)[col_valor].sum()
+    tabela = soma.unstack(col_mes)
+    tabela.columns = [str(mes) for mes in tabela.columns]
+    totais = tabela.sum(axis=0)
+
+    rotulos = pd.Series([None if pd.isna(v) else str(v).strip() for v in tabela.index], index=tabela.index)
+    validas = rotulos.notna() & (rotulos != "")
+    # min_count=1: continua NaN quando nenhuma das categorias unidas pelo strip tem lançamentos no mês
+    matriz = tabela[validas.to_numpy()].groupby(rotulos[validas].to_numpy()).sum(min_count=1)
+    return matriz, totais
+
+
+def matrizes_em_cache(df: pd.DataFrame, versao: Optional[Hashable], dimensoes: Sequence[str],
+                      dimensao: str, col_mes: str = 'Período',
+                      col_valor: str = 'Valor') -> Tuple[pd.DataFrame, pd.Series]:
+    """matriz_mes_categoria da `dimensao`, calculada sobre o cubo das `dimensoes` (nós do GRAFO).
+
+    A primeira dimensão pedida agrega as linhas uma vez; as demais só reagrupam o cubo.
+    `versao` None = sem cache (agrega as linhas direto).
+    """
+    if versao is None:
+        return matriz_mes_categoria(df, dimensao, col_mes, col_valor)
+    chave_cubo = (versao, tuple(dimensoes), col_mes, col_valor)
+
+    def calcular():
+        cubo = GRAFO.no("waterfall_cubo", chave_cubo, lambda: cubo_waterfall(df, dimensoes, col_mes, col_valor))
+        return matriz_mes_categoria(cubo, dimensao, col_mes, col_valor)
+
+    return GRAFO.no("waterfall_matriz", chave_cubo + (dimensao,), calcular)
+
+
+def volume_mes(matriz: pd.DataFrame, mes: str) -> pd.Series:
+    """Soma por categoria no mês (só as que têm lançamentos), maior primeiro"""
+    if mes not in matriz.columns:
+        return pd.Series(dtype=float)
+    return matriz[mes].dropna().sort_values(ascending=False)
+
+
+def etapas_waterfall(matriz: pd.DataFrame, totais: pd.Series, meses: Sequence[str],
+                     categorias: Optional[Sequence[str]] = None,
+                     top_n: Optional[int] = None) -> pd.DataFrame:
+    """Barras do waterfall de meses[0] até meses[-1], passando por cada mês intermediário.
+
+    Uma linha por barra, na ordem do gráfico: rotulo, valor, medida (absolute/relative/total
+    do go.Waterfall), etapa ("mês anterior → mês"; vazio nas barras de total), base (início
+    da barra no eixo, para sobrepor "Outros") e outros (True na barra de resto).
+    """
+    meses = [str(mes) for mes in meses]
+    todas = categorias is None or set(matriz.index) <= {str(c) for c in categorias}
+    if categorias is not None:
+        matriz = matriz[matriz.index.isin([str(c) for c in categorias])]
+    valores = matriz.reindex(columns=meses).fillna(0.0)
+    totais = totais.reindex(meses).fillna(0.0)
+    nomes_todos = valores.index.to_numpy(dtype=object)
+
+    colunas = ['rotulo', 'valor', 'medida', 'etapa', 'base', 'outros']
+    partes = [pd.DataFrame([[f"Mês {meses[0]}", float(totais.iloc[0]), "absolute", "", 0.0, False]], columns=colunas)]
+    acumulado = float(totais.iloc[0])
+    for anterior, atual in zip(meses, meses[1:]):
+        deltas = (valores[atual] - valores[anterior]).to_numpy()
+        manter = np.abs(deltas) > TOLERANCIA_DELTA
+        deltas, nomes = deltas[manter], nomes_todos[manter]
+        cortado = top_n is not None and len(deltas) > top_n
+        if cortado:
+            # Maior impacto absoluto primeiro; argsort estável mantém a ordem alfabética nos empates
+            ordem = np.argsort(-np.abs(deltas), kind='stable')[:top_n]
+            deltas, nomes = deltas[ordem], nomes[ordem]
+
+        variacao = float(totais[atual]) - float(totais[anterior])
+        resto = round(variacao - float(deltas.sum()), 2)
+        com_outros = abs(resto) >= MINIMO_OUTROS and (cortado or not todas)
+        if com_outros:
+            deltas = np.append(deltas, resto)
+            nomes = np.append(nomes, ROTULO_OUTROS)
+
+        if len(deltas):
+            # Início de cada barra relativa no eixo: acumulado antes dela (ou depois, se negativa)
+            antes = acumulado + np.cumsum(deltas) - deltas
+            marca_outros = np.zeros(len(deltas), dtype=bool)
+            marca_outros[-1] = com_outros
+            partes.append(pd.DataFrame({'rotulo': nomes, 'valor': deltas, 'medida': "relative",
+                                        'etapa': f"{anterior} → {atual}", 'base': antes + np.minimum(deltas, 0.0),
+                                        'outros': marca_outros}, columns=colunas))
+            acumulado += float(deltas.sum())
+        partes.append(pd.DataFrame([[f"Mês {atual}", float(totais[atual]), "total", "", 0.0, False]], columns=colunas))
+
+    return pd.concat(partes, ignore_index=True)
+
+
+def variacoes_por_etapa(matriz: pd.DataFrame, meses: Sequence[str],
+                        categorias: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Categoria x etapa ("mês anterior → mês") com a variação, mais a coluna Total;
+    maior impacto absoluto acumulado primeiro"""
+    meses = [str(mes) for mes in meses]
+    if categorias is not None:
+        matriz = matriz[matriz.index.isin([str(c) for c in categorias])]
+    valores = matriz.reindex(columns=meses).fillna(0.0).to_numpy()
+    deltas = pd.DataFrame(np.diff(valores, axis=1), index=matriz.index,
+                          columns=[f"{anterior} → {atual}" for anterior, atual in zip(meses, meses[1:])])
+    impacto = deltas.abs().sum(axis=1).to_numpy()
+    deltas[ROTULO_TOTAL] = deltas.sum(axis=1)
+    manter = impacto > TOLERANCIA_DELTA
+    return deltas[manter].iloc[np.argsort(-impacto[manter], kind='stable')]
+
+
+def eixo_x(barras: pd.DataFrame, ponte: bool = False) -> list:
+    """x do go.Waterfall: os rótulos; na ponte, [etapa, rótulo] (eixo multicategoria), já que a
+    mesma categoria se repete em várias etapas"""
+    if not ponte:
+        return barras['rotulo'].tolist()
+    relativas = barras['medida'] == "relative"
+    grupos = barras['etapa'].where(relativas, barras['rotulo'])
+    return [grupos.tolist(), barras['rotulo'].where(relativas, ROTULO_TOTAL).tolist()]